@@ -0,0 +1,80 @@
+"""
+Compares the blocked cosine clustering in shared.clustering with the
+previous sklearn DBSCAN(metric="cosine") path on synthetic issue embeddings:
+wall time, peak traced memory and label agreement (adjusted Rand index).
+
+DBSCAN is skipped above --dbscan-max issues, where it takes minutes and
+several GB of memory. Requires scikit-learn for the comparison.
+
+Usage:
+    python benchmarks/bench_clustering.py --sizes 1000 10000 50000 --dim 1536
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from shared.clustering import cluster_embeddings  # noqa: E402
+
+
+def synthetic_issues(num_issues, dim, seed=13):
+    """
+    Issue summary embeddings: about one topic per 8 issues, each issue a
+    noisy copy of its topic, plus 10% unrelated one-off issues.
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(1, num_issues // 8), dim)).astype(np.float32)
+    embeddings = topics[rng.integers(0, len(topics), num_issues)]
+    embeddings += 0.45 * rng.standard_normal((num_issues, dim)).astype(np.float32)
+    one_off = rng.random(num_issues) < 0.1
+    embeddings[one_off] = rng.standard_normal((one_off.sum(), dim)).astype(np.float32)
+    return embeddings
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    labels = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return labels, seconds, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--eps", type=float, default=0.25)
+    parser.add_argument("--min-samples", type=int, default=2)
+    parser.add_argument("--dbscan-max", type=int, default=10000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        embeddings = synthetic_issues(size, args.dim)
+        labels, seconds, peak_mb = measure(lambda: cluster_embeddings(embeddings, args.eps, args.min_samples))
+        line = (f"n={size:>6} blocked: {seconds:7.2f}s peak={peak_mb:8.1f}MB "
+                f"clusters={labels.max() + 1} noise={(labels == -1).sum()}")
+
+        if size <= args.dbscan_max:
+            from sklearn.cluster import DBSCAN
+            from sklearn.metrics import adjusted_rand_score
+
+            # The old handler passed the embeddings as Python lists.
+            as_lists = embeddings.tolist()
+            dbscan_labels, dbscan_seconds, dbscan_peak_mb = measure(
+                lambda: DBSCAN(eps=args.eps, min_samples=args.min_samples, metric="cosine").fit(as_lists).labels_)
+            line += (f" | dbscan: {dbscan_seconds:7.2f}s peak={dbscan_peak_mb:8.1f}MB "
+                     f"ARI={adjusted_rand_score(dbscan_labels, labels):.4f}")
+        else:
+            line += " | dbscan: skipped"
+        print(line, flush=True)
+
+
+if __name__ == "__main__":
+    main()
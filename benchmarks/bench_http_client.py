@@ -0,0 +1,118 @@
+"""
+Exercises the shared rate-limited HTTP client against a local stub that
+enforces a Discord-style bucket and answers 429s when it is exceeded.
+
+Usage:
+    python benchmarks/bench_http_client.py --requests 200 --limit 10 --window 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from shared.http_client import RateLimitedClient  # noqa: E402
+
+
+class RateLimitedStub:
+    """
+    Serves `GET /ping` with `X-RateLimit-*` headers; requests beyond `limit`
+    per `window` seconds get a 429 with a `retry_after` body.
+    """
+
+    def __init__(self, limit, window, error_rate=0):
+        self.limit = limit
+        self.window = window
+        self.error_every = int(1 / error_rate) if error_rate else 0
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.served = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def admit(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.window:
+                self.window_start, self.used = now, 0
+            reset_after = self.window - (now - self.window_start)
+            if self.used >= self.limit:
+                self.throttled += 1
+                return 429, reset_after, 0
+            self.used += 1
+            self.served += 1
+            if self.error_every and self.served % self.error_every == 0:
+                return 503, reset_after, self.limit - self.used
+            return 200, reset_after, self.limit - self.used
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, reset_after, remaining = stub.admit()
+                body = {"ok": True} if status == 200 else {"message": "slow down", "retry_after": reset_after, "global": False}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("X-RateLimit-Bucket", "stub")
+                self.send_header("X-RateLimit-Limit", str(stub.limit))
+                self.send_header("X-RateLimit-Remaining", str(remaining))
+                self.send_header("X-RateLimit-Reset-After", f"{reset_after:.3f}")
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--window", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Fraction of admitted requests answered with 503.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with RateLimitedStub(args.limit, args.window, args.error_rate) as stub:
+        client = RateLimitedClient(pool_size=args.workers, backoff_base=0.05)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            statuses = list(executor.map(lambda _: client.get(f"{stub.url}/ping").status_code, range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    print(f"ok={statuses.count(200)}/{args.requests} in {elapsed:.2f}s "
+          f"(ideal {args.requests / args.limit * args.window:.2f}s)")
+    print(f"server 429s={stub.throttled} client stats={client.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Benchmarks Discord ingestion against a local fake Discord server.
+
+Usage:
+    python benchmarks/bench_ingest_discord.py --messages 10000 --threads 1000 --latency 0.005
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_discord import FakeDiscord, build_history  # noqa: E402
+from shared.discord import DiscordIngestor  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=10_000, help="Total top-level messages.")
+    parser.add_argument("--threads", type=int, default=1_000)
+    parser.add_argument("--replies", type=int, default=5, help="Replies per thread.")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds of server latency per request.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 16])
+    args = parser.parse_args()
+
+    channels, threads = build_history(args.channels, args.messages // args.channels, args.threads, args.replies)
+    after_timestamp = datetime.now(timezone.utc) - timedelta(days=7)
+
+    print(f"{'workers':>8} {'pages':>8} {'requests':>9} {'convos':>8} {'seconds':>9} {'pages/s':>9}")
+    with FakeDiscord(channels, threads, latency=args.latency) as server:
+        for workers in args.workers:
+            server.requests = 0
+            ingestor = DiscordIngestor("bench-token", api_base=server.url, max_workers=workers)
+            start = time.perf_counter()
+            conversations = ingestor.ingest(list(channels), after_timestamp)
+            elapsed = time.perf_counter() - start
+            pages = ingestor.stats["pages"]
+            print(f"{workers:>8} {pages:>8} {server.requests:>9} {len(conversations):>8} "
+                  f"{elapsed:>9.2f} {pages / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares Linear ticket creation one `issueCreate` request per insight (the
+previous batch path, LINEAR_CONCURRENCY requests at once) with bulk aliased
+mutations, against a local fake GraphQL server. A share of the insights is
+set up to fail, to check that partial errors land on the right insight.
+
+Usage:
+    python benchmarks/bench_linear_bulk.py --tickets 200 --latency 0.08 --fail-rate 0.05
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_linear import FakeLinear  # noqa: E402
+
+
+def insights(count, fail_rate):
+    fail_every = int(1 / fail_rate) if fail_rate else 0
+    return [{
+        "summary": f"{'[fail] ' if fail_every and i % fail_every == 0 else ''}Users are confused about feature {i}.",
+        "channel_name": "support",
+        "quotes": [f"'How do I configure feature {i}?' - (from user{i % 40})"],
+        "documentation": {"url": f"https://docs.example.com/page-{i % 30}"},
+        "suggestion": {"llm_suggestion": "SUGGESTED CHANGE\n" + "Add a worked example. " * 30}
+    } for i in range(count)]
+
+
+def check(events, tickets):
+    """
+    Returns how many results landed on the wrong insight: failures on
+    insights that should succeed, or tickets on insights that should fail.
+    """
+    return sum(1 for event, ticket in zip(events, tickets)
+               if ("[fail]" in event["summary"]) != ("error" in ticket))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.08, help="Seconds of server latency per request.")
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--create-complexity", type=int, default=100,
+                        help="Complexity points the fake charges per issueCreate; above 400 forces splits.")
+    args = parser.parse_args()
+
+    with FakeLinear(latency=args.latency, create_complexity=args.create_complexity) as server:
+        os.environ["LINEAR_API_URL"] = server.url
+        from handlers import create_linear_ticket as linear
+
+        config = ("bench-key", "project-1", "team-1")
+        events = insights(args.tickets, args.fail_rate)
+
+        def create_or_record(event):
+            try:
+                return linear.create_ticket(event, *config)
+            except Exception as e:
+                return {"error": str(e)}
+
+        concurrency = int(os.environ.get("LINEAR_CONCURRENCY", "4"))
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            tickets = list(executor.map(create_or_record, events))
+        single = time.perf_counter() - start
+        print(f"per-insight: {server.requests:>4} requests {single:6.2f}s "
+              f"created={sum('error' not in t for t in tickets)} misattributed={check(events, tickets)}")
+
+        # Issue IDs are derived from the insights, so the bulk pass starts from an empty workspace.
+        server.requests = 0
+        server.issues.clear()
+        start = time.perf_counter()
+        tickets = linear.create_tickets(events, *config)
+        bulk = time.perf_counter() - start
+        print(f"bulk:        {server.requests:>4} requests {bulk:6.2f}s "
+              f"created={sum('error' not in t for t in tickets)} misattributed={check(events, tickets)} "
+              f"rejected_as_too_complex={server.rejected}")
+
+
+if __name__ == "__main__":
+    main()
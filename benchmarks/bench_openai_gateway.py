@@ -0,0 +1,119 @@
+"""
+Compares calling OpenAI directly through the SDK (its default two retries)
+with calling it through `OpenAIGateway`, against a local fake that enforces
+per-model request and token limits. A burst of suggestion calls is sent
+first, and extraction calls arrive shortly after on the same model's
+limits, so the report shows both the 429s and failures of each approach
+and how long extraction calls wait behind suggestion calls.
+
+The gateway is run twice: learning its limits from response headers only,
+and with the limits configured up front (`OPENAI_RPM_LIMIT`/`OPENAI_TPM_LIMIT`).
+
+Usage:
+    python benchmarks/bench_openai_gateway.py --suggestions 40 --extractions 8 --rpm 100 --tpm 30000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import openai  # noqa: E402
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from shared.openai_client import EXTRACTION, SUGGESTION, OpenAIGateway  # noqa: E402
+from shared.tokens import CHARS_PER_TOKEN  # noqa: E402
+
+FILLER = "users report that the configuration page is unclear "
+
+
+def prompt(kind, index, tokens):
+    return f"{kind} {index}: " + FILLER * (tokens * CHARS_PER_TOKEN // len(FILLER))
+
+
+def jobs(args):
+    """
+    Returns (kind, start delay, messages, max_tokens) for every call of the workload.
+    """
+    return ([("suggestion", 0.0, [{"role": "user", "content": prompt("suggestion", i, args.suggestion_tokens)}],
+              args.suggestion_max_tokens) for i in range(args.suggestions)]
+            + [("extraction", args.extraction_delay,
+                [{"role": "user", "content": prompt("extraction", i, args.extraction_tokens)}],
+                args.extraction_max_tokens) for i in range(args.extractions)])
+
+
+def run(mode, args):
+    with FakeOpenAI(latency=args.latency, rpm=args.rpm, tpm=args.tpm) as fake:
+        if mode == "direct":
+            client = openai.OpenAI(api_key="local", base_url=fake.url)
+
+            def call(kind, messages, max_tokens):
+                client.chat.completions.create(model=args.model, messages=messages, max_tokens=max_tokens)
+        else:
+            configured = mode == "gateway, configured"
+            gateway = OpenAIGateway(openai.OpenAI(api_key="local", base_url=fake.url, max_retries=0),
+                                    rpm=args.rpm if configured else None, tpm=args.tpm if configured else None)
+
+            def call(kind, messages, max_tokens):
+                gateway.chat(messages, args.model, priority=EXTRACTION if kind == "extraction" else SUGGESTION,
+                             max_tokens=max_tokens)
+
+        start = time.perf_counter()
+
+        def timed(job):
+            kind, delay, messages, max_tokens = job
+            time.sleep(delay)
+            submitted = time.perf_counter()
+            try:
+                call(kind, messages, max_tokens)
+                return kind, time.perf_counter() - submitted, False
+            except openai.APIError:
+                return kind, time.perf_counter() - submitted, True
+
+        workload = jobs(args)
+        with ThreadPoolExecutor(max_workers=len(workload)) as executor:
+            results = list(executor.map(timed, workload))
+        result = {"mode": mode, "seconds": time.perf_counter() - start, "rate_limited": fake.stats["rate_limited"],
+                  "failed": sum(failed for _, _, failed in results)}
+        for kind in ("extraction", "suggestion"):
+            latencies = [latency for k, latency, failed in results if k == kind and not failed]
+            result[kind] = (statistics.median(latencies), max(latencies)) if latencies else (0.0, 0.0)
+        if mode != "direct":
+            result["estimated_tokens"] = gateway.stats["estimated_tokens"]
+            result["used_tokens"] = gateway.stats["used_tokens"]
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--suggestions", type=int, default=40)
+    parser.add_argument("--extractions", type=int, default=8)
+    parser.add_argument("--suggestion-tokens", type=int, default=600, help="Prompt tokens per suggestion call.")
+    parser.add_argument("--suggestion-max-tokens", type=int, default=300)
+    parser.add_argument("--extraction-tokens", type=int, default=2000, help="Prompt tokens per extraction call.")
+    parser.add_argument("--extraction-max-tokens", type=int, default=500)
+    parser.add_argument("--extraction-delay", type=float, default=1.0,
+                        help="Seconds after the suggestion burst that extraction calls arrive.")
+    parser.add_argument("--rpm", type=int, default=100)
+    parser.add_argument("--tpm", type=int, default=30000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per fake OpenAI response.")
+    parser.add_argument("--model", default="gpt-4o")
+    args = parser.parse_args()
+
+    print(f"{'mode':<22} {'seconds':>8} {'429s':>5} {'failed':>7} {'extraction p50/max s':>21} "
+          f"{'suggestion p50/max s':>21} {'est/used tokens':>16}")
+    for mode in ("direct", "gateway, from headers", "gateway, configured"):
+        result = run(mode, args)
+        tokens = (f"{result['estimated_tokens'] / result['used_tokens']:.2f}x"
+                  if result.get("used_tokens") else "-")
+        print(f"{mode:<22} {result['seconds']:>8.1f} {result['rate_limited']:>5} {result['failed']:>7} "
+              f"{'%.1f / %.1f' % result['extraction']:>21} {'%.1f / %.1f' % result['suggestion']:>21} "
+              f"{tokens:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Runs the whole workflow offline at several multiples of one week's traffic
+and reports per-stage wall time, peak RSS, API calls and tokens. Each
+scale runs `local_runner.py` in a fresh interpreter, so peak RSS and
+module-level caches belong to that run alone.
+
+With `--save` the reports are written as a baseline; with `--baseline`
+each run is compared against it and the script exits non-zero when wall
+time or peak RSS grew by more than `--tolerance`, or when API calls or
+tokens grew at all (they are deterministic for a given scale).
+
+Usage:
+    python benchmarks/bench_pipeline.py --scales 1 10 100 --workflow map --save /tmp/baseline.json
+    python benchmarks/bench_pipeline.py --scales 1 10 --baseline /tmp/baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_runner.py")
+
+
+def run_scale(scale, args):
+    with tempfile.NamedTemporaryFile(suffix=".json") as report:
+        command = [sys.executable, RUNNER, "--scale", str(scale), "--workflow", args.workflow,
+                   "--latency", str(args.latency), "--report", report.name]
+        if args.openai_latency is not None:
+            command += ["--openai-latency", str(args.openai_latency)]
+        if args.replay:
+            command += ["--replay", args.replay]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(report.name, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def api_total(report):
+    calls = report["api_calls"]
+    return sum(value for key, value in calls.items() if key != "aws") + sum(calls["aws"].values())
+
+
+def print_report(report):
+    calls = report["api_calls"]
+    tokens = report["tokens"]
+    print(f"\nscale {report['scale']:g} ({report['workflow']}): {report['messages']} messages in "
+          f"{report['threads']} threads, {report['seconds']:.2f}s, peak RSS {report['peak_rss_mb']:.0f} MB, "
+          f"{report['tickets_created']} tickets created, {report['tickets_stored']} stored")
+    print(f"  API calls: discord {calls['discord']}, openai chat {calls['openai_chat']}, "
+          f"openai embeddings {calls['openai_embeddings']}, linear {calls['linear']}, "
+          f"aws {sum(calls['aws'].values())}")
+    print(f"  tokens: prompt {tokens['prompt_tokens']}, completion {tokens['completion_tokens']}, "
+          f"embedding {tokens['embedding_tokens']}")
+    print(f"  {'stage':<52} {'runs':>5} {'seconds':>8} {'max state KB':>13}")
+    for name, stage in report["stages"].items():
+        print(f"  {name:<52} {stage['invocations']:>5} {stage['seconds']:>8.2f} "
+              f"{stage['max_state_bytes'] / 1024:>13.1f}")
+    metrics = report.get("metrics")
+    if metrics:
+        total = sum(stage["estimated_cost"] for stage in metrics["stages"].values())
+        by_stage = ", ".join(f"{name} ${stage['estimated_cost']:.4f}" for name, stage in metrics["stages"].items()
+                             if stage["estimated_cost"])
+        by_channel = ", ".join(f"{name} ${channel['estimated_cost']:.4f}"
+                               for name, channel in metrics["channels"].items())
+        print(f"  estimated cost ${total:.4f}: {by_stage}")
+        print(f"  by channel: {by_channel}")
+
+
+def regressions(report, baseline, tolerance):
+    found = []
+    for key in ("seconds", "peak_rss_mb"):
+        if report[key] > baseline[key] * (1 + tolerance):
+            found.append(f"{key} {baseline[key]} -> {report[key]}")
+    for name, stage in report["stages"].items():
+        before = baseline["stages"].get(name)
+        # Sub-second stages are too noisy to compare by ratio alone.
+        if before and stage["seconds"] > max(before["seconds"] * (1 + tolerance), before["seconds"] + 0.5):
+            found.append(f"stage '{name}' seconds {before['seconds']} -> {stage['seconds']}")
+    if api_total(report) > api_total(baseline):
+        found.append(f"API calls {api_total(baseline)} -> {api_total(report)}")
+    for key, value in report["tokens"].items():
+        if value > baseline["tokens"].get(key, value):
+            found.append(f"{key} {baseline['tokens'][key]} -> {value}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--workflow", choices=["map", "batch"], default="map")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency per fake API request.")
+    parser.add_argument("--openai-latency", type=float, default=None)
+    parser.add_argument("--replay", help="OpenAI fixtures recorded with local_runner.py --record.")
+    parser.add_argument("--save", help="Write the reports to this JSON file, for use as a baseline.")
+    parser.add_argument("--baseline", help="Compare against reports saved with --save.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative growth of wall time and peak RSS.")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {(r["workflow"], r["scale"]): r for r in json.load(f)}
+
+    reports, failures = [], []
+    for scale in args.scales:
+        report = run_scale(scale, args)
+        reports.append(report)
+        print_report(report)
+        before = baseline.get((report["workflow"], report["scale"]))
+        if before:
+            found = regressions(report, before, args.tolerance)
+            failures += [f"scale {scale:g}: {line}" for line in found]
+            print("  vs baseline: " + ("; ".join(found) if found else "no regressions"))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=1)
+    if failures:
+        print("\nRegressions:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Measures what it costs to finish a workflow execution that failed part way.
+For each interruption point the workflow is failed there and started again
+with the same run ID, once without checkpoints (the second execution
+starts over) and once with them (it resumes), and the second execution's
+API calls, tokens and wall time are reported next to a clean run's.
+`refused` counts ticket creates Linear turned down because the insight's
+ticket already existed: each would have been a duplicate ticket without
+the deterministic issue IDs.
+
+Each run is `local_runner.py` in a fresh interpreter.
+
+Usage:
+    python benchmarks/bench_resume.py --scale 1 --workflow map
+    python benchmarks/bench_resume.py --interrupts "Create Linear Tickets" "Generate Suggestions" --workflow batch
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_runner.py")
+DEFAULT_INTERRUPTS = {
+    "map": ["Cluster and Summarize Insights", "Append Quotes to Existing Tickets",
+            "Process Each Insight/Create Linear Ticket:3"],
+    "batch": ["Append Quotes to Existing Tickets", "Generate Suggestions", "Create Linear Tickets"],
+}
+
+
+def run(args, interrupt=None, checkpoints=False):
+    with tempfile.NamedTemporaryFile(suffix=".json") as report:
+        command = [sys.executable, RUNNER, "--scale", str(args.scale), "--workflow", args.workflow,
+                   "--latency", str(args.latency), "--report", report.name]
+        if interrupt:
+            command += ["--interrupt", interrupt]
+        if checkpoints:
+            command.append("--checkpoints")
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(report.name, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def print_row(label, execution, report):
+    calls = execution["api_calls"]
+    tokens = execution["tokens"]
+    print(f"{label:<62} {execution['seconds']:>7.2f} {calls['discord']:>8} "
+          f"{calls['openai_chat'] + calls['openai_embeddings']:>7} "
+          f"{tokens['prompt_tokens'] + tokens['completion_tokens'] + tokens['embedding_tokens']:>8} "
+          f"{calls['linear']:>7} {report['tickets_created']:>8} {report['duplicate_creates_refused']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--workflow", choices=sorted(DEFAULT_INTERRUPTS), default="map")
+    parser.add_argument("--interrupts", nargs="+", metavar="STATE[:N]",
+                        help="States to fail the first execution at (default: a few per workflow).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency per fake API request.")
+    args = parser.parse_args()
+
+    print(f"{'second execution':<62} {'seconds':>7} {'discord':>8} {'openai':>7} {'tokens':>8} "
+          f"{'linear':>7} {'tickets':>8} {'refused':>8}")
+    clean = run(args)
+    print_row("clean run (one execution)", clean, clean)
+    for interrupt in args.interrupts or DEFAULT_INTERRUPTS[args.workflow]:
+        for checkpoints in (False, True):
+            report = run(args, interrupt, checkpoints)
+            print_row(f"{interrupt}, {'checkpoints' if checkpoints else 'no checkpoints'}",
+                      report["resumed"], report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures the cold-start cost attributable to secrets: each run imports a
+handler module in a fresh interpreter and then reads the secrets, against
+a local fake of Secrets Manager and of the Lambda extension endpoint.
+Compared are the previous `get_secrets` (new boto3 session and client on
+first call), the provider with the shared client, with import-time
+prefetch, and with the extension backend.
+
+Usage:
+    python benchmarks/bench_secrets.py --latency 0.03 --runs 5 --handler generate_suggestion
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_secrets import FakeSecrets  # noqa: E402
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+CHILD = """
+import importlib, json, sys, time
+start = time.perf_counter()
+if sys.argv[1] == "legacy":
+    importlib.import_module("handlers." + sys.argv[2])
+    imported = time.perf_counter()
+    import boto3, os
+    client = boto3.session.Session().client(service_name='secretsmanager')
+    secrets = json.loads(client.get_secret_value(SecretId=os.environ["SECRETS_ARN"])['SecretString'])
+else:
+    from shared.utils import get_secrets
+    importlib.import_module("handlers." + sys.argv[2])
+    imported = time.perf_counter()
+    secrets = get_secrets()
+done = time.perf_counter()
+assert secrets["LINEAR_API_KEY"] == "bench-linear-key"
+print(json.dumps({"init": imported - start, "wait": done - imported}))
+"""
+
+MODES = [
+    ("legacy", "previous get_secrets", {}),
+    ("provider", "shared client", {}),
+    ("provider", "shared client + prefetch", {"SECRETS_PREFETCH": "true"}),
+    ("provider", "extension + prefetch", {"SECRETS_PREFETCH": "true", "SECRETS_BACKEND": "extension"}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.03, help="Seconds per secrets request.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--handler", default="generate_suggestion")
+    args = parser.parse_args()
+
+    with FakeSecrets({"LINEAR_API_KEY": "bench-linear-key", "OPENAI_API_KEY": "bench-openai-key"},
+                     latency=args.latency) as server:
+        base_env = {k: v for k, v in os.environ.items() if k not in ("AWS_SAM_LOCAL", "SECRETS_PREFETCH")}
+        base_env.update({
+            "SECRETS_ARN": server.secret_id, "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing", "AWS_SESSION_TOKEN": "testing",
+            "AWS_ENDPOINT_URL_SECRETS_MANAGER": server.url, "SECRETS_EXTENSION_ENDPOINT": server.url,
+        })
+        print(f"{'mode':<28} {'init ms':>8} {'waited ms':>10} {'total ms':>9}")
+        for mode, label, extra in MODES:
+            runs = []
+            for _ in range(args.runs):
+                output = subprocess.run([sys.executable, "-c", CHILD, mode, args.handler], cwd=SRC,
+                                        env={**base_env, **extra}, capture_output=True, text=True, check=True)
+                runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+            init = statistics.median(r["init"] for r in runs) * 1000
+            wait = statistics.median(r["wait"] for r in runs) * 1000
+            print(f"{label:<28} {init:>8.0f} {wait:>10.1f} {init + wait:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Measures each Lambda function's cold-start import cost and dependency
+footprint. For every function in `template.yaml`, its handler module is
+imported in fresh interpreters under `-X importtime`. The report shows
+the wall time of the import (the Lambda init phase), the import time
+broken down by top-level package, and the one-off cost of the SDKs the
+function imports lazily on first use. Bundle sizes are the installed
+sizes of the function's dependency set (`src/requirements.txt` plus its
+layers), resolved through installed package metadata, next to the size
+of one bundle holding every dependency.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 3 --functions FindDocsFunction StoreInDynamoDBFunction --report /tmp/startup.json
+"""
+import argparse
+import importlib.metadata
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_runner import ROOT, load_template  # noqa: E402
+
+SRC = os.path.join(ROOT, "src")
+# Import names of the packages that layers provide, measured when a handler defers them.
+LAYER_MODULES = {"numpy": ["numpy"], "openai": ["openai", "tiktoken"], "pinecone": ["pinecone"]}
+OWN_PACKAGES = {"handlers", "shared"}
+
+CHILD = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+init = time.perf_counter() - start
+deferred = {}
+for name in sys.argv[2:]:
+    if name in sys.modules:
+        continue
+    start = time.perf_counter()
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        continue
+    deferred[name] = time.perf_counter() - start
+print(json.dumps({"init": init, "deferred": deferred}))
+"""
+
+
+def normalize(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def read_requirements(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [re.match(r"[A-Za-z0-9_.\-]+", line.strip()).group(0) for line in f
+                if line.strip() and not line.startswith("#")]
+
+
+def closure(requirements):
+    """
+    Returns the installed distributions `requirements` pull in, by normalized name,
+    and the names that are not installed here.
+    """
+    found, missing, pending = {}, set(), list(requirements)
+    while pending:
+        name = normalize(pending.pop())
+        if name in found or name in missing:
+            continue
+        try:
+            dist = importlib.metadata.distribution(name)
+        except importlib.metadata.PackageNotFoundError:
+            missing.add(name)
+            continue
+        found[name] = dist
+        for requirement in dist.requires or []:
+            if "extra ==" not in requirement:
+                pending.append(re.match(r"[A-Za-z0-9_.\-]+", requirement).group(0))
+    return found, missing
+
+
+def size_mb(dists):
+    return sum(f.size or 0 for dist in dists.values() for f in dist.files or []) / 1e6
+
+
+def code_size_mb(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path)
+               for f in files if f.endswith(".py")) / 1e6
+
+
+def functions(template):
+    """
+    Yields (name, handler, layer names, CodeUri) for every function in the template.
+    """
+    resources = template["Resources"]
+    for name, resource in resources.items():
+        if resource["Type"] != "AWS::Serverless::Function":
+            continue
+        props = resource["Properties"]
+        layers = []
+        for layer in props.get("Layers", []):
+            if isinstance(layer, dict) and "Ref" in layer and layer["Ref"] in resources:
+                layers.append(resources[layer["Ref"]]["Properties"]["ContentUri"].rstrip("/"))
+        yield name, props["Handler"], layers, props.get("CodeUri", "src/").rstrip("/")
+
+
+def third_party(root):
+    return root not in OWN_PACKAGES and root not in sys.stdlib_module_names
+
+
+def parse_importtime(stderr):
+    """
+    Returns the cumulative import time in microseconds per top-level package.
+    A package imported while another third-party package is loading counts
+    towards that one (botocore towards boto3), so the totals do not overlap.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            entries.append((len(match.group(3)), match.group(4).split(".")[0], int(match.group(2))))
+    totals, stack = {}, []
+    # Parents are printed after their children, so walk backwards to see ancestors first.
+    for depth, root, cumulative in reversed(entries):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        if not any(third_party(ancestor) or ancestor == root for _, ancestor in stack):
+            totals[root] = totals.get(root, 0) + cumulative
+        stack.append((depth, root))
+    return totals
+
+
+def measure(module, deferred_modules, runs):
+    env = {k: v for k, v in os.environ.items() if k not in ("SECRETS_ARN", "SECRETS_PREFETCH", "AWS_SAM_LOCAL")}
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, module, *deferred_modules],
+                                cwd=SRC, env=env, capture_output=True, text=True, check=True)
+        results.append((json.loads(output.stdout.strip().splitlines()[-1]), parse_importtime(output.stderr)))
+    packages = {}
+    for _, totals in results:
+        for root, micros in totals.items():
+            packages.setdefault(root, []).append(micros)
+    return {
+        "init_ms": statistics.median(r["init"] for r, _ in results) * 1000,
+        "deferred_ms": {name: statistics.median(r["deferred"].get(name, 0) for r, _ in results) * 1000
+                        for name in results[0][0]["deferred"]},
+        "packages_ms": {root: statistics.median(values) / 1000 for root, values in packages.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--functions", nargs="*", help="Logical IDs to measure (default: all).")
+    parser.add_argument("--top", type=int, default=3, help="Heaviest third-party packages to list per function.")
+    parser.add_argument("--report", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    template = load_template()
+    entries = [entry for entry in functions(template) if not args.functions or entry[0] in args.functions]
+    all_requirements = set(read_requirements(os.path.join(ROOT, "src", "requirements.txt")))
+    for _, _, layers, _ in functions(template):
+        for layer in layers:
+            all_requirements.update(read_requirements(os.path.join(ROOT, layer, "requirements.txt")))
+    shared_dists, _ = closure(all_requirements)
+    shared_mb = size_mb(shared_dists) + code_size_mb(SRC)
+
+    print(f"{'function':<34} {'init ms':>8} {'deferred ms':>12} {'bundle MB':>10}  heaviest imports (ms)")
+    report = []
+    for name, handler, layers, code_uri in entries:
+        module = handler.rsplit(".", 1)[0]
+        requirements = read_requirements(os.path.join(ROOT, code_uri, "requirements.txt"))
+        deferred_modules = []
+        for layer in layers:
+            requirements += read_requirements(os.path.join(ROOT, layer, "requirements.txt"))
+            deferred_modules += LAYER_MODULES.get(os.path.basename(layer), [])
+        dists, missing = closure(requirements)
+        result = measure(module, deferred_modules, args.runs)
+        bundle_mb = size_mb(dists) + code_size_mb(os.path.join(ROOT, code_uri))
+        packages = sorted(((ms, root) for root, ms in result["packages_ms"].items() if third_party(root) and ms >= 1),
+                          reverse=True)
+        heaviest = ", ".join(f"{root} {ms:.0f}" for ms, root in packages[:args.top])
+        deferred = sum(result["deferred_ms"].values())
+        print(f"{name:<34} {result['init_ms']:>8.0f} {deferred:>12.0f} {bundle_mb:>9.1f}{'*' if missing else ' '}  "
+              f"{heaviest}")
+        report.append({"function": name, "handler": handler, "layers": layers, "bundle_mb": round(bundle_mb, 1),
+                       "not_installed": sorted(missing), **{k: result[k] for k in ("init_ms", "deferred_ms")},
+                       "packages_ms": dict(sorted(result["packages_ms"].items(), key=lambda item: -item[1]))})
+    print(f"\nshared bundle of every dependency: {shared_mb:.1f} MB"
+          " (* = some dependencies are not installed here and are not counted)")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"shared_bundle_mb": round(shared_mb, 1), "functions": report}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
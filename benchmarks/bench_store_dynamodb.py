@@ -0,0 +1,122 @@
+"""
+Ticket persistence against a local DynamoDB stand-in (moto): throughput of
+the previous per-ticket path (new resource, JSON round trip, put_item)
+versus store_in_dynamodb.store_items, plus a check that re-storing tickets,
+as a retried Map step does, keeps a status the webhook already changed.
+
+moto answers in-process, so without `--latency` the numbers measure
+client-side cost only. `--latency` adds a delay to every request, standing
+in for the network round trip (~5-10ms) to DynamoDB.
+
+Usage:
+    python benchmarks/bench_store_dynamodb.py --tickets 2000 --latency 0.005
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ["DYNAMODB_TABLE"] = "bench-tickets"
+
+from handlers import store_in_dynamodb  # noqa: E402
+from shared.ticket_memory import encode_centroid  # noqa: E402
+
+
+def clusters(count, dim=1536):
+    vector = [0.01] * dim
+    return [{
+        "summary": f"[General] Users are confused about feature {i}.",
+        "cluster_size": 3 + i % 5,
+        "centroid": encode_centroid(vector),
+        "documentation": {"url": f"https://docs.example.com/page-{i % 40}", "score": 0.8123},
+        "suggestion": {"llm_suggestion": "SUGGESTED CHANGE\n" + "Add an example. " * 40},
+        "ticket": {"ticket_id": f"ticket-{i}", "ticket_identifier": f"DOC-{i}",
+                   "ticket_url": f"https://linear.app/t/DOC-{i}"}
+    } for i in range(count)]
+
+
+def legacy_store(event):
+    # The pre-batching handler body, kept here for comparison.
+    table = boto3.resource('dynamodb').Table(os.environ["DYNAMODB_TABLE"])
+    item = {k: v for k, v in store_in_dynamodb.build_item(event).items() if k != "centroid"}
+    item = json.loads(json.dumps(item, default=str), parse_float=Decimal)
+    table.put_item(Item=item)
+
+
+def add_latency(seconds):
+    # moto replaces the default session when it starts, so this runs inside each mock.
+    if seconds:
+        boto3.setup_default_session()
+        boto3.DEFAULT_SESSION.events.register("before-call.dynamodb", lambda **kwargs: time.sleep(seconds))
+
+
+def create_table():
+    dynamodb = boto3.resource('dynamodb')
+    dynamodb.create_table(TableName=os.environ["DYNAMODB_TABLE"],
+                          KeySchema=[{"AttributeName": "ticket_id", "KeyType": "HASH"}],
+                          AttributeDefinitions=[{"AttributeName": "ticket_id", "AttributeType": "S"}],
+                          BillingMode="PAY_PER_REQUEST")
+    return dynamodb.Table(os.environ["DYNAMODB_TABLE"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency per DynamoDB request.")
+    args = parser.parse_args()
+    events = clusters(args.tickets)
+
+    raw = [{k: v for k, v in event.items() if k != "centroid"} for event in events]
+    start = time.perf_counter()
+    for event in raw:
+        json.loads(json.dumps(event, default=str), parse_float=Decimal)
+    round_trip = time.perf_counter() - start
+    start = time.perf_counter()
+    for event in raw:
+        store_in_dynamodb.to_dynamodb(event)
+    direct = time.perf_counter() - start
+    print(f"conversion: JSON round trip {round_trip * 1000:.1f}ms, direct {direct * 1000:.1f}ms "
+          f"for {len(raw)} tickets")
+
+    with mock_aws():
+        create_table()
+        add_latency(args.latency)
+        start = time.perf_counter()
+        for event in events:
+            legacy_store(event)
+        legacy = time.perf_counter() - start
+        print(f"per-ticket put_item:  {args.tickets / legacy:8.0f} tickets/s ({args.tickets} requests)")
+
+    with mock_aws():
+        table = create_table()
+        add_latency(args.latency)
+        store_in_dynamodb._table = None
+        items = [store_in_dynamodb.build_item(event) for event in events]
+        start = time.perf_counter()
+        created, updated = store_in_dynamodb.store_items(items)
+        batched = time.perf_counter() - start
+        print(f"store_items (concurrent): {args.tickets / batched:8.0f} tickets/s ({args.tickets} requests, "
+              f"{created} created, {updated} updated)")
+
+        # A webhook moves half the tickets on, then the step is retried.
+        for i in range(0, args.tickets, 2):
+            table.update_item(Key={"ticket_id": f"ticket-{i}"}, UpdateExpression="SET #s = :s",
+                              ExpressionAttributeNames={"#s": "status"}, ExpressionAttributeValues={":s": "In Progress"})
+        created, updated = store_in_dynamodb.store_items(items)
+        statuses = [table.get_item(Key={"ticket_id": f"ticket-{i}"})["Item"]["status"] for i in range(0, 20)]
+        kept = all(status == ("In Progress" if i % 2 == 0 else "Triage") for i, status in enumerate(statuses))
+        print(f"retry: {created} created, {updated} updated, webhook statuses kept: {kept}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compares vector search backends on recall@k and query latency over a
+synthetic documentation corpus.
+
+The local backend always runs. Pass --pinecone-index (with PINECONE_API_KEY
+set) to also upsert the corpus into a scratch namespace of that index and
+measure Pinecone; the namespace is deleted afterwards.
+
+Usage:
+    python benchmarks/bench_vector_backends.py --docs 5000 --queries 200 --top-k 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from shared.vector_store import LocalVectorStore, PineconeVectorStore, normalize_rows  # noqa: E402
+
+
+def synthetic_corpus(num_docs, num_queries, dim, seed=7):
+    """
+    Builds clustered unit vectors (topics with per-chunk noise) and queries
+    that are noisy copies of random chunks.
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(1, num_docs // 20), dim))
+    docs = topics[rng.integers(0, len(topics), num_docs)] + 0.6 * rng.standard_normal((num_docs, dim))
+    targets = rng.integers(0, num_docs, num_queries)
+    queries = docs[targets] + 0.8 * rng.standard_normal((num_queries, dim))
+    return normalize_rows(docs), normalize_rows(queries)
+
+
+def exact_top_k(docs, queries, k):
+    scores = queries.astype(np.float64) @ docs.astype(np.float64).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall(results, truth, ids):
+    hits = 0
+    for matches, expected in zip(results, truth):
+        expected_ids = {ids[i] for i in expected}
+        hits += len(expected_ids & {match["id"] for match in matches})
+    return hits / truth.size
+
+
+def measure(name, store, queries, truth, ids, k):
+    timings = []
+    start = time.perf_counter()
+    results = store.query_many(queries, top_k=k, timings=timings)
+    batch_seconds = time.perf_counter() - start
+
+    single = []
+    for query in queries[:min(50, len(queries))]:
+        t0 = time.perf_counter()
+        store.query(query, top_k=k)
+        single.append(time.perf_counter() - t0)
+
+    print(f"{name:>9} recall@{k}={recall(results, truth, ids):.3f} "
+          f"single p50={np.percentile(single, 50) * 1000:.2f}ms p95={np.percentile(single, 95) * 1000:.2f}ms "
+          f"batch of {len(queries)}={batch_seconds * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--pinecone-index", help="Existing Pinecone index (with matching dimension) to benchmark.")
+    args = parser.parse_args()
+
+    docs, queries = synthetic_corpus(args.docs, args.queries, args.dim)
+    ids = [f"chunk-{i}" for i in range(args.docs)]
+    records = [(record_id, vector, {"url": f"https://docs.example.com/{record_id}"}) for record_id, vector in zip(ids, docs)]
+    truth = exact_top_k(docs, queries, args.top_k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local = LocalVectorStore(os.path.join(tmp, "docs-index"))
+        start = time.perf_counter()
+        local.upsert(records)
+        print(f"local index build: {time.perf_counter() - start:.2f}s for {args.docs} x {args.dim}")
+        measure("local", LocalVectorStore(local.path), queries, truth, ids, args.top_k)
+
+    if args.pinecone_index:
+        import pinecone
+
+        pc = pinecone.Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+        store = PineconeVectorStore(pc.Index(args.pinecone_index), namespace=f"bench-{int(time.time())}")
+        store.upsert(records)
+        time.sleep(10)  # Pinecone upserts are eventually consistent.
+        try:
+            measure("pinecone", store, queries, truth, ids, args.top_k)
+        finally:
+            store.index.delete(delete_all=True, namespace=store.namespace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Replays a bulk-triage burst of signed Linear webhooks through the webhook
+handler, SQS and the queue consumer, against moto stand-ins for SQS and
+DynamoDB. Reports handler latency, DynamoDB writes compared with one
+write per webhook, the coalescing ratio, and whether every ticket ended
+in its latest state despite out-of-order deliveries.
+
+Usage:
+    python benchmarks/bench_webhook_queue.py --tickets 200 --moves 3 --shuffle 0.2
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ["AWS_SAM_LOCAL"] = "true"
+os.environ["LINEAR_WEBHOOK_SECRET"] = "bench-secret"
+os.environ["DYNAMODB_TABLE"] = "bench-tickets"
+
+from handlers import process_linear_webhook as webhook  # noqa: E402
+
+STATES = ["Triage", "Backlog", "Todo", "In Progress", "In Review", "Done"]
+
+
+def deliveries(tickets, moves, shuffle, seed=5):
+    """
+    Returns (signed API Gateway events, expected final status per ticket).
+    Each ticket moves through `moves` states one second apart; a `shuffle`
+    share of deliveries is swapped with a later one, as retries reorder them.
+    """
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc) - timedelta(minutes=5)
+    bodies, expected = [], {}
+    for t in range(tickets):
+        for m in range(moves):
+            state = STATES[1 + m % (len(STATES) - 1)]
+            expected[f"ticket-{t}"] = state
+            bodies.append({
+                "action": "update", "type": "Issue",
+                "webhookTimestamp": int(time.time() * 1000),
+                "updatedFrom": {"stateId": f"state-{m}"},
+                "data": {"id": f"ticket-{t}", "state": {"name": state},
+                         "updatedAt": (start + timedelta(seconds=m)).isoformat().replace("+00:00", "Z")}
+            })
+    for i in range(len(bodies) - 1):
+        if rng.random() < shuffle:
+            j = rng.randint(i + 1, min(len(bodies) - 1, i + 2 * moves))
+            bodies[i], bodies[j] = bodies[j], bodies[i]
+
+    events = []
+    for body in bodies:
+        raw = json.dumps(body)
+        signature = hmac.new(b"bench-secret", raw.encode(), hashlib.sha256).hexdigest()
+        events.append({"body": raw, "headers": {"linear-signature": signature}})
+    return events, expected
+
+
+def legacy_handler(event):
+    # The previous handler: a new resource and one unconditional write per webhook.
+    table = boto3.resource('dynamodb').Table(os.environ["DYNAMODB_TABLE"])
+    body = json.loads(event["body"])
+    table.update_item(Key={"ticket_id": body["data"]["id"]}, UpdateExpression="SET #s = :s",
+                      ExpressionAttributeNames={"#s": "status"},
+                      ExpressionAttributeValues={":s": body["data"]["state"]["name"]})
+
+
+def create_table():
+    dynamodb = boto3.resource('dynamodb')
+    dynamodb.create_table(TableName=os.environ["DYNAMODB_TABLE"],
+                          KeySchema=[{"AttributeName": "ticket_id", "KeyType": "HASH"}],
+                          AttributeDefinitions=[{"AttributeName": "ticket_id", "AttributeType": "S"}],
+                          BillingMode="PAY_PER_REQUEST")
+    return dynamodb.Table(os.environ["DYNAMODB_TABLE"])
+
+
+def correct(table, expected):
+    return sum(1 for ticket_id, status in expected.items()
+               if table.get_item(Key={"ticket_id": ticket_id}).get("Item", {}).get("status") == status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=200)
+    parser.add_argument("--moves", type=int, default=3, help="State changes per ticket.")
+    parser.add_argument("--shuffle", type=float, default=0.2, help="Share of deliveries arriving out of order.")
+    parser.add_argument("--batch-size", type=int, default=100, help="SQS records per consumer invocation.")
+    args = parser.parse_args()
+    events, expected = deliveries(args.tickets, args.moves, args.shuffle)
+
+    with mock_aws():
+        table = create_table()
+        start = time.perf_counter()
+        for event in events:
+            legacy_handler(event)
+        elapsed = time.perf_counter() - start
+        print(f"per-webhook writes: {len(events)} writes, {elapsed / len(events) * 1000:.2f}ms per webhook, "
+              f"{correct(table, expected)}/{len(expected)} tickets in their latest state")
+
+    with mock_aws():
+        table = create_table()
+        sqs = boto3.client('sqs')
+        os.environ["WEBHOOK_QUEUE_URL"] = sqs.create_queue(QueueName="bench-webhooks")["QueueUrl"]
+        webhook._clients.clear()
+
+        start = time.perf_counter()
+        statuses = [webhook.handler(event, None)["statusCode"] for event in events]
+        elapsed = time.perf_counter() - start
+        forged = webhook.handler({"body": events[0]["body"], "headers": {"linear-signature": "0" * 64}}, None)
+        print(f"webhook handler: {elapsed / len(events) * 1000:.2f}ms per webhook, "
+              f"{statuses.count(200)} queued, forged signature -> {forged['statusCode']}")
+
+        writes, batches = 0, 0
+        while True:
+            records = []
+            while len(records) < args.batch_size:
+                messages = sqs.receive_message(QueueUrl=os.environ["WEBHOOK_QUEUE_URL"],
+                                               MaxNumberOfMessages=10).get("Messages", [])
+                if not messages:
+                    break
+                records += [{"messageId": m["MessageId"], "body": m["Body"]} for m in messages]
+                sqs.delete_message_batch(QueueUrl=os.environ["WEBHOOK_QUEUE_URL"], Entries=[
+                    {"Id": str(i), "ReceiptHandle": m["ReceiptHandle"]} for i, m in enumerate(messages)])
+            if not records:
+                break
+            outcomes, metrics = webhook.apply_updates([json.loads(r["body"]) for r in records])
+            writes += metrics["writes"]
+            batches += 1
+        print(f"queue consumer: {batches} batches, {writes} conditional writes "
+              f"(coalescing ratio {len(events) / writes:.2f}), "
+              f"{correct(table, expected)}/{len(expected)} tickets in their latest state")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+A synthetic support-channel corpus with known near-duplicates, for checking
+the conversation de-duplication stage.
+
+Every original question may get copies of the kinds seen in practice:
+cross-posts to another channel, bumps, re-pasted error logs with new
+timestamps and request IDs, and lightly edited reposts. Distinct questions
+share vocabulary and log templates, so they are hard negatives.
+"""
+import random
+
+TOPICS = [
+    ("auth", ["api key", "jwt", "aud claim", "token refresh", "oauth scope", "signing secret"]),
+    ("pagination", ["cursor", "next page", "page size", "offset", "has_more flag", "limit parameter"]),
+    ("sdk", ["python sdk", "node sdk", "install", "import error", "client constructor", "retry option"]),
+    ("webhooks", ["signature header", "retry policy", "event type", "delivery log", "endpoint secret", "timeout"]),
+    ("rate limits", ["429 response", "burst limit", "retry-after header", "quota", "per minute", "backoff"]),
+]
+VERBS = ["returns", "rejects", "ignores", "breaks on", "times out with", "silently drops"]
+ASKS = ["Is this documented anywhere?", "What am I missing?", "Any idea why?", "Is this a bug?",
+        "The docs page does not mention this.", "Has anyone seen this before?"]
+# Words for each question's own details, so distinct questions are not near-duplicates by construction.
+DETAILS = ("account region staging deploy docker lambda kubernetes proxy firewall tenant invoice customer "
+           "order refund webhook batch export import report dashboard schema migration field nested array "
+           "string boolean timezone locale currency upload download cache session cookie browser mobile "
+           "android ios react django rails flask spring golang rust java kotlin swift terraform helm").split()
+ERRORS = ["InvalidRequestError", "AuthenticationError", "TimeoutError", "ValidationError", "ConnectionResetError"]
+
+
+def _question(rng, topic, terms):
+    a, b = rng.sample(terms, 2)
+    details = " ".join(rng.sample(DETAILS, 6))
+    return (f"When I use the {a} with the {b} the {topic} endpoint {rng.choice(VERBS)} my request "
+            f"after {rng.randint(2, 30)} calls in production. Setup: {details}. {rng.choice(ASKS)}")
+
+
+def _error_log(rng, error):
+    lines = [f"{rng.randint(10, 23)}:{rng.randint(10, 59)}:{rng.randint(10, 59)}.{rng.randint(100, 999)} "
+             f"ERROR request_id={rng.getrandbits(64):016x} {error}: upstream returned status {rng.choice([400, 401, 500])}"]
+    lines += [f'  File "/app/client.py", line {rng.randint(10, 400)}, in {fn}' for fn in ("send", "request", "_retry")]
+    return "\n".join(lines)
+
+
+def _edit(rng, text):
+    words = text.split()
+    for _ in range(rng.randint(1, 2)):
+        words.insert(rng.randint(0, len(words)), rng.choice(["really", "still", "again", "please", "hmm"]))
+    return " ".join(words)
+
+
+def build_corpus(num_originals=200, duplicate_rate=0.4, channels=("support", "general", "sdk-help"), seed=3):
+    """
+    Returns (conversations, groups). `groups` lists, for each original, the
+    indices of it and all its near-duplicates; singletons included.
+    """
+    rng = random.Random(seed)
+    conversations, groups = [], []
+
+    def add(channel, text, threads):
+        conversations.append({
+            "channel_id": str(900 + channels.index(channel)),
+            "channel_name": channel,
+            "main_message": text,
+            "author": f"user{rng.randint(1, 80)}",
+            "message_id": str(1_000_000 + len(conversations)),
+            "quotes": [f"'{text}' - (from user{rng.randint(1, 80)})"],
+            "thread_messages": threads,
+        })
+        return len(conversations) - 1
+
+    for _ in range(num_originals):
+        topic, terms = rng.choice(TOPICS)
+        text = _question(rng, topic, terms)
+        error = rng.choice(ERRORS)
+        with_log = rng.random() < 0.5
+        if with_log:
+            text = f"{text}\n{_error_log(rng, error)}"
+        threads = [f"Same here with the {rng.choice(terms)}."] if rng.random() < 0.5 else []
+        channel = rng.choice(channels)
+        group = [add(channel, text, threads)]
+
+        if rng.random() < duplicate_rate:
+            for kind in rng.sample(["cross-post", "bump", "log", "edit"], rng.randint(1, 3)):
+                if kind == "cross-post":
+                    group.append(add(rng.choice([c for c in channels if c != channel]), text, []))
+                elif kind == "bump":
+                    group.append(add(channel, f"bump {text}", threads))
+                elif kind == "log" and with_log:
+                    group.append(add(channel, text.split("\n")[0] + "\n" + _error_log(rng, error), []))
+                elif kind == "edit":
+                    group.append(add(channel, _edit(rng, text), threads))
+        groups.append(group)
+
+    order = list(range(len(conversations)))
+    rng.shuffle(order)
+    position = {old: new for new, old in enumerate(order)}
+    return [conversations[i] for i in order], [sorted(position[i] for i in group) for group in groups]
@@ -0,0 +1,116 @@
+"""
+A minimal in-process fake of the Discord REST endpoints used by ingestion.
+
+Serves `/channels/{id}` and `/channels/{id}/messages` with `limit`/`before`
+pagination over synthetic history, with optional per-request latency.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def build_history(num_channels, messages_per_channel, num_threads, replies_per_thread, span_days=7):
+    """
+    Returns (channels, threads) where each maps an ID to its messages, newest first.
+    Threads are attached to evenly spaced top-level messages.
+    """
+    now = datetime.now(timezone.utc)
+    channels, threads = {}, {}
+    total_messages = num_channels * messages_per_channel
+    thread_every = max(1, total_messages // num_threads) if num_threads else 0
+    next_id = 1_000_000
+    counter = 0
+
+    for c in range(num_channels):
+        channel_id = str(900 + c)
+        messages = []
+        for m in range(messages_per_channel):
+            next_id += 1
+            age = timedelta(seconds=span_days * 86400 * (messages_per_channel - m) / (messages_per_channel + 1))
+            msg = {
+                "id": str(next_id),
+                "timestamp": (now - age).isoformat().replace('+00:00', 'Z'),
+                "content": f"message {next_id} in channel {channel_id}",
+                "author": {"username": f"user{m % 50}", "bot": m % 17 == 0},
+            }
+            if thread_every and counter % thread_every == 0 and len(threads) < num_threads:
+                thread_id = str(5_000_000 + len(threads))
+                msg["thread"] = {"id": thread_id}
+                threads[thread_id] = [
+                    {"id": str(next_id * 100 + r), "content": f"reply {r}", "author": {"username": f"helper{r}"}}
+                    for r in range(replies_per_thread)
+                ][::-1]
+            counter += 1
+            messages.append(msg)
+        channels[channel_id] = messages[::-1]
+    return channels, threads
+
+
+class FakeDiscord:
+    def __init__(self, channels, threads, latency=0.0):
+        self.channels = channels
+        self.threads = threads
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def page(self, history, query):
+        limit = int(query.get("limit", ["50"])[0])
+        before = query.get("before", [None])[0]
+        start = 0
+        if before is not None:
+            start = next((i for i, m in enumerate(history) if int(m["id"]) < int(before)), len(history))
+        return history[start:start + limit]
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                parsed = urlparse(self.path)
+                parts = [p for p in parsed.path.split('/') if p]
+                query = parse_qs(parsed.query)
+                status, body = 404, {"message": "Unknown Channel"}
+                if len(parts) >= 2 and parts[-2] == "channels":
+                    if parts[-1] in fake.channels:
+                        status, body = 200, {"id": parts[-1], "name": f"channel-{parts[-1]}"}
+                elif len(parts) >= 3 and parts[-1] == "messages":
+                    history = fake.channels.get(parts[-2], fake.threads.get(parts[-2]))
+                    if history is not None:
+                        status, body = 200, fake.page(history, query)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
@@ -0,0 +1,146 @@
+"""
+A minimal in-process fake of the Linear GraphQL endpoint.
+
+Answers the single `issueCreate` and `commentCreate` mutations used by the
+handlers, aliased bulk documents of `issueCreate` calls, `issues` lookups
+filtered by `id: { in: ... }`, and aliased `issue(id:)` lookups. As in
+Linear, `issue` is non-null, so one missing issue nulls the whole `data`
+of a lookup document. Documents above `max_complexity` (at
+`create_complexity` points per call) are rejected the way Linear rejects
+them. Issues whose title contains `fail_marker` fail individually, with
+the alias in the error `path`. An `id` given to `issueCreate` is used as
+the issue's ID, and a second issue with the same ID is refused (counted in
+`duplicates`).
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ALIASED_CREATE = re.compile(r"(\w+)\s*:\s*issueCreate\s*\(\s*input\s*:\s*\$(\w+)\s*\)")
+ALIASED_LOOKUP = re.compile(r"(\w+)\s*:\s*issue\s*\(\s*id\s*:\s*\$(\w+)\s*\)")
+ISSUES_FILTER = re.compile(r"\bissues\s*\(")
+
+
+class FakeLinear:
+    def __init__(self, latency=0.0, max_complexity=10000, create_complexity=100, fail_marker="[fail]"):
+        self.latency = latency
+        self.max_complexity = max_complexity
+        self.create_complexity = create_complexity
+        self.fail_marker = fail_marker
+        self.issues = {}
+        self.comments = []
+        self.requests = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/graphql"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def create_issue(self, issue_input):
+        if self.fail_marker and self.fail_marker in issue_input.get("title", ""):
+            return None, "Argument Validation Error: title is not allowed"
+        with self._lock:
+            if issue_input.get("id") in self.issues:
+                self.duplicates += 1
+                return None, "Entity already exists: Issue"
+            number = len(self.issues) + 1
+            issue = {"identifier": f"DOC-{number}", "url": f"https://linear.app/fake/issue/DOC-{number}",
+                     **issue_input}
+            issue["id"] = issue.get("id") or str(uuid.uuid4())
+            self.issues[issue["id"]] = issue
+        return {"success": True, "issue": {k: issue[k] for k in ("id", "identifier", "url")}}, None
+
+    def execute(self, query, variables):
+        """
+        Returns (status, body) for one GraphQL request.
+        """
+        if "commentCreate" in query:
+            if variables.get("issueId") not in self.issues:
+                return 200, {"data": {"commentCreate": None},
+                             "errors": [{"message": "Entity not found: Issue", "path": ["commentCreate"]}]}
+            with self._lock:
+                self.comments.append(variables)
+            return 200, {"data": {"commentCreate": {"success": True}}}
+
+        if ISSUES_FILTER.search(query):
+            ids = variables.get("ids") or []
+            nodes = [{k: self.issues[i][k] for k in ("id", "identifier", "url")} for i in ids if i in self.issues]
+            return 200, {"data": {"issues": {"nodes": nodes[:variables.get("first") or 50]}}}
+
+        lookups = ALIASED_LOOKUP.findall(query)
+        if lookups:
+            data, errors = {}, []
+            for alias, variable in lookups:
+                issue = self.issues.get(variables.get(variable))
+                data[alias] = {k: issue[k] for k in ("id", "identifier", "url")} if issue else None
+                if not issue:
+                    errors.append({"message": "Entity not found: Issue", "path": [alias]})
+            # A null non-null field propagates to the root.
+            return 200, {"data": None if errors else data, **({"errors": errors} if errors else {})}
+
+        aliased = ALIASED_CREATE.findall(query)
+        if not aliased:
+            # The single IssueCreate mutation takes the input fields as variables.
+            created, error = self.create_issue(variables)
+            if error:
+                return 200, {"data": {"issueCreate": None}, "errors": [{"message": error, "path": ["issueCreate"]}]}
+            return 200, {"data": {"issueCreate": created}}
+
+        complexity = len(aliased) * self.create_complexity
+        if complexity > self.max_complexity:
+            with self._lock:
+                self.rejected += 1
+            return 400, {"errors": [{"message": f"Query too complex: {complexity} > {self.max_complexity}",
+                                     "extensions": {"code": "QUERY_TOO_COMPLEX"}}]}
+        data, errors = {}, []
+        for alias, variable in aliased:
+            created, error = self.create_issue(variables.get(variable, {}))
+            data[alias] = created
+            if error:
+                errors.append({"message": error, "path": [alias]})
+        body = {"data": data}
+        if errors:
+            body["errors"] = errors
+        return 200, body
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                with fake._lock:
+                    fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                status, body = fake.execute(request.get("query", ""), request.get("variables") or {})
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
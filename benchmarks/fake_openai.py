@@ -0,0 +1,291 @@
+"""
+A minimal in-process fake of the OpenAI endpoints the pipeline calls:
+`/v1/embeddings` and `/v1/chat/completions`.
+
+Responses are synthetic and deterministic: embeddings hash word features
+into a unit vector, so texts sharing words are close; the issue-extraction
+prompt is answered by grouping its conversations by the first known topic
+term they mention; other chat prompts get a templated suggestion. Every
+response served can be recorded and replayed later from a JSON Lines file
+keyed by a hash of the request body, so a run can be repeated exactly or
+fed with responses captured elsewhere.
+
+With `rpm`/`tpm` set, each model gets OpenAI-style limits: continuously
+refilling request and token buckets, `x-ratelimit-*` headers on every
+response, and 429s with `retry-after-ms` when a request does not fit. A
+request is charged its prompt tokens and `max_tokens` up front; without
+`max_tokens`, its completion tokens are charged once it is answered. A
+request larger than a whole limit is admitted when the bucket is full.
+
+Point the SDK at it with `OPENAI_BASE_URL=<url>/v1`.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from shared.tokens import count_tokens  # noqa: E402
+
+# Topic terms the synthetic corpora use, mapped to the extraction prompt's categories.
+TOPIC_TERMS = {
+    "[Authentication]": ["api key", "jwt", "aud claim", "token refresh", "oauth scope", "signing secret"],
+    "[Data Formatting]": ["cursor", "next page", "page size", "offset", "has_more flag", "limit parameter"],
+    "[SDK Usage]": ["python sdk", "node sdk", "install", "import error", "client constructor", "retry option"],
+    "[API Endpoint]": ["signature header", "retry policy", "event type", "delivery log", "endpoint secret", "timeout"],
+    "[Rate Limits]": ["429 response", "burst limit", "retry-after header", "quota", "per minute", "backoff"],
+}
+CONVERSATION = re.compile(r"Conversation (\d+):\n---\n(.*?)\n---", re.S)
+WORD = re.compile(r"[a-z0-9_]+")
+
+
+def request_key(endpoint, body):
+    return hashlib.sha256(f"{endpoint}\x00{json.dumps(body, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+
+def embed_text(text, dim):
+    """
+    Hashes the words and word pairs of `text` into a unit vector of `dim` floats.
+    """
+    words = WORD.findall(text.lower())
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def extract_issues(prompt):
+    """
+    Answers the issue-extraction prompt: one issue per topic term found,
+    listing the conversations that mention it first.
+    """
+    issues = {}
+    for index, text in CONVERSATION.findall(prompt):
+        lowered = text.lower()
+        found = [(lowered.find(term), category, term) for category, terms in TOPIC_TERMS.items()
+                 for term in terms if term in lowered]
+        if not found:
+            continue
+        _, category, term = min(found)
+        summary = f"{category} Users struggle with the {term} setting."
+        issues.setdefault(summary, []).append(int(index))
+    return {"identified_issues": [{"summary": summary, "conversation_indices": indices}
+                                  for summary, indices in issues.items()]}
+
+
+def suggest(prompt):
+    insight = re.search(r"\*\*User Feedback Insight:\*\*\s*(.+)", prompt)
+    topic = insight.group(1).strip() if insight else "the reported issue"
+    return ("SUGGESTED CHANGE\n"
+            f"Add a section addressing: {topic}\n\n"
+            "BEFORE\nThe page describes the option without an example.\n\n"
+            "AFTER\nThe page shows a complete, runnable example, lists the accepted values and "
+            "explains the error returned for each invalid value.")
+
+
+class FakeOpenAI:
+    def __init__(self, latency=0.0, embedding_latency=None, dim=256, fixtures=None, rpm=None, tpm=None):
+        self.latency = latency
+        self.embedding_latency = latency if embedding_latency is None else embedding_latency
+        self.dim = dim
+        self.fixtures = {}
+        self.recorded = {}
+        self.stats = {"chat_requests": 0, "embedding_requests": 0, "embedded_texts": 0, "prompt_tokens": 0,
+                      "completion_tokens": 0, "embedding_tokens": 0, "replayed": 0, "rate_limited": 0}
+        self.rpm = rpm
+        self.tpm = tpm
+        self._limits = {}
+        self._lock = threading.Lock()
+        if fixtures:
+            self.load(fixtures)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def load(self, path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.fixtures[entry["key"]] = entry["response"]
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for key, (endpoint, response) in self.recorded.items():
+                f.write(json.dumps({"key": key, "endpoint": endpoint, "response": response}) + "\n")
+
+    def _count(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def _refilled(self, model, now):
+        limits = self._limits.setdefault(model, {"requests": float(self.rpm or 0), "tokens": float(self.tpm or 0),
+                                                 "updated": now})
+        elapsed, limits["updated"] = now - limits["updated"], now
+        for key, limit in (("requests", self.rpm), ("tokens", self.tpm)):
+            if limit:
+                limits[key] = min(limit, limits[key] + elapsed * limit / 60)
+        return limits
+
+    def rate_headers(self, model):
+        headers = {}
+        with self._lock:
+            limits = self._refilled(model, time.monotonic())
+            for key, limit in (("requests", self.rpm), ("tokens", self.tpm)):
+                if limit:
+                    available = max(0.0, limits[key])
+                    headers[f"x-ratelimit-limit-{key}"] = str(limit)
+                    headers[f"x-ratelimit-remaining-{key}"] = str(int(available))
+                    headers[f"x-ratelimit-reset-{key}"] = f"{(limit - available) * 60 / limit:.3f}s"
+        return headers
+
+    def admit(self, model, tokens):
+        """
+        Charges one request of `tokens` against `model`'s limits. Returns the
+        seconds until it would fit, or 0 when it was admitted.
+        """
+        if not self.rpm and not self.tpm:
+            return 0.0
+        with self._lock:
+            limits = self._refilled(model, time.monotonic())
+            wait = 0.0
+            for key, limit, amount in (("requests", self.rpm, 1), ("tokens", self.tpm, tokens)):
+                if limit and limits[key] < amount:
+                    wait = max(wait, (min(amount, limit) - limits[key]) * 60 / limit)
+            if wait:
+                self.stats["rate_limited"] += 1
+                return wait
+            limits["requests"] -= 1
+            limits["tokens"] -= tokens
+            return 0.0
+
+    def charge(self, model, tokens):
+        if self.tpm:
+            with self._lock:
+                self._refilled(model, time.monotonic())["tokens"] -= tokens
+
+    def embeddings(self, body):
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(count_tokens(text) for text in texts)
+        data = []
+        for i, text in enumerate(texts):
+            vector = embed_text(text, self.dim)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        self._count(embedding_requests=1, embedded_texts=len(texts), embedding_tokens=tokens)
+        return {"object": "list", "data": data, "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def chat(self, body):
+        prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+        if "identified_issues" in prompt:
+            content = json.dumps(extract_issues(prompt))
+        else:
+            content = suggest(prompt)
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(content)
+        self._count(chat_requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        return {"id": f"chatcmpl-{request_key('chat', body)[:24]}", "object": "chat.completion",
+                "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens}}
+
+    def respond(self, endpoint, body):
+        key = request_key(endpoint, body)
+        if key in self.fixtures:
+            response = self.fixtures[key]
+            usage = response.get("usage", {})
+            if endpoint == "embeddings":
+                self._count(embedding_requests=1, embedded_texts=len(response.get("data", [])),
+                            embedding_tokens=usage.get("prompt_tokens", 0), replayed=1)
+            else:
+                self._count(chat_requests=1, prompt_tokens=usage.get("prompt_tokens", 0),
+                            completion_tokens=usage.get("completion_tokens", 0), replayed=1)
+        else:
+            response = self.embeddings(body) if endpoint == "embeddings" else self.chat(body)
+        with self._lock:
+            self.recorded[key] = (endpoint, response)
+        return response
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, payload, headers):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                endpoint = self.path.rstrip("/").rsplit("/", 1)[-1]
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                model = body.get("model", "")
+                if endpoint == "embeddings":
+                    texts = body.get("input", [])
+                    tokens = sum(count_tokens(text) for text in (texts if isinstance(texts, list) else [texts]))
+                else:
+                    tokens = sum(count_tokens(str(message.get("content", ""))) for message in body.get("messages", []))
+                    tokens += body.get("max_tokens") or 0
+                wait = fake.admit(model, tokens) if endpoint in ("embeddings", "completions") else 0
+                if wait:
+                    self.send(429, {"error": {"message": f"Rate limit reached for {model}. Please try again in "
+                                                         f"{wait * 1000:.0f}ms.", "type": "requests",
+                                              "code": "rate_limit_exceeded"}},
+                              {**fake.rate_headers(model), "retry-after-ms": str(int(wait * 1000) + 1)})
+                    return
+                if endpoint == "embeddings":
+                    delay = fake.embedding_latency
+                elif endpoint == "completions":
+                    delay = fake.latency
+                else:
+                    delay = 0
+                if delay:
+                    time.sleep(delay)
+                if endpoint not in ("embeddings", "completions"):
+                    status, payload = 404, {"error": {"message": f"Unknown endpoint {self.path}"}}
+                else:
+                    status, payload = 200, fake.respond(endpoint, body)
+                    if endpoint == "completions" and not body.get("max_tokens"):
+                        fake.charge(model, payload.get("usage", {}).get("completion_tokens", 0))
+                self.send(status, payload, fake.rate_headers(model))
+
+        return Handler
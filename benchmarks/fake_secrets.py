@@ -0,0 +1,87 @@
+"""
+A minimal in-process fake of AWS Secrets Manager's `GetSecretValue` and of
+the Parameters and Secrets Lambda Extension's `/secretsmanager/get`
+endpoint, serving one secret with optional per-request latency.
+
+Point boto3 at it with `AWS_ENDPOINT_URL_SECRETS_MANAGER=<url>` and the
+extension backend with `SECRETS_EXTENSION_ENDPOINT=<url>`.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeSecrets:
+    def __init__(self, secrets, secret_id="bench-secret", latency=0.0):
+        self.secret_string = json.dumps(secrets)
+        self.secret_id = secret_id
+        self.latency = latency
+        self.requests = {"secretsmanager": 0, "extension": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def value(self, secret_id):
+        if secret_id != self.secret_id:
+            return 400, {"__type": "ResourceNotFoundException", "Message": f"Secret {secret_id} not found"}
+        return 200, {"ARN": f"arn:aws:secretsmanager:us-east-1:000000000000:secret:{secret_id}",
+                     "Name": secret_id, "SecretString": self.secret_string, "VersionId": "v1"}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                # The extension API.
+                with fake._lock:
+                    fake.requests["extension"] += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                parsed = urlparse(self.path)
+                if parsed.path != "/secretsmanager/get" or "X-Aws-Parameters-Secrets-Token" not in self.headers:
+                    return self._send(403, {"message": "missing token"}, "application/json")
+                status, body = fake.value(parse_qs(parsed.query).get("secretId", [""])[0])
+                self._send(status, body, "application/json")
+
+            def do_POST(self):
+                # The Secrets Manager JSON protocol.
+                with fake._lock:
+                    fake.requests["secretsmanager"] += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.headers.get("X-Amz-Target") != "secretsmanager.GetSecretValue":
+                    return self._send(400, {"__type": "InvalidAction"}, "application/x-amz-json-1.1")
+                status, body = fake.value(request.get("SecretId"))
+                self._send(status, body, "application/x-amz-json-1.1")
+
+        return Handler
@@ -0,0 +1,480 @@
+"""
+Runs a Step Functions workflow of this repo end to end in one process,
+against local fakes of Discord, OpenAI, Linear and AWS (moto), and reports
+per-stage wall time, peak RSS, state sizes, API calls and tokens.
+
+States are interpreted from `statemachine/*.asl.json` with the
+`DefinitionSubstitutions` and `Handler`s of `template.yaml`, so the run
+follows the deployed definition: `InputPath`, `ItemsPath`, `ResultPath`
+(merged into the raw state input, or discarded when null) and
+`OutputPath`, Map states with their `MaxConcurrency`, and a JSON round
+trip at every Lambda boundary. Retry, Catch, Choice and Parameters are
+not used by the workflows and are not supported.
+
+`--scale 1` is one week of the usual traffic (WEEKLY_ORIGINALS questions
+plus near-duplicate reposts); `--scale 10` ten times that, and so on.
+
+Executions start with `{"run_id": ...}`, as the scheduled rule does.
+`--interrupt "STATE[:N]"` fails the execution at the N-th invocation of
+the state (a path like `Process Each Insight/Create Linear Ticket` inside a
+Map), then starts a second execution with the same run ID against the same
+fakes and reports what that one cost under `resumed`. With `--checkpoints`
+step results are checkpointed to a directory, so the second execution
+resumes instead of starting over.
+
+Usage:
+    python benchmarks/local_runner.py --scale 1 --workflow map --report /tmp/run.json
+    python benchmarks/local_runner.py --scale 1 --record /tmp/openai.jsonl
+    python benchmarks/local_runner.py --scale 1 --replay /tmp/openai.jsonl
+    python benchmarks/local_runner.py --scale 10 --openai-rpm 60 --openai-tpm 200000
+    python benchmarks/local_runner.py --interrupt "Process Each Insight/Create Linear Ticket:3" --checkpoints
+"""
+import argparse
+import importlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import yaml
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dedup_corpus import build_corpus  # noqa: E402
+from fake_discord import FakeDiscord  # noqa: E402
+from fake_linear import FakeLinear  # noqa: E402
+from fake_openai import FakeOpenAI, TOPIC_TERMS  # noqa: E402
+
+# Distinct questions in a typical week, before cross-posts and bumps.
+WEEKLY_ORIGINALS = 300
+# Step Functions rejects state payloads above 256KB.
+STATE_LIMIT_BYTES = 256 * 1024
+WORKFLOWS = {
+    "map": ("statemachine/workflow.asl.json", "DocInsightStateMachine"),
+    "batch": ("statemachine/workflow_batch.asl.json", "DocInsightBatchStateMachine"),
+}
+_RESULT_PATH_ABSENT = object()
+
+
+class Interrupted(RuntimeError):
+    pass
+
+
+class Interrupter:
+    """
+    Fails the N-th invocation of one state, given as `"STATE[:N]"`, and every
+    invocation after it, the way a failed execution stops running new steps.
+    """
+
+    def __init__(self, spec):
+        state, _, count = spec.rpartition(":")
+        self.state, self.count = (state, int(count)) if count.isdigit() else (spec, 1)
+        self.seen = 0
+        self.tripped = None
+        self.lock = threading.Lock()
+
+    def check(self, path):
+        with self.lock:
+            if not self.tripped and path == self.state:
+                self.seen += 1
+                if self.seen == self.count:
+                    self.tripped = path
+            if self.tripped:
+                raise Interrupted(f"Execution interrupted at '{self.tripped}'")
+
+
+class _CloudFormationLoader(yaml.SafeLoader):
+    pass
+
+
+def _tag(loader, suffix, node):
+    if isinstance(node, yaml.ScalarNode):
+        return {suffix: loader.construct_scalar(node)}
+    if isinstance(node, yaml.SequenceNode):
+        return {suffix: loader.construct_sequence(node, deep=True)}
+    return {suffix: loader.construct_mapping(node, deep=True)}
+
+
+_CloudFormationLoader.add_multi_constructor("!", _tag)
+
+
+def load_template(path=os.path.join(ROOT, "template.yaml")):
+    with open(path, encoding="utf-8") as f:
+        return yaml.load(f, Loader=_CloudFormationLoader)
+
+
+def resolve_resources(template, state_machine):
+    """
+    Maps each `${...}` substitution of the state machine to the handler of
+    the function it points at, e.g. `"${FindDocsFunctionArn}"` ->
+    `"handlers.find_docs.handler"`.
+    """
+    resources = template["Resources"]
+    substitutions = resources[state_machine]["Properties"]["DefinitionSubstitutions"]
+    handlers = {}
+    for name, value in substitutions.items():
+        function = value["GetAtt"].split(".")[0]
+        handlers[f"${{{name}}}"] = resources[function]["Properties"]["Handler"]
+    return handlers
+
+
+def template_environment(template):
+    """
+    Returns the literal (non-reference) global environment variables of the template.
+    """
+    variables = template.get("Globals", {}).get("Function", {}).get("Environment", {}).get("Variables", {})
+    return {name: str(value) for name, value in variables.items() if isinstance(value, (str, int, float))}
+
+
+def get_path(data, path):
+    if path in (None, "$"):
+        return data
+    for part in path[2:].split("."):
+        data = data[part]
+    return data
+
+
+def set_path(data, path, value):
+    """
+    Returns `data` with `value` placed at `path`, copying the dicts on the way.
+    """
+    if path == "$":
+        return value
+    parts = path[2:].split(".")
+    result = dict(data)
+    node = result
+    for part in parts[:-1]:
+        node[part] = dict(node.get(part, {}))
+        node = node[part]
+    node[parts[-1]] = value
+    return result
+
+
+class StageMetrics:
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, output_bytes, **extra):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"invocations": 0, "seconds": 0.0, "max_state_bytes": 0})
+            stage["invocations"] += 1
+            stage["seconds"] += seconds
+            stage["max_state_bytes"] = max(stage["max_state_bytes"], output_bytes)
+            stage.update(extra)
+
+
+class StateMachine:
+    """
+    Interprets an ASL definition, invoking each Task's handler in process.
+    """
+
+    def __init__(self, definition, handlers, metrics=None, prefix="", interrupter=None):
+        self.definition = definition
+        self.handlers = handlers
+        self.metrics = metrics or StageMetrics()
+        self.prefix = prefix
+        self.interrupter = interrupter
+
+    def _function(self, resource_name):
+        module, function = self.handlers[resource_name].rsplit(".", 1)
+        return getattr(importlib.import_module(module), function)
+
+    def _invoke(self, name, state, payload):
+        function = self._function(state["Resource"])
+        if self.interrupter:
+            self.interrupter.check(f"{self.prefix}{name}")
+        context = SimpleNamespace(function_name=name, aws_request_id=str(uuid.uuid4()),
+                                  get_remaining_time_in_millis=lambda: 300_000)
+        # Lambda receives and returns JSON, never shared Python objects.
+        return json.loads(json.dumps(function(json.loads(json.dumps(payload)), context)))
+
+    def _run_map(self, name, state, payload):
+        items = get_path(payload, state.get("ItemsPath", "$"))
+        iterator = state.get("ItemProcessor") or state["Iterator"]
+        branch = StateMachine(iterator, self.handlers, self.metrics, prefix=f"{self.prefix}{name}/",
+                              interrupter=self.interrupter)
+        workers = state.get("MaxConcurrency") or len(items) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(branch.execute, items))
+
+    def execute(self, payload):
+        name = self.definition["StartAt"]
+        while True:
+            state = self.definition["States"][name]
+            unsupported = {"Retry", "Catch", "Parameters", "ItemSelector", "ResultSelector"} & set(state)
+            if state["Type"] not in ("Task", "Map") or unsupported:
+                raise NotImplementedError(f"State '{name}' uses {state['Type']} {sorted(unsupported)}")
+
+            start = time.perf_counter()
+            effective = get_path(payload, state.get("InputPath", "$"))
+            if state["Type"] == "Task":
+                result = self._invoke(name, state, effective)
+            else:
+                result = self._run_map(name, state, effective)
+            result_path = state.get("ResultPath", _RESULT_PATH_ABSENT)
+            if result_path is None:
+                output = payload
+            else:
+                output = set_path(payload, "$" if result_path is _RESULT_PATH_ABSENT else result_path, result)
+            output = get_path(output, state.get("OutputPath", "$"))
+            size = len(json.dumps(output).encode("utf-8"))
+            self.metrics.record(f"{self.prefix}{name}", time.perf_counter() - start, size,
+                                peak_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1))
+            if size > STATE_LIMIT_BYTES:
+                raise RuntimeError(f"State '{name}' output is {size} bytes, over the 256KB Step Functions limit.")
+
+            payload = output
+            if state.get("End"):
+                return payload
+            name = state["Next"]
+
+
+class ApiCounter:
+    """
+    Counts AWS API calls made through boto3, per service and operation.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, model, **kwargs):
+        key = f"{model.service_model.service_name}:{model.name}"
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def install(self):
+        import boto3
+        boto3.setup_default_session()
+        boto3.DEFAULT_SESSION.events.register("before-call", self)
+
+
+class MetricsCollector:
+    """
+    Aggregates the EMF documents the instrumented handlers emit, per stage
+    and per channel, in place of writing them to stdout.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, document):
+        with self.lock:
+            stage = self.stages.setdefault(document["Stage"], {
+                "invocations": 0, "errors": 0, "duration_ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+                "estimated_cost": 0.0, "dependencies": {}})
+            if "Dependency" in document:
+                dependency = stage["dependencies"].setdefault(
+                    document["Dependency"], {"calls": 0, "errors": 0, "retries": 0, "duration_ms": 0.0})
+                for key, name in (("calls", "Calls"), ("errors", "Errors"), ("retries", "Retries"),
+                                  ("duration_ms", "Duration")):
+                    dependency[key] = round(dependency[key] + document[name], 3)
+            elif "Channel" in document:
+                channel = self.channels.setdefault(document["Channel"], {
+                    "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "estimated_cost": 0.0})
+                for key, name in (("calls", "Calls"), ("prompt_tokens", "PromptTokens"),
+                                  ("completion_tokens", "CompletionTokens"), ("estimated_cost", "EstimatedCost")):
+                    channel[key] = round(channel[key] + document[name], 6)
+            elif "Model" not in document:
+                stage["invocations"] += 1
+                for key, name in (("errors", "Errors"), ("duration_ms", "Duration"),
+                                  ("prompt_tokens", "PromptTokens"), ("completion_tokens", "CompletionTokens"),
+                                  ("estimated_cost", "EstimatedCost")):
+                    stage[key] = round(stage[key] + document[name], 6)
+
+
+def weekly_history(scale, seed=11):
+    """
+    Builds Discord history for `scale` weeks of traffic, newest message
+    first per channel, from the near-duplicate support corpus.
+    Returns (channels, threads, channel_ids).
+    """
+    conversations, _ = build_corpus(num_originals=int(WEEKLY_ORIGINALS * scale), seed=seed)
+    now = datetime.now(timezone.utc)
+    channel_ids = {}
+    channels, threads = {}, {}
+    for i, conv in enumerate(conversations):
+        channel_id = channel_ids.setdefault(conv["channel_name"], str(900 + len(channel_ids)))
+        message_id = 1_000_000 + i
+        age = timedelta(days=6 * (len(conversations) - i) / (len(conversations) + 1))
+        message = {"id": str(message_id), "timestamp": (now - age).isoformat().replace("+00:00", "Z"),
+                   "content": conv["main_message"], "author": {"username": conv["author"], "bot": False}}
+        if conv["thread_messages"]:
+            thread_id = str(5_000_000 + i)
+            message["thread"] = {"id": thread_id}
+            threads[thread_id] = [{"id": f"{message_id}{r:03d}", "content": text, "author": {"username": f"helper{r}"}}
+                                  for r, text in enumerate(conv["thread_messages"])][::-1]
+        channels.setdefault(channel_id, []).append(message)
+    return {cid: messages[::-1] for cid, messages in channels.items()}, threads, list(channel_ids.values())
+
+
+def docs_export(path):
+    """
+    Writes a sitemap export with one documentation page per topic term.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for category, terms in TOPIC_TERMS.items():
+            for term in terms:
+                slug = term.replace(" ", "-").replace("_", "-")
+                text = (f"# Configuring the {term}\n\nThe {term} setting controls how requests are handled. "
+                        f"{category[1:-1]} guides cover it in detail.\n\n## Examples\n\nSet the {term} when "
+                        f"creating the client. An invalid {term} returns an error describing the accepted values.\n")
+                f.write(json.dumps({"url": f"https://docs.example.com/{slug}", "text": text}) + "\n")
+
+
+def run(scale=1.0, workflow="map", latency=0.0, openai_latency=None, record=None, replay=None, workdir=None,
+        openai_rpm=None, openai_tpm=None, interrupt=None, checkpoints=False, run_id=None):
+    """
+    Runs one workflow execution at `scale` weeks of traffic and returns the
+    report. With `interrupt`, the execution is failed there and started
+    again with the same run ID.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="pipeline-run-")
+    template = load_template()
+    definition_path, state_machine = WORKFLOWS[workflow]
+    with open(os.path.join(ROOT, definition_path), encoding="utf-8") as f:
+        definition = json.load(f)
+
+    channels, threads, channel_ids = weekly_history(scale)
+    with ExitStack() as stack:
+        discord = stack.enter_context(FakeDiscord(channels, threads, latency=latency))
+        openai_fake = stack.enter_context(FakeOpenAI(
+            latency=latency if openai_latency is None else openai_latency, fixtures=replay, rpm=openai_rpm,
+            tpm=openai_tpm))
+        linear = stack.enter_context(FakeLinear(latency=latency, fail_marker=None))
+
+        os.environ.update(template_environment(template))
+        os.environ.update({
+            "AWS_SAM_LOCAL": "true", "AWS_DEFAULT_REGION": "us-east-1", "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "DISCORD_BOT_TOKEN": "local", "DISCORD_CHANNEL_IDS": ",".join(channel_ids),
+            "DISCORD_API_BASE": discord.url, "OPENAI_API_KEY": "local", "OPENAI_BASE_URL": openai_fake.url,
+            "LINEAR_API_KEY": "local", "LINEAR_API_URL": linear.url, "LINEAR_PROJECT_ID": "project",
+            "LINEAR_TEAM_ID": "team", "DYNAMODB_TABLE": "local-tickets", "PAYLOAD_BUCKET": "local-payloads",
+            "VECTOR_BACKEND": "local", "LOCAL_VECTOR_INDEX_PATH": os.path.join(workdir, "docs-index"),
+        })
+        for name in ("EMBEDDING_CACHE_TABLE", "EMBEDDING_CACHE_BUCKET", "LLM_CACHE_TABLE",
+                     "INGESTION_STATE_TABLE", "INGESTION_STATE_FILE", "SECRETS_ARN", "WEBHOOK_QUEUE_URL",
+                     "CHECKPOINT_TABLE", "CHECKPOINT_BUCKET", "CHECKPOINT_DIR"):
+            os.environ.pop(name, None)
+        os.environ["INGESTION_STATE_FILE"] = os.path.join(workdir, "ingestion-state.json")
+        if checkpoints:
+            os.environ["CHECKPOINT_DIR"] = os.path.join(workdir, "checkpoints")
+
+        from moto import mock_aws
+        stack.enter_context(mock_aws())
+        aws = ApiCounter()
+        aws.install()
+        import boto3
+        boto3.resource("dynamodb").create_table(
+            TableName="local-tickets", BillingMode="PAY_PER_REQUEST",
+            KeySchema=[{"AttributeName": "ticket_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "ticket_id", "AttributeType": "S"}])
+        boto3.client("s3").create_bucket(Bucket="local-payloads")
+
+        export_path = os.path.join(workdir, "docs.jsonl")
+        docs_export(export_path)
+        from handlers import index_docs
+        index_docs.handler({"export_path": export_path, "backend": "local",
+                            "manifest_path": os.path.join(workdir, "docs-manifest.json")}, None)
+        setup_openai = dict(openai_fake.stats)
+        from shared import metrics
+        collector = MetricsCollector()
+        metrics.set_sink(collector)
+
+        handlers = resolve_resources(template, state_machine)
+        execution_input = {"run_id": run_id or datetime.now(timezone.utc).isoformat()}
+        machine = StateMachine(definition, handlers, interrupter=Interrupter(interrupt) if interrupt else None)
+        start = time.perf_counter()
+        resumed = None
+        try:
+            output = machine.execute(execution_input)
+        except Interrupted:
+            before = {"seconds": time.perf_counter(), "discord": discord.requests, "linear": linear.requests,
+                      "openai": dict(openai_fake.stats), "aws": dict(aws.calls)}
+            output = StateMachine(definition, handlers, machine.metrics).execute(execution_input)
+            openai_delta = {key: value - before["openai"].get(key, 0) for key, value in openai_fake.stats.items()}
+            resumed = {
+                "seconds": round(time.perf_counter() - before["seconds"], 3),
+                "api_calls": {"discord": discord.requests - before["discord"],
+                              "openai_chat": openai_delta["chat_requests"],
+                              "openai_embeddings": openai_delta["embedding_requests"],
+                              "linear": linear.requests - before["linear"],
+                              "aws": {key: count - before["aws"].get(key, 0) for key, count in sorted(aws.calls.items())
+                                      if count > before["aws"].get(key, 0)}},
+                "tokens": {key: openai_delta[key] for key in ("prompt_tokens", "completion_tokens",
+                                                              "embedding_tokens")},
+            }
+        elapsed = time.perf_counter() - start
+
+        if record:
+            openai_fake.save(record)
+        openai_stats = {key: value - setup_openai.get(key, 0) for key, value in openai_fake.stats.items()}
+        aws_calls = dict(sorted(aws.calls.items()))
+        stored = boto3.resource("dynamodb").Table("local-tickets").scan(Select="COUNT")["Count"]
+        return {
+            "workflow": workflow,
+            "scale": scale,
+            "messages": sum(len(messages) for messages in channels.values()),
+            "threads": len(threads),
+            "seconds": round(elapsed, 3),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "stages": {name: {**stage, "seconds": round(stage["seconds"], 3)}
+                       for name, stage in machine.metrics.stages.items()},
+            "api_calls": {"discord": discord.requests, "openai_chat": openai_stats["chat_requests"],
+                          "openai_embeddings": openai_stats["embedding_requests"], "linear": linear.requests,
+                          "aws": aws_calls},
+            "tokens": {key: openai_stats[key] for key in ("prompt_tokens", "completion_tokens", "embedding_tokens")},
+            "openai_rate_limited": openai_stats["rate_limited"],
+            "tickets_created": len(linear.issues),
+            "duplicate_creates_refused": linear.duplicates,
+            "tickets_stored": stored,
+            "output_bytes": len(json.dumps(output).encode("utf-8")),
+            "metrics": {"stages": collector.stages, "channels": collector.channels},
+            **({"interrupted_at": machine.interrupter.tripped, "resumed": resumed} if resumed else {}),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiple of one week's traffic.")
+    parser.add_argument("--workflow", choices=sorted(WORKFLOWS), default="map")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency per fake API request.")
+    parser.add_argument("--openai-latency", type=float, default=None,
+                        help="Seconds per OpenAI request, if different from --latency.")
+    parser.add_argument("--openai-rpm", type=int, help="Requests per minute the fake OpenAI allows per model.")
+    parser.add_argument("--openai-tpm", type=int, help="Tokens per minute the fake OpenAI allows per model.")
+    parser.add_argument("--record", help="Write every OpenAI response served to this JSON Lines file.")
+    parser.add_argument("--replay", help="Serve OpenAI responses recorded in this JSON Lines file.")
+    parser.add_argument("--report", help="Write the report to this JSON file instead of stdout.")
+    parser.add_argument("--run-id", help="Run ID of the execution (default: the current time).")
+    parser.add_argument("--interrupt", metavar="STATE[:N]",
+                        help="Fail the execution at the N-th invocation of STATE, then run it again.")
+    parser.add_argument("--checkpoints", action="store_true", help="Checkpoint step results to the work directory.")
+    args = parser.parse_args()
+
+    report = run(args.scale, args.workflow, args.latency, args.openai_latency, args.record, args.replay,
+                 openai_rpm=args.openai_rpm, openai_tpm=args.openai_tpm, interrupt=args.interrupt,
+                 checkpoints=args.checkpoints, run_id=args.run_id)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
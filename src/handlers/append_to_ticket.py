@@ -0,0 +1,116 @@
+import os
+import base64
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from shared import metrics, checkpoints
+from shared.utils import get_secret
+from shared.payloads import iter_records
+from handlers.create_linear_ticket import comment_on_ticket
+from handlers.store_in_dynamodb import get_table
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def build_comment(event):
+    """
+    Returns the Markdown comment that adds a recurrence's quotes to its ticket.
+    """
+    quotes = event.get('quotes', [])
+    return f"""
+**Recurring in Discord**
+{len(quotes)} new quotes in the `{event.get('channel_name', 'N/A')}` channel match this ticket (similarity {event.get('similarity', 'N/A')}):
+*{event.get('summary', 'N/A')}*
+
+> {"\n> ".join(quotes)}
+    """
+
+
+def record_recurrence(table, event):
+    """
+    Updates the ticket's stored centroid and size and counts the recurrence.
+    Only these attributes are written, so a status set by the webhook stays.
+    The ticket keeps the hash of the last recurrence it counted, so recording
+    the same cluster again (a retried step or run) changes nothing. Returns
+    whether the recurrence was counted.
+    """
+    marker = checkpoints.content_hash({k: v for k, v in event.items() if k != "run_id"})
+    try:
+        table.update_item(
+            Key={"ticket_id": event['ticket']['ticket_id']},
+            UpdateExpression=("SET centroid = :c, cluster_size = :n, last_seen = :t, last_recurrence = :m "
+                              "ADD recurrences :one, quote_count :q"),
+            ConditionExpression="attribute_exists(ticket_id) AND "
+                                "(attribute_not_exists(last_recurrence) OR last_recurrence <> :m)",
+            ExpressionAttributeValues={
+                # The encoded centroid is base64 of the stored float32 bytes.
+                ":c": base64.b64decode(event['centroid']),
+                ":n": event['cluster_size'],
+                ":t": datetime.now(timezone.utc).isoformat(),
+                ":m": marker,
+                ":one": 1,
+                ":q": len(event.get('quotes', []))
+            }
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        logger.info(f"Recurrence for ticket {event['ticket'].get('ticket_identifier')} "
+                    "was already counted or the ticket is no longer stored.")
+        return False
+    return True
+
+
+@metrics.instrument()
+@checkpoints.checkpointed()
+def handler(event, context):
+    """
+    Cheap path for clusters that match an open ticket: takes `{"matched": [...]}`
+    from `cluster_insights`, comments the new quotes on each ticket and then
+    updates its centroid and counts in DynamoDB. Skips docs search, suggestion
+    and ticket creation entirely. A failure is logged per ticket instead of
+    failing the run. Within a run (`run_id`), each ticket is checkpointed as
+    soon as its comment is posted, so a re-run never comments twice; it
+    still records the recurrence, which counts a cluster only once.
+    """
+    matched = list(iter_records(event, 'matched'))
+    logger.info(f"Appending quotes to {len(matched)} existing tickets...")
+    if not matched:
+        return {"appended": 0, "failed": 0, "ticket_identifiers": []}
+
+    LINEAR_API_KEY = get_secret("LINEAR_API_KEY")
+    if not LINEAR_API_KEY:
+        raise ValueError("Missing Linear API key.")
+    table = get_table()
+    run_id = checkpoints.run_id_of(event)
+
+    def append(item):
+        key = checkpoints.stage_key(run_id, "append_to_ticket.item", item) if run_id else None
+        try:
+            if key and checkpoints.load_checkpoint(key):
+                logger.info(f"Ticket {item['ticket'].get('ticket_identifier')} was already commented on in this run.")
+            else:
+                comment_on_ticket(item['ticket']['ticket_id'], build_comment(item), LINEAR_API_KEY)
+                if key:
+                    checkpoints.save_checkpoint(key, {"ticket_id": item['ticket']['ticket_id']})
+            record_recurrence(table, item)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to append to ticket {item['ticket'].get('ticket_identifier')}: {e}")
+            return False
+
+    concurrency = int(os.environ.get("LINEAR_CONCURRENCY", "4"))
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(matched))) as executor:
+        outcomes = list(executor.map(append, matched))
+    if not all(outcomes):
+        checkpoints.mark_incomplete(f"{len(outcomes) - sum(outcomes)} tickets failed")
+
+    return {
+        "appended": sum(outcomes),
+        "failed": len(outcomes) - sum(outcomes),
+        "ticket_identifiers": [item['ticket'].get('ticket_identifier') for item, ok in zip(matched, outcomes) if ok]
+    }
@@ -1,15 +1,29 @@
+import os
 import json
-import openai
-import numpy as np
-from sklearn.cluster import DBSCAN
-from collections import defaultdict
+import time
+from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
-from shared.utils import get_secrets
+from shared import metrics, checkpoints
+from shared.openai_client import EXTRACTION, get_openai_gateway
+from shared.tokens import count_tokens
+from shared.batching import plan_batches
+from shared.embeddings import get_embedding_cache
+from shared.dedup import collapse_near_duplicates, DEFAULT_THRESHOLD as DEFAULT_DEDUP_THRESHOLD
+from shared.clustering import cluster_embeddings, medoid_index, centroid, DEFAULT_EPS, DEFAULT_MIN_SAMPLES
+from shared.payloads import InlineBudget, detach_field, iter_records, spill, spill_items
+from shared.watermarks import get_watermark_store
+from shared.ticket_memory import (get_ticket_memory, encode_centroid, decode_centroid, merge_centroids,
+                                  DEFAULT_MATCH_THRESHOLD)
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+EXTRACTION_MODEL = "gpt-4-turbo-preview"
+# Prompt tokens per extraction call: the 128k context minus room for the JSON response.
+EXTRACTION_TOKEN_BUDGET = 100_000
+
 def is_issue_significant(cluster_info, min_conversations=3):
     """
     Scores an issue cluster to determine if it's worth creating a ticket for.
@@ -32,20 +46,254 @@ def is_issue_significant(cluster_info, min_conversations=3):
     return False
 
 
+def format_conversation(conv):
+    """
+    Returns the text of a conversation as it appears in the extraction prompt.
+    """
+    return conv['main_message'] + "\n" + "\n".join(conv['thread_messages'])
+
+
+def build_extraction_prompt(channel_names, conversation_texts):
+    """
+    Formats a batch of conversation texts into the issue-extraction prompt.
+    """
+    formatted_convos = [
+        f"Conversation {i}:\n---\n{full_text}\n---" for i, full_text in enumerate(conversation_texts)]
+    channel_label = ", ".join(f"'{name}'" for name in channel_names)
+    channel_noun = "channel" if len(channel_names) == 1 else "channels"
+
+    batch_prompt = f"""
+    You are an expert developer support analyst. Your task is to identify recurring issues from conversations in the {channel_label} {channel_noun} and categorize them.
+
+    Analyze all conversations and identify distinct user problems related to our documentation. For each problem, provide a concise, normalized summary.
+
+    You MUST use one of the following categories as a prefix for your summary:
+    - [Authentication]: For issues related to API keys, JWT, OAuth, signing requests.
+    - [API Endpoint]: For problems with a specific endpoint (e.g., parameters, response format, errors).
+    - [SDK Usage]: For questions about our SDKs (e.g., installation, methods, examples).
+    - [Data Formatting]: For confusion about data types, pagination, or object structures.
+    - [Rate Limits]: For questions about API usage limits.
+    - [Conceptual]: For high-level questions about how a feature works.
+    - [General]: For issues that do not fit the other categories.
+
+    Your response MUST be a valid JSON object with a single key "identified_issues", which is an array of objects. Each object must have:
+    - "summary": The normalized summary, prefixed with a category (e.g., "[Authentication] Users are confused about the JWT 'aud' claim.").
+    - "conversation_indices": A list of integer indexes for all conversations that relate to this summary.
+
+    Example Response:
+    {{
+      "identified_issues": [
+        {{
+          "summary": "[Authentication] Users are consistently confused about the correct value for the 'aud' claim in JWT.",
+          "conversation_indices": [0, 5, 12]
+        }},
+        {{
+          "summary": "[API Endpoint] Developers are requesting clearer documentation on pagination for the /v2/accounts endpoint.",
+          "conversation_indices": [2, 8]
+        }}
+      ]
+    }}
+
+    Here are the conversations:
+
+    {"\n\n".join(formatted_convos)}
+    """
+    return batch_prompt
+
+
+def extract_batch_issues(gateway, batch, timeout=None, deadline=None):
+    """
+    Makes the LLM call for one batch and maps the identified issues back to the
+    quotes of the conversations they reference. An issue spanning several
+    channels is attributed to the channel most of its conversations came from.
+    Returns the issues and the completion's token usage.
+    """
+    logger.info(
+        f"Processing batch for channels {batch.channels} ({len(batch)} conversations, ~{batch.tokens} tokens)")
+    batch_prompt = build_extraction_prompt(batch.channels, batch.texts)
+
+    # The call's cost is split across its channels by their share of the conversation text.
+    channel_chars = Counter()
+    for conv, text in zip(batch.conversations, batch.texts):
+        channel_chars[conv['channel_name']] += len(text)
+    response = gateway.chat(
+        [{"role": "user", "content": batch_prompt}],
+        EXTRACTION_MODEL,
+        priority=EXTRACTION,
+        channels=dict(channel_chars),
+        response_format={"type": "json_object"},
+        timeout=timeout,
+        deadline=deadline
+    )
+
+    result = json.loads(response.choices[0].message.content)
+
+    issues = []
+    for issue in result.get("identified_issues", []):
+        all_quotes = []
+        channel_counts = Counter()
+        for index in issue['conversation_indices']:
+            if index < len(batch.conversations):
+                conv = batch.conversations[index]
+                all_quotes.extend(conv['quotes'])
+                channel_counts[conv['channel_name']] += 1
+
+        # most_common keeps first-seen order on ties.
+        channel_name = channel_counts.most_common(1)[0][0] if channel_counts else batch.channels[0]
+        issues.append({
+            "summary": issue['summary'],
+            "original_quotes": all_quotes,
+            "channel_name": channel_name
+        })
+
+    usage = getattr(response, "usage", None)
+    usage = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0
+    }
+    return issues, usage
+
+
+def _extract_or_log(gateway, batch, timeout, deadline):
+    try:
+        return extract_batch_issues(gateway, batch, timeout, deadline)
+    except Exception as e:
+        logger.error(
+            f"Error processing batch for channels {batch.channels}: {e}")
+        return [], None
+
+
+def extract_issues(gateway, conversations_by_channel, concurrency=1, timeout=None,
+                   token_budget=EXTRACTION_TOKEN_BUDGET, deadline=None):
+    """
+    Plans token-bounded batches over all channels and runs the extraction call
+    for each, concurrently when `concurrency` > 1. Each call and its retries
+    must finish by `deadline` (a `time.monotonic()` value). A failing batch
+    contributes no issues but does not affect the others; the IDs of every
+    channel it held are listed in the metrics' `failed_channels`. Results are
+    always concatenated in batch order, so the output matches the sequential path.
+    Returns the extracted issues and a dict of run metrics.
+    """
+    preamble_tokens = count_tokens(build_extraction_prompt(list(conversations_by_channel), []), EXTRACTION_MODEL)
+    batches = plan_batches(conversations_by_channel, token_budget - preamble_tokens,
+                           format_conversation, EXTRACTION_MODEL)
+
+    if concurrency <= 1 or len(batches) <= 1:
+        results = [_extract_or_log(gateway, batch, timeout, deadline) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as executor:
+            results = list(executor.map(lambda batch: _extract_or_log(gateway, batch, timeout, deadline), batches))
+
+    # A merged batch fails for all of its channels, so all of them need another run.
+    failed_channels = sorted({conv['channel_id'] for batch, (_, usage) in zip(batches, results) if usage is None
+                              for conv in batch.conversations})
+
+    run_metrics = {
+        "channels": len(conversations_by_channel),
+        "conversations": sum(len(batch) for batch in batches),
+        "chunks": len(batches),
+        "failed_chunks": sum(1 for _, usage in results if usage is None),
+        "failed_channels": failed_channels,
+        "estimated_prompt_tokens": sum(batch.tokens + preamble_tokens for batch in batches),
+        "prompt_tokens": sum(usage["prompt_tokens"] for _, usage in results if usage),
+        "completion_tokens": sum(usage["completion_tokens"] for _, usage in results if usage)
+    }
+
+    extracted_issues = []
+    for batch_issues, _ in results:
+        extracted_issues.extend(batch_issues)
+    return extracted_issues, run_metrics
+
+
+def match_existing_tickets(clusters, memory, threshold=DEFAULT_MATCH_THRESHOLD):
+    """
+    Splits clusters into those that repeat an open ticket's issue (centroid similarity
+    at or above `threshold`) and new ones. Clusters matching the same ticket
+    are merged into one append payload carrying the ticket, the new quotes
+    and the ticket's updated centroid and size.
+    Returns the unmatched clusters and the append payloads.
+    """
+    if memory is None or not len(memory) or not clusters:
+        return clusters, []
+
+    matches = memory.match([decode_centroid(cluster['centroid']) for cluster in clusters], threshold)
+    unmatched, by_ticket = [], {}
+    for cluster, match in zip(clusters, matches):
+        if match is None:
+            unmatched.append(cluster)
+            continue
+        position, similarity = match
+        ticket = memory.tickets[position]
+        logger.info(f"Cluster '{cluster['summary'][:80]}' matches open ticket "
+                    f"{ticket['ticket_identifier']} (similarity {similarity:.3f}).")
+        by_ticket.setdefault(position, []).append((cluster, similarity))
+
+    appended = []
+    for position, matched in by_ticket.items():
+        ticket, stored = memory.tickets[position], memory.matrix[position]
+        sizes = [ticket['cluster_size']] + [cluster['cluster_size'] for cluster, _ in matched]
+        merged = merge_centroids([stored] + [decode_centroid(cluster['centroid']) for cluster, _ in matched], sizes)
+        appended.append({
+            "summary": matched[0][0]['summary'],
+            "quotes": [quote for cluster, _ in matched for quote in cluster['quotes']],
+            "channel_name": matched[0][0]['channel_name'],
+            "similarity": round(max(similarity for _, similarity in matched), 4),
+            "ticket": {key: ticket[key] for key in ("ticket_id", "ticket_identifier", "ticket_url")},
+            "centroid": encode_centroid(merged),
+            "cluster_size": sum(sizes)
+        })
+    return unmatched, appended
+
+
+def withdraw_watermarks(watermarks, channel_ids):
+    """
+    Drops the watermarks ingestion staged for `channel_ids`, so committing
+    the run leaves those channels where they were and the next run reads
+    their messages again.
+    """
+    store = get_watermark_store() if watermarks else None
+    if not store:
+        return
+    for channel_id in set(channel_ids) & set(watermarks["channels"]):
+        store.withdraw(channel_id, watermarks["stage"])
+
+
+def extraction_deadline(context):
+    """
+    Returns the `time.monotonic()` value by which extraction must finish:
+    the invocation's remaining time less `EXTRACTION_RESERVE_SECONDS`
+    (default 30) for embedding, clustering and matching. None without a
+    Lambda context.
+    """
+    remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining is None:
+        return None
+    reserve = float(os.environ.get("EXTRACTION_RESERVE_SECONDS", "30"))
+    return time.monotonic() + remaining() / 1000 - reserve
+
+
+@metrics.instrument()
+@checkpoints.checkpointed(carry_run_id=True)
 def handler(event, context):
     """
     Takes conversations, groups them by channel, and uses a batch LLM call per channel
     to identify trends. It then clusters these trends to create final insights.
     """
     logger.info("Starting batched insight clustering by channel...")
-    secrets = get_secrets()
 
-    client = openai.OpenAI(api_key=secrets.get("OPENAI_API_KEY"))
-
-    conversations = event.get("conversations", [])
+    conversations = list(iter_records(event, "conversations"))
     if not conversations:
         logger.info("No conversations to process.")
-        return {"clusters": []}
+        return {"clusters": [], "matched": [], "failed_channels": []}
+    gateway = get_openai_gateway()
+
+    # Cross-posts, bumps and re-pasted logs are collapsed before any tokens are spent on them.
+    dedup_report = None
+    if os.environ.get("DEDUP_CONVERSATIONS", "true").lower() == "true":
+        threshold = float(os.environ.get("DEDUP_THRESHOLD", DEFAULT_DEDUP_THRESHOLD))
+        conversations, dedup_report = collapse_near_duplicates(
+            conversations, format_conversation, threshold, EXTRACTION_MODEL)
+        logger.info(f"Near-duplicate filter: {json.dumps(dedup_report)}")
 
     conversations_by_channel = defaultdict(list)
     for conv in conversations:
@@ -54,130 +302,93 @@ def handler(event, context):
     logger.info(
         f"Grouped conversations into {len(conversations_by_channel)} channels.")
 
-    extracted_issues = []
-    for channel_name, channel_convos in conversations_by_channel.items():
-        logger.info(
-            f"Processing batch for channel: {channel_name} ({len(channel_convos)} conversations)")
-
-        formatted_convos = []
-        for i, conv in enumerate(channel_convos):
-            full_text = conv['main_message'] + "\n" + \
-                "\n".join(conv['thread_messages'])
-            formatted_convos.append(
-                f"Conversation {i}:\n---\n{full_text}\n---")
-
-        batch_prompt = f"""
-        You are an expert developer support analyst. Your task is to identify recurring issues from conversations in the '{channel_name}' channel and categorize them.
-
-        Analyze all conversations and identify distinct user problems related to our documentation. For each problem, provide a concise, normalized summary.
-
-        You MUST use one of the following categories as a prefix for your summary:
-        - [Authentication]: For issues related to API keys, JWT, OAuth, signing requests.
-        - [API Endpoint]: For problems with a specific endpoint (e.g., parameters, response format, errors).
-        - [SDK Usage]: For questions about our SDKs (e.g., installation, methods, examples).
-        - [Data Formatting]: For confusion about data types, pagination, or object structures.
-        - [Rate Limits]: For questions about API usage limits.
-        - [Conceptual]: For high-level questions about how a feature works.
-        - [General]: For issues that do not fit the other categories.
-
-        Your response MUST be a valid JSON object with a single key "identified_issues", which is an array of objects. Each object must have:
-        - "summary": The normalized summary, prefixed with a category (e.g., "[Authentication] Users are confused about the JWT 'aud' claim.").
-        - "conversation_indices": A list of integer indexes for all conversations that relate to this summary.
-
-        Example Response:
-        {{
-          "identified_issues": [
-            {{
-              "summary": "[Authentication] Users are consistently confused about the correct value for the 'aud' claim in JWT.",
-              "conversation_indices": [0, 5, 12]
-            }},
-            {{
-              "summary": "[API Endpoint] Developers are requesting clearer documentation on pagination for the /v2/accounts endpoint.",
-              "conversation_indices": [2, 8]
-            }}
-          ]
-        }}
-
-        Here are the conversations:
-
-        {"\n\n".join(formatted_convos)}
-        """
-
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[{"role": "user", "content": batch_prompt}],
-                response_format={"type": "json_object"}
-            )
-
-            result = json.loads(response.choices[0].message.content)
-
-            for issue in result.get("identified_issues", []):
-                all_quotes = []
-                for index in issue['conversation_indices']:
-                    if index < len(channel_convos):
-                        all_quotes.extend(channel_convos[index]['quotes'])
-
-                extracted_issues.append({
-                    "summary": issue['summary'],
-                    "original_quotes": all_quotes,
-                    "channel_name": channel_name
-                })
-        except Exception as e:
-            logger.error(
-                f"Error processing batch for channel {channel_name}: {e}")
-            continue
+    concurrency = int(os.environ.get("EXTRACTION_CONCURRENCY", "4"))
+    timeout = float(os.environ.get("EXTRACTION_TIMEOUT_SECONDS", "120"))
+    token_budget = int(os.environ.get("EXTRACTION_TOKEN_BUDGET", EXTRACTION_TOKEN_BUDGET))
+    extracted_issues, run_metrics = extract_issues(
+        gateway, conversations_by_channel, concurrency, timeout, token_budget, extraction_deadline(context))
+    if dedup_report:
+        run_metrics["duplicates_removed"] = dedup_report["removed"]
+        run_metrics["estimated_tokens_saved"] = dedup_report["estimated_tokens_saved"]
+    logger.info(f"Extraction metrics: {json.dumps(run_metrics)}")
+
+    failed_channels = run_metrics["failed_channels"]
+    if failed_channels:
+        logger.warning(f"Extraction failed for channels {failed_channels}; their conversations need another run.")
+        checkpoints.mark_incomplete(f"extraction failed for {len(failed_channels)} channels")
+        withdraw_watermarks(event.get("watermarks"), failed_channels)
 
     if not extracted_issues:
         logger.info(
             "LLM did not identify any actionable issues in any channel.")
-        return {"clusters": []}
+        return {"clusters": [], "matched": [], "failed_channels": failed_channels}
 
     logger.info(f"Embedding {len(extracted_issues)} identified issues...")
     summaries = [issue['summary'] for issue in extracted_issues]
 
-    response = client.embeddings.create(
-        input=summaries,
-        model="text-embedding-3-small"
-    )
-    embeddings = [item.embedding for item in response.data]
+    embedding_cache = get_embedding_cache()
+    embeddings = embedding_cache.embed(gateway, summaries)
+    logger.info(f"Embedding cache metrics: {json.dumps(embedding_cache.metrics())}")
 
     logger.info("Clustering embeddings to consolidate final insights...")
-    clustering = DBSCAN(eps=0.25, min_samples=2,
-                        metric="cosine").fit(embeddings)
-    labels = clustering.labels_
+    eps = float(os.environ.get("CLUSTER_EPS", DEFAULT_EPS))
+    min_samples = int(os.environ.get("CLUSTER_MIN_SAMPLES", DEFAULT_MIN_SAMPLES))
+    labels = cluster_embeddings(embeddings, eps, min_samples)
 
-    final_clusters = []
-    unique_labels = set(labels)
-    for label in unique_labels:
-        if label == -1:
-            continue
+    members_by_label = defaultdict(list)
+    for index, label in enumerate(labels):
+        if label != -1:
+            members_by_label[label].append(index)
 
-        cluster_indices = np.where(labels == label)[0]
+    final_clusters = []
+    for label, cluster_indices in sorted(members_by_label.items()):
         cluster_issues = [extracted_issues[i] for i in cluster_indices]
 
         all_quotes = []
         for issue in cluster_issues:
             all_quotes.extend(issue['original_quotes'])
 
-        final_summary = cluster_issues[0]['summary']
+        # The medoid is the summary closest to all the others in the cluster.
+        representative = extracted_issues[medoid_index(embeddings, cluster_indices)]
 
         final_clusters.append({
-            "summary": final_summary,
+            "summary": representative['summary'],
             "quotes": all_quotes,
-            "channel_name": cluster_issues[0]['channel_name']
+            "channel_name": representative['channel_name'],
+            "centroid": encode_centroid(centroid(embeddings, cluster_indices)),
+            "cluster_size": len(cluster_indices)
         })
 
     logger.info(
         f"Filtering {len(final_clusters)} clusters for significance...")
 
-    significant_clusters = []
+    # Minor clusters are dropped before matching, so they neither become
+    # tickets nor comment on existing ones.
+    significant = []
     for cluster in final_clusters:
         if is_issue_significant(cluster):
-            significant_clusters.append(cluster)
+            significant.append(cluster)
         else:
             logger.info(f"Discarding minor issue: {cluster['summary']}")
 
+    # Recurring issues go to the cheap append path instead of becoming new tickets.
+    threshold = float(os.environ.get("TICKET_MATCH_THRESHOLD", DEFAULT_MATCH_THRESHOLD))
+    significant_clusters, matched = match_existing_tickets(significant, get_ticket_memory(), threshold)
+    logger.info(f"{len(significant) - len(significant_clusters)} clusters matched {len(matched)} open tickets.")
+
     logger.info(
         f"Generated {len(significant_clusters)} significant insights worth creating tickets for.")
-    return {"clusters": significant_clusters}
+    # Each Map iteration checkpoints under the run, so every insight carries its run_id.
+    run_id = checkpoints.run_id_of(event)
+    if run_id:
+        significant_clusters = [{**cluster, "run_id": run_id} for cluster in significant_clusters]
+    # Only `store_in_dynamodb` reads the centroid (~8KB each), so the docs, suggestion
+    # and ticket steps pass a small `centroid_ref` instead.
+    significant_clusters = detach_field("clusters", significant_clusters, "centroid")
+    # The result lands next to this step's input, so both spills share what is left of the state.
+    # The Map iterates over small stubs when the clusters are spilled to S3.
+    budget = InlineBudget(state=event)
+    return {**spill_items("clusters", significant_clusters,
+                          keep=("summary", "channel_name", "cluster_size", "run_id"), budget=budget),
+            **spill("matched", matched, budget=budget),
+            "failed_channels": failed_channels}
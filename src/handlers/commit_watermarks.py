@@ -0,0 +1,28 @@
+import logging
+
+from shared import metrics
+from shared.watermarks import get_watermark_store
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+@metrics.instrument()
+def handler(event, context):
+    """
+    Last step of the workflow: promotes the watermarks `ingest_discord`
+    staged under the run (`{"watermarks": {"stage", "channels"}}`), now that
+    every step before it has succeeded. Channels whose extraction failed were
+    withdrawn by `cluster_insights` and keep their previous watermark.
+    Promoting again is harmless, so the step is not checkpointed.
+    """
+    watermarks = event.get("watermarks")
+    store = get_watermark_store()
+    if not watermarks or not store:
+        logger.info("No staged watermarks to commit.")
+        return {"committed": 0, "skipped": 0}
+
+    committed = [channel_id for channel_id in watermarks["channels"]
+                 if store.promote(channel_id, watermarks["stage"])]
+    logger.info(f"Committed watermarks for {len(committed)} of {len(watermarks['channels'])} channels.")
+    return {"committed": len(committed), "skipped": len(watermarks["channels"]) - len(committed)}
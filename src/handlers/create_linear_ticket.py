@@ -1,21 +1,98 @@
 import os
 import json
+import uuid
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from shared.utils import get_secrets
+from shared import metrics, checkpoints
+from shared.utils import get_secret, get_secrets_provider
+from shared.llm_cache import normalize_text
+from shared.http_client import RateLimitedClient
+from shared.payloads import iter_records, resolve_item, spill
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+LINEAR_API_URL = os.environ.get("LINEAR_API_URL", "https://api.linear.app/graphql")
 
-def handler(event, context):
+# Created once per container so warm invocations reuse the keep-alive connection.
+# A 401 drops the cached secrets, so a rotated API key is picked up on the next read.
+http_client = RateLimitedClient(pool_size=4, name="linear", on_unauthorized=get_secrets_provider().invalidate)
+
+# Linear rejects a single query above 10,000 complexity points. The cost of one
+# issueCreate is estimated conservatively; a rejected document is split anyway.
+LINEAR_MAX_QUERY_COMPLEXITY = 10000
+ISSUE_CREATE_COMPLEXITY = 250
+
+ISSUE_CREATE_MUTATION = """
+    mutation IssueCreate($id: String, $title: String!, $description: String!, $projectId: String!, $teamId: String!) {
+      issueCreate(input: {
+        id: $id,
+        title: $title,
+        description: $description,
+        projectId: $projectId,
+        teamId: $teamId
+      }) {
+        success
+        issue {
+          id
+          identifier
+          url
+        }
+      }
+    }
     """
-    Creates a ticket in the Linear Triage project with all the collected information.
+
+# `issue(id:)` is non-null, so one missing issue would null every aliased
+# lookup in a document; the `issues` filter just leaves it out of `nodes`.
+ISSUES_LOOKUP_QUERY = """
+    query FindIssues($ids: [ID!], $first: Int) {
+      issues(first: $first, filter: { id: { in: $ids } }) {
+        nodes {
+          id
+          identifier
+          url
+        }
+      }
+    }
     """
-    logger.info("Creating Linear ticket...")
-    secrets = get_secrets()
-    LINEAR_API_KEY = secrets.get("LINEAR_API_KEY")
+
+COMMENT_CREATE_MUTATION = """
+    mutation CommentCreate($issueId: String!, $body: String!) {
+      commentCreate(input: { issueId: $issueId, body: $body }) {
+        success
+      }
+    }
+    """
+
+
+def insight_hash(event):
+    """
+    Identifies an insight by its normalized summary, channel and quotes, so
+    the same insight maps to the same ticket however often it is processed.
+    """
+    return checkpoints.content_hash({
+        "summary": normalize_text(event.get('summary')),
+        "channel_name": event.get('channel_name'),
+        "quotes": sorted({normalize_text(quote) for quote in event.get('quotes', [])}),
+    })
+
+
+def issue_id_for(key):
+    """
+    The Linear issue ID (a UUID v4) derived from an insight hash. Linear
+    refuses a second issue with the same ID, so a retried create cannot
+    duplicate the ticket.
+    """
+    return str(uuid.UUID(hex=key[:32], version=4))
+
+
+def _linear_config():
+    """
+    Returns the Linear API key, project ID and team ID, raising if any is missing.
+    """
+    LINEAR_API_KEY = get_secret("LINEAR_API_KEY")
     LINEAR_PROJECT_ID = os.environ.get("LINEAR_PROJECT_ID")
     LINEAR_TEAM_ID = os.environ.get("LINEAR_TEAM_ID")
 
@@ -23,10 +100,26 @@ def handler(event, context):
         logger.error(
             "Missing one or more Linear environment variables: API Key, Project ID, or Team ID.")
         raise ValueError("Missing Linear environment variables.")
+    return LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID
+
+
+def suggestion_error(event):
+    """
+    Returns the error of a failed suggestion call for this insight, or None.
+    Such an insight gets no ticket in this run: `generate_suggestion` marked
+    the run incomplete, and the ticket is created once a re-run has the
+    suggestion, since a checkpointed ticket is never updated.
+    """
+    return (event.get('suggestion') or {}).get('suggestion_error')
+
 
+def build_ticket_content(event):
+    """
+    Returns the title and Markdown description of the ticket for one insight.
+    """
     doc = event.get('documentation', {})
-    suggestion = event.get('suggestion', {}).get(
-        'llm_suggestion', 'No suggestion provided.')
+    # Insights whose suggestion call failed never get here (see `suggestion_error`).
+    suggestion = event.get('suggestion', {}).get('llm_suggestion') or 'No suggestion provided.'
 
     # The 'insight' data is now at the top level of the event.
     title = f"Doc Improvement: {event.get('summary', 'Untitled Issue')[:80]}"
@@ -47,25 +140,209 @@ The following change is recommended to address the user feedback:
 ---
 {suggestion}
     """
-    query = """
-    mutation IssueCreate($title: String!, $description: String!, $projectId: String!, $teamId: String!) {
-      issueCreate(input: {
-        title: $title,
-        description: $description,
-        projectId: $projectId,
-        teamId: $teamId
-      }) {
-        success
-        issue {
-          id
-          identifier
-          url
-        }
-      }
-    }
+    return title, description
+
+
+def build_bulk_mutation(count):
+    """
+    Returns one GraphQL document with `count` aliased `issueCreate` calls,
+    `i0` ... `i<count-1>`, each taking its own `$input<n>` variable.
+    """
+    params = ", ".join(f"$input{i}: IssueCreateInput!" for i in range(count))
+    calls = "\n".join(
+        f"      i{i}: issueCreate(input: $input{i}) {{ success issue {{ id identifier url }} }}" for i in range(count))
+    return f"    mutation BulkIssueCreate({params}) {{\n{calls}\n    }}\n"
+
+
+def _is_complexity_error(error):
+    message = str(error.get("message", "")).lower()
+    code = str(error.get("extensions", {}).get("code", "")).lower()
+    return "complex" in message or "complex" in code
+
+
+def _bulk_chunk_size():
+    per_document = max(1, LINEAR_MAX_QUERY_COMPLEXITY // ISSUE_CREATE_COMPLEXITY)
+    return max(1, min(int(os.environ.get("LINEAR_BULK_SIZE", "25")), per_document))
+
+
+def find_tickets(issue_ids, LINEAR_API_KEY):
+    """
+    Looks up issues by ID and returns a ticket, or None when the issue does
+    not exist or the lookup failed, for each ID in order.
+    """
+    headers = {"Authorization": LINEAR_API_KEY,
+               "Content-Type": "application/json"}
+    size = _bulk_chunk_size()
+    tickets = []
+    for start in range(0, len(issue_ids), size):
+        chunk = issue_ids[start:start + size]
+        try:
+            response = http_client.post(LINEAR_API_URL, json={
+                "query": ISSUES_LOOKUP_QUERY,
+                "variables": {"ids": chunk, "first": len(chunk)}}, headers=headers)
+            result = response.json()
+            if result.get("errors"):
+                logger.warning(f"Linear returned errors looking up {len(chunk)} issues: {result['errors']}")
+            nodes = ((result.get("data") or {}).get("issues") or {}).get("nodes") or []
+        except Exception as e:
+            logger.warning(f"Could not look up {len(chunk)} Linear issues: {e}")
+            nodes = []
+        found = {issue['id']: issue for issue in nodes}
+        for issue_id in chunk:
+            issue = found.get(issue_id)
+            tickets.append({"ticket_id": issue['id'], "ticket_identifier": issue['identifier'],
+                            "ticket_url": issue['url']} if issue else None)
+    return tickets
+
+
+def _create_chunk(events, issue_ids, LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID):
+    """
+    Sends one aliased mutation for `events` and returns a ticket or
+    `{"error": ...}` per event, in order. Errors are mapped to their insight
+    through the alias in the GraphQL error `path`. A document rejected as too
+    complex is split in half and retried.
+    """
+    variables = {}
+    for i, (event, issue_id) in enumerate(zip(events, issue_ids)):
+        title, description = build_ticket_content(event)
+        variables[f"input{i}"] = {"id": issue_id, "title": title, "description": description,
+                                  "projectId": LINEAR_PROJECT_ID, "teamId": LINEAR_TEAM_ID}
+    headers = {"Authorization": LINEAR_API_KEY,
+               "Content-Type": "application/json"}
+
+    response = http_client.post(LINEAR_API_URL,
+                                json={"query": build_bulk_mutation(len(events)), "variables": variables},
+                                headers=headers)
+    try:
+        result = response.json()
+    except ValueError:
+        result = {}
+    # GraphQL servers report validation errors with a 4xx status and an `errors` body.
+    if not isinstance(result, dict) or not ("data" in result or "errors" in result):
+        logger.error(f"HTTP {response.status_code} creating {len(events)} Linear tickets: {response.text[:500]}")
+        return [{"error": f"HTTP {response.status_code}: {response.text[:200]}"} for _ in events]
+
+    data = result.get("data") or {}
+    errors = result.get("errors", [])
+    if not data and errors and len(events) > 1 and any(_is_complexity_error(e) for e in errors):
+        half = len(events) // 2
+        logger.warning(f"Linear rejected {len(events)} issueCreate calls as too complex; splitting.")
+        return (_create_chunk(events[:half], issue_ids[:half], LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID) +
+                _create_chunk(events[half:], issue_ids[half:], LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID))
+
+    errors_by_alias, document_errors = {}, []
+    for error in errors:
+        path = error.get("path") or []
+        if path and str(path[0]).startswith("i"):
+            errors_by_alias.setdefault(path[0], []).append(error.get("message", str(error)))
+        else:
+            document_errors.append(error.get("message", str(error)))
+
+    tickets = []
+    for i in range(len(events)):
+        alias = f"i{i}"
+        created = data.get(alias) or {}
+        if created.get("success") and created.get("issue"):
+            issue = created["issue"]
+            tickets.append({
+                "ticket_id": issue['id'],
+                "ticket_identifier": issue['identifier'],
+                "ticket_url": issue['url']
+            })
+        else:
+            reason = errors_by_alias.get(alias) or document_errors or [f"issueCreate unsuccessful: {created}"]
+            logger.error(f"Failed to create Linear ticket for '{events[i].get('summary', '')[:80]}': {reason}")
+            tickets.append({"error": f"GraphQL errors: {reason}"})
+    return tickets
+
+
+def create_tickets(events, LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID):
+    """
+    Creates one Linear ticket per insight with as few requests as possible:
+    `issueCreate` calls are packed into aliased GraphQL documents of up to
+    `LINEAR_BULK_SIZE` calls, kept under Linear's per-query complexity limit,
+    and sent over the shared keep-alive client (`LINEAR_CONCURRENCY` at once).
+    Idempotent per insight, as `create_ticket`: insights with a checkpointed
+    ticket are not sent, and a failed create whose issue exists is resolved
+    to it. Insights whose suggestion failed are not sent either. Returns a
+    ticket or `{"error": ...}` for each event, in order.
     """
+    keys = [insight_hash(event) for event in events]
+    concurrency = int(os.environ.get("LINEAR_CONCURRENCY", "4"))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(keys)))) as executor:
+        tickets = list(executor.map(lambda key: checkpoints.load_checkpoint(f"ticket#{key}"), keys))
+    pending = [i for i, ticket in enumerate(tickets) if not ticket]
+    if len(pending) < len(events):
+        logger.info(f"{len(events) - len(pending)} insights already have Linear tickets; not creating them again.")
+    unsent = [i for i in pending if suggestion_error(events[i])]
+    for i in unsent:
+        tickets[i] = {"error": f"Suggestion failed: {suggestion_error(events[i])}"}
+    if unsent:
+        logger.warning(f"{len(unsent)} insights have no suggestion yet; not creating their tickets.")
+    pending = [i for i in pending if not tickets[i]]
+
+    size = _bulk_chunk_size()
+    chunks = [pending[start:start + size] for start in range(0, len(pending), size)]
+    config = (LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID)
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as executor:
+        results = list(executor.map(lambda chunk: _create_chunk(
+            [events[i] for i in chunk], [issue_id_for(keys[i]) for i in chunk], *config), chunks))
+    for i, ticket in zip(pending, [ticket for chunk in results for ticket in chunk]):
+        tickets[i] = ticket
+
+    failed = [i for i in pending if "error" in tickets[i]]
+    if failed:
+        for i, existing in zip(failed, find_tickets([issue_id_for(keys[i]) for i in failed], LINEAR_API_KEY)):
+            if existing:
+                logger.info(f"Linear ticket {existing['ticket_identifier']} was already created for this insight.")
+                tickets[i] = existing
+    for i in pending:
+        if "error" not in tickets[i]:
+            checkpoints.save_checkpoint(f"ticket#{keys[i]}", tickets[i])
+    logger.info(f"Linear HTTP stats: {http_client.stats}")
+
+    created = sum(1 for i in pending if "error" not in tickets[i])
+    logger.info(f"Created {created} of {len(pending)} Linear tickets in {len(chunks)} requests.")
+    return tickets
+
+
+def create_ticket(event, LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID):
+    """
+    Returns the ticket's ID, identifier and URL for one insight, creating it
+    unless the insight already has one. The ticket is checkpointed under the
+    insight hash, and the issue is created with an ID derived from it, so a
+    failed create whose issue exists (e.g. the checkpoint was never written)
+    is resolved to that issue instead of raising. Raises when the insight's
+    suggestion failed, so the Map iteration is retried by the next run.
+    """
+    key = insight_hash(event)
+    ticket = checkpoints.load_checkpoint(f"ticket#{key}")
+    if ticket:
+        logger.info(f"Insight already has Linear ticket {ticket['ticket_identifier']}; not creating another.")
+        return ticket
+    if suggestion_error(event):
+        raise Exception(f"Not creating a Linear ticket without a suggestion: {suggestion_error(event)}")
+
+    issue_id = issue_id_for(key)
+    try:
+        ticket = _send_issue_create(event, issue_id, LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID)
+    except Exception:
+        ticket = find_tickets([issue_id], LINEAR_API_KEY)[0]
+        if not ticket:
+            raise
+        logger.info(f"Linear ticket {ticket['ticket_identifier']} was already created for this insight.")
+    checkpoints.save_checkpoint(f"ticket#{key}", ticket)
+    return ticket
+
+
+def _send_issue_create(event, issue_id, LINEAR_API_KEY, LINEAR_PROJECT_ID, LINEAR_TEAM_ID):
+    """
+    Sends the issueCreate mutation for one insight and returns the ticket's ID, identifier and URL.
+    """
+    title, description = build_ticket_content(event)
 
     variables = {
+        "id": issue_id,
         "title": title,
         "description": description,
         "projectId": LINEAR_PROJECT_ID,
@@ -76,8 +353,9 @@ The following change is recommended to address the user feedback:
                "Content-Type": "application/json"}
 
     try:
-        response = requests.post("https://api.linear.app/graphql",
-                                 json={"query": query, "variables": variables}, headers=headers)
+        response = http_client.post(LINEAR_API_URL,
+                                    json={"query": ISSUE_CREATE_MUTATION, "variables": variables}, headers=headers)
+        logger.info(f"Linear HTTP stats: {http_client.stats}")
         response.raise_for_status()
 
         result = response.json()
@@ -104,3 +382,51 @@ The following change is recommended to address the user feedback:
         logger.error(f"HTTP Error creating Linear ticket: {e}")
         logger.error(f"Response Body: {e.response.text}")
         raise e
+
+
+def comment_on_ticket(ticket_id, body, LINEAR_API_KEY):
+    """
+    Adds a Markdown comment to an existing Linear issue.
+    """
+    headers = {"Authorization": LINEAR_API_KEY,
+               "Content-Type": "application/json"}
+    response = http_client.post(LINEAR_API_URL, json={"query": COMMENT_CREATE_MUTATION,
+                                                      "variables": {"issueId": ticket_id, "body": body}},
+                                headers=headers)
+    response.raise_for_status()
+    result = response.json()
+    if 'errors' in result or not result.get('data', {}).get('commentCreate', {}).get('success'):
+        raise Exception(f"Linear comment creation failed. Response: {result}")
+
+
+@metrics.instrument()
+@checkpoints.checkpointed()
+def handler(event, context):
+    """
+    Creates a ticket in the Linear Triage project with all the collected information.
+    """
+    logger.info("Creating Linear ticket...")
+    return create_ticket(resolve_item(event), *_linear_config())
+
+
+@metrics.instrument()
+@checkpoints.checkpointed(carry_run_id=True)
+def batch_handler(event, context):
+    """
+    Batch variant of `handler` for the batch workflow. Takes `{"clusters": [...]}`,
+    creates the tickets with bulk `issueCreate` mutations (`create_tickets`), and
+    returns the clusters with `ticket` set on each. A failed ticket is recorded
+    as `{"error": ...}` instead of failing the whole batch.
+    """
+    clusters = list(iter_records(event, 'clusters'))
+    logger.info(f"Creating {len(clusters)} Linear tickets...")
+    if not clusters:
+        return {"clusters": []}
+    tickets = create_tickets(clusters, *_linear_config())
+
+    failed = sum(1 for ticket in tickets if "error" in ticket)
+    if failed == len(tickets):
+        raise Exception(f"All {failed} Linear ticket creations failed.")
+    if failed:
+        checkpoints.mark_incomplete(f"{failed} Linear tickets failed")
+    return spill("clusters", ({**cluster, "ticket": ticket} for cluster, ticket in zip(clusters, tickets)))
@@ -5,11 +5,13 @@ import json
 import logging
 
 # We will import our existing utility function to test it directly
+from shared import metrics
 from shared.utils import get_secrets
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+@metrics.instrument()
 def handler(event, context):
     """
     A simple function to test if we can successfully read from Secrets Manager.
@@ -1,62 +1,146 @@
+import os
 import json
-import openai
-import pinecone
+import math
 import logging
+import threading
 
-from shared.utils import get_secrets
+from shared import metrics, checkpoints
+from shared.utils import get_secrets_provider
+from shared.openai_client import get_openai_gateway
+from shared.embeddings import get_embedding_cache
+from shared.vector_store import get_vector_store
+from shared.rerank import rerank, assemble_context
+from shared.payloads import iter_records, resolve_item, spill
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# The vector store lives for the life of the container, so warm invocations
+# skip client construction and the index existence check.
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+
+def get_clients():
+    """
+    Returns the shared OpenAI gateway and the vector store selected by
+    `VECTOR_BACKEND`, creating the store on first use. The gateway is looked
+    up on every call, so that a rotated OpenAI key is picked up.
+    """
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = get_vector_store(get_secrets_provider())
+    return get_openai_gateway(), _vector_store
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of `values`, or 0.0 when there are none.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def find_docs_many(summaries, quotes=None):
+    """
+    Finds the most relevant documentation for each summary. All summaries
+    are embedded in one request and searched as one batch (concurrent
+    requests for Pinecone, one matrix product locally).
+
+    With `RETRIEVAL_MODE=single` (default) each result is the metadata of the
+    best chunk. With `RETRIEVAL_MODE=rerank` the top `RETRIEVAL_TOP_K` chunks
+    are reranked by cosine similarity blended with BM25 over the summary and
+    `quotes`, and the best ones that fit `DOC_CONTEXT_TOKEN_BUDGET` are
+    returned grouped by page, with their scores. Chunks scoring below
+    `RERANK_MIN_RELATIVE_SCORE` times the best chunk are left out.
+    Returns one dict per summary, in input order; empty summaries get `{}`.
+    """
+    documentation = [{} for _ in summaries]
+    positions = [i for i, summary in enumerate(summaries) if summary]
+    if len(positions) < len(summaries):
+        logger.warning(f"{len(summaries) - len(positions)} insights are missing a 'summary'. Cannot find docs for them.")
+    if not positions:
+        return documentation
+
+    quotes = quotes or [[] for _ in summaries]
+    mode = os.environ.get("RETRIEVAL_MODE", "single").lower()
+    top_k = int(os.environ.get("RETRIEVAL_TOP_K", "8")) if mode == "rerank" else 1
+    gateway, vector_store = get_clients()
+
+    try:
+        # 1. Embed the summaries, reusing cached embeddings of identical summaries
+        embedding_cache = get_embedding_cache()
+        vectors = embedding_cache.embed(gateway, [summaries[i] for i in positions])
+        logger.info(f"Embedding cache metrics: {json.dumps(embedding_cache.metrics())}")
+
+        # 2. Query the vector store
+        latencies = []
+        results = vector_store.query_many(vectors, top_k=top_k, timings=latencies)
+    except Exception as e:
+        logger.error(f"An error occurred during vector search: {e}")
+        raise e
+
+    logger.info(json.dumps({
+        "retrieval_mode": mode,
+        "retrieval_queries": len(latencies),
+        "retrieval_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "retrieval_p95_ms": round(percentile(latencies, 95) * 1000, 1)
+    }))
+
+    token_budget = int(os.environ.get("DOC_CONTEXT_TOKEN_BUDGET", "1500"))
+    bm25_weight = float(os.environ.get("RERANK_BM25_WEIGHT", "0.3"))
+    min_relative_score = float(os.environ.get("RERANK_MIN_RELATIVE_SCORE", "0.75"))
+    for position, matches in zip(positions, results):
+        if not matches:
+            logger.warning("No relevant documentation found in the vector store.")
+        elif mode == "rerank":
+            query = " ".join([summaries[position], *quotes[position]])
+            context = assemble_context(rerank(matches, query, bm25_weight), token_budget, min_relative_score)
+            logger.info(f"Selected {len(context['chunks'])} of {len(matches)} chunks "
+                        f"({context['context_tokens']} tokens), top page: {context['url']}")
+            documentation[position] = context
+        else:
+            match = matches[0]
+            logger.info(f"Found match with score {match['score']}: {match['metadata'].get('url', 'N/A')}")
+            # Return the metadata directly, which should contain text, url, etc.
+            documentation[position] = match['metadata']
+    return documentation
+
+
+@metrics.instrument()
+@checkpoints.checkpointed()
 def handler(event, context):
     """
     Takes a clustered insight and finds the most relevant documentation page
     from the vector database.
     """
+    event = resolve_item(event)
     insight_summary = event.get('summary', '')
     if not insight_summary:
         logger.warning("Input event is missing a 'summary'. Cannot find docs.")
         return {}
 
     logger.info(f"Finding relevant docs for insight: {insight_summary[:80]}...")
-    secrets = get_secrets()
-    
-    openai_client = openai.OpenAI(api_key=secrets.get("OPENAI_API_KEY"))
-
-    pc = pinecone.Pinecone(api_key=secrets.get("PINECONE_API_KEY"))
-    index_name = secrets.get("PINECONE_INDEX_NAME")
-    
-    if index_name not in pc.list_indexes().names():
-        logger.error(f"Pinecone index '{index_name}' does not exist.")
-        raise ValueError(f"Pinecone index '{index_name}' does not exist.")
-        
-    index = pc.Index(index_name)
+    return find_docs_many([insight_summary], [event.get('quotes', [])])[0]
 
-    try:
-        # 1. Embed the insight summary using the new syntax
-        response = openai_client.embeddings.create(
-            input=[insight_summary], 
-            model="text-embedding-3-small"
-        )
-        query_vector = response.data[0].embedding
-
-        # 2. Query Pinecone
-        query_response = index.query(
-            vector=query_vector,
-            top_k=1,
-            include_metadata=True
-        )
-
-        if query_response.get('matches'):
-            match = query_response['matches'][0]
-            logger.info(f"Found match with score {match.get('score', 'N/A')}: {match.get('metadata', {}).get('url', 'N/A')}")
-            # Return the metadata directly, which should contain text, url, etc.
-            return match.get('metadata', {})
-        else:
-            logger.warning("No relevant documentation found in Pinecone.")
-            return {}
-            
-    except Exception as e:
-        logger.error(f"An error occurred during vector search: {e}")
-        raise e
\ No newline at end of file
+
+@metrics.instrument()
+@checkpoints.checkpointed(carry_run_id=True)
+def batch_handler(event, context):
+    """
+    Batch variant of `handler` for the batch workflow. Takes `{"clusters": [...]}`
+    and returns the clusters with `documentation` set on each.
+    """
+    clusters = list(iter_records(event, 'clusters'))
+    logger.info(f"Finding relevant docs for {len(clusters)} insights...")
+    if not clusters:
+        return {"clusters": []}
+
+    documentation = find_docs_many([cluster.get('summary', '') for cluster in clusters],
+                                   [cluster.get('quotes', []) for cluster in clusters])
+    return spill("clusters", ({**cluster, "documentation": doc} for cluster, doc in zip(clusters, documentation)))
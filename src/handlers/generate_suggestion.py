@@ -1,44 +1,57 @@
+import os
 import json
-import openai
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from shared.utils import get_secrets
+from shared import metrics, checkpoints
+from shared.openai_client import SUGGESTION, get_openai_gateway
+from shared.llm_cache import get_response_cache, response_cache_key, normalize_text
+from shared.tokens import truncate_to_tokens
+from shared.payloads import iter_records, resolve_item, spill
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def handler(event, context):
+SUGGESTION_MODEL = "gpt-4o"
+DEFAULT_LEASE_SECONDS = 60
+LEASE_POLL_SECONDS = 1.0
+
+
+def format_doc_context(doc, token_budget=None):
     """
-    Takes the insight and relevant doc text, and asks an LLM to generate
-    a specific, actionable documentation change.
+    Renders the documentation for the prompt. Reranked results (`chunks`)
+    are rendered page by page; a single page's `text` is cut to
+    `token_budget` tokens (`DOC_CONTEXT_TOKEN_BUDGET`).
     """
-    logger.info("Generating documentation suggestion...")
-    secrets = get_secrets()
-    
-    client = openai.OpenAI(api_key=secrets.get("OPENAI_API_KEY"))
-
-    # The Step Functions Map state passes the item as the event
-    insight = event
-    doc = event.get('documentation', {})
+    if token_budget is None:
+        token_budget = int(os.environ.get("DOC_CONTEXT_TOKEN_BUDGET", "1500"))
+    if doc.get('chunks'):
+        pages = {}
+        for chunk in doc['chunks']:
+            pages.setdefault(chunk.get('url', 'N/A'), []).append(chunk['text'])
+        return "\n\n".join(f"From page {url}:\n---\n" + "\n\n[...]\n\n".join(texts) + "\n---"
+                           for url, texts in pages.items())
+    text = doc.get('text') or 'No documentation text found.'
+    return f"From page {doc.get('url', 'N/A')}:\n---\n{truncate_to_tokens(text, token_budget, SUGGESTION_MODEL)}\n---"
 
-    if not doc or not insight:
-        logger.warning("Missing documentation or insight in the input event.")
-        return {"llm_suggestion": "Could not generate suggestion due to missing input."}
 
-    prompt = f"""
+def build_suggestion_prompt(summary, quotes, doc):
+    """
+    Formats the insight and its documentation context into the suggestion prompt.
+    """
+    return f"""
     You are an expert technical writer tasked with improving developer documentation based on user feedback.
 
     **User Feedback Insight:**
-    {insight.get('summary', 'No summary provided.')}
+    {summary or 'No summary provided.'}
 
     **Direct User Quotes:**
-    - {"\n- ".join(insight.get('quotes', []))}
+    - {"\n- ".join(quotes)}
 
-    **Existing Documentation from page {doc.get('url', 'N/A')}:**
-    ---
-    {doc.get('text', 'No documentation text found.')}
-    ---
+    **Existing Documentation:**
+    {format_doc_context(doc)}
 
     **Your Task:**
     Based on the user feedback, suggest a specific, concrete change to the documentation to resolve their confusion.
@@ -46,15 +59,176 @@ def handler(event, context):
     Format your response clearly. For example, use a "SUGGESTED CHANGE" section. If you are suggesting adding a new section, provide the full text for that section. If you are suggesting modifying existing text, show the "BEFORE" and "AFTER".
     """
 
+
+def _group_insights(insights):
+    """
+    Groups insights that share a summary and documentation page, so each
+    group needs only one LLM call. Quotes are merged in first-seen order.
+    """
+    groups = {}
+    for position, insight in enumerate(insights):
+        doc = insight.get('documentation', {})
+        group_key = (normalize_text(insight.get('summary')), doc.get('url'), normalize_text(format_doc_context(doc)))
+        group = groups.setdefault(group_key, {"positions": [], "summary": insight.get('summary'),
+                                              "channel_name": insight.get('channel_name'),
+                                              "doc": doc, "quotes": []})
+        group["positions"].append(position)
+        for quote in insight.get('quotes', []):
+            if quote not in group["quotes"]:
+                group["quotes"].append(quote)
+    return list(groups.values())
+
+
+def _await_shared(cache, shared_key, lease_seconds):
+    """
+    Waits while another invocation of the run generates the suggestion for
+    the same summary and page. Returns `(suggestion, owns_lease)`: the
+    suggestion once it is published, or None with the lease once it is free,
+    or None without it when `lease_seconds` run out.
+    """
+    deadline = time.monotonic() + lease_seconds
+    while True:
+        suggestion = cache.get(shared_key, count=False)
+        if suggestion is not None:
+            return suggestion, False
+        if cache.claim(f"{shared_key}:lease", lease_seconds):
+            return None, True
+        if time.monotonic() >= deadline:
+            return None, False
+        time.sleep(LEASE_POLL_SECONDS)
+
+
+def _suggest_for_group(gateway, group, cache, run_id=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Returns the suggestion for one group of insights, whether it came from
+    the cache, whether another invocation of the run generated it, and the
+    error when the call failed (the suggestion is then None).
+    """
+    doc = group["doc"]
+    key = response_cache_key(SUGGESTION_MODEL, summary=group["summary"], quotes=group["quotes"],
+                             doc_url=doc.get('url'), doc_text=format_doc_context(doc))
+    suggestion = cache.get(key) if cache else None
+    if suggestion is not None:
+        logger.info("Suggestion served from the response cache.")
+        return suggestion, True, False, None
+
+    # Map iterations each see one insight, so the run's insights with the same
+    # summary and page are grouped through the shared cache instead.
+    shared_key, owns_lease = None, False
+    if cache and run_id:
+        shared_key = response_cache_key(SUGGESTION_MODEL, run_id=run_id, summary=group["summary"],
+                                        doc_url=doc.get('url'), doc_text=format_doc_context(doc))
+        suggestion, owns_lease = _await_shared(cache, shared_key, lease_seconds)
+        if suggestion is not None:
+            logger.info("Suggestion shared by another insight of this run.")
+            return suggestion, False, True, None
+
+    prompt = build_suggestion_prompt(group["summary"], group["quotes"], doc)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}]
-        )
+        response = gateway.chat([{"role": "user", "content": prompt}], SUGGESTION_MODEL,
+                                priority=SUGGESTION, channels=group["channel_name"])
         suggestion = response.choices[0].message.content.strip()
-        
+        if cache:
+            cache.put(key, suggestion)
+            if shared_key:
+                cache.put(shared_key, suggestion)
         logger.info("Suggestion generated successfully.")
-        return {"llm_suggestion": suggestion}
+        return suggestion, False, False, None
     except Exception as e:
+        # The gateway has already retried; the error stays out of the ticket text and the cache.
         logger.error(f"Error calling OpenAI to generate suggestion: {e}")
-        return {"llm_suggestion": f"Failed to generate suggestion: {e}"}
\ No newline at end of file
+        return None, False, False, f"{e.__class__.__name__}: {e}"
+    finally:
+        if owns_lease:
+            cache.release(f"{shared_key}:lease")
+
+
+def generate_suggestions(gateway, insights, cache=None, concurrency=1, run_id=None):
+    """
+    Returns one suggestion payload per insight, in input order. Insights with
+    the same summary and documentation page share a single call, and responses
+    are served from `cache` when the normalized prompt inputs were seen before.
+    With a `run_id`, the call is also shared with other invocations of the run
+    through `cache`: the first takes a lease (`SUGGESTION_LEASE_SECONDS`,
+    default 60) and the others wait for its suggestion. Up to `concurrency`
+    calls run at once. Each payload flags `cache_hit`, and `deduplicated` when
+    it reused another insight's call in this run. A failed call leaves
+    `llm_suggestion` None and sets `suggestion_error`, and keeps the step from
+    being checkpointed so a re-run retries it.
+    """
+    groups = _group_insights(insights)
+    lease_seconds = float(os.environ.get("SUGGESTION_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+
+    def suggest(group):
+        return _suggest_for_group(gateway, group, cache, run_id, lease_seconds)
+
+    if concurrency <= 1 or len(groups) <= 1:
+        outcomes = [suggest(group) for group in groups]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(groups))) as executor:
+            outcomes = list(executor.map(suggest, groups))
+
+    results = [None] * len(insights)
+    for group, (suggestion, cache_hit, shared, error) in zip(groups, outcomes):
+        for i, position in enumerate(group["positions"]):
+            results[position] = {"llm_suggestion": suggestion, "cache_hit": cache_hit,
+                                 "deduplicated": shared or i > 0}
+            if error:
+                results[position]["suggestion_error"] = error
+    failed = sum(1 for *_, error in outcomes if error)
+    if failed:
+        checkpoints.mark_incomplete(f"{failed} suggestion calls failed")
+    return results
+
+
+@metrics.instrument()
+@checkpoints.checkpointed()
+def handler(event, context):
+    """
+    Takes the insight and relevant doc text, and asks an LLM to generate
+    a specific, actionable documentation change.
+    """
+    logger.info("Generating documentation suggestion...")
+
+    # The Step Functions Map state passes the item as the event
+    insight = resolve_item(event)
+    doc = insight.get('documentation', {})
+
+    if not doc or not insight:
+        logger.warning("Missing documentation or insight in the input event.")
+        return {"llm_suggestion": "Could not generate suggestion due to missing input."}
+
+    cache = get_response_cache()
+    result = generate_suggestions(get_openai_gateway(), [insight], cache, run_id=checkpoints.run_id_of(event))[0]
+    logger.info(f"LLM response cache stats: {json.dumps(cache.stats)}")
+    return result
+
+
+@metrics.instrument()
+@checkpoints.checkpointed(carry_run_id=True)
+def batch_handler(event, context):
+    """
+    Batch variant of `handler` for the batch workflow. Takes `{"clusters": [...]}`
+    (each with `documentation` set), runs the suggestion calls concurrently,
+    and returns the clusters with `suggestion` set on each.
+    """
+    clusters = list(iter_records(event, 'clusters'))
+    logger.info(f"Generating documentation suggestions for {len(clusters)} insights...")
+    if not clusters:
+        return {"clusters": []}
+
+    gateway = get_openai_gateway()
+
+    ready = [i for i, cluster in enumerate(clusters) if cluster.get('documentation')]
+    suggestions = [{"llm_suggestion": "Could not generate suggestion due to missing input."} for _ in clusters]
+    if len(ready) < len(clusters):
+        logger.warning(f"{len(clusters) - len(ready)} insights are missing documentation.")
+
+    cache = get_response_cache()
+    concurrency = int(os.environ.get("SUGGESTION_CONCURRENCY", "5"))
+    generated = generate_suggestions(gateway, [clusters[i] for i in ready], cache, concurrency)
+    for position, suggestion in zip(ready, generated):
+        suggestions[position] = suggestion
+    logger.info(f"LLM response cache stats: {json.dumps(cache.stats)}")
+
+    return spill("clusters", ({**cluster, "suggestion": suggestion} for cluster, suggestion in zip(clusters, suggestions)))
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import logging
+
+import boto3
+
+from shared import metrics
+from shared.utils import get_secrets_provider
+from shared.openai_client import get_openai_gateway
+from shared.tokens import count_tokens
+from shared.chunking import chunk_text, chunk_id, content_hash, html_to_text
+from shared.vector_store import get_vector_store
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+DOC_EXTENSIONS = {".md", ".mdx", ".markdown", ".txt", ".html", ".htm"}
+# Per-request limits for the embeddings API, with headroom.
+EMBED_BATCH_SIZE = 512
+EMBED_BATCH_TOKENS = 250_000
+
+
+def _split_s3_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def read_text(path):
+    """
+    Reads a local file or an `s3://bucket/key` object as text.
+    """
+    if path.startswith("s3://"):
+        bucket, key = _split_s3_uri(path)
+        return boto3.client('s3').get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def write_text(path, text):
+    if path.startswith("s3://"):
+        bucket, key = _split_s3_uri(path)
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=text.encode("utf-8"))
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path):
+    """
+    Returns the `{url: [chunk_id, ...]}` map from the previous run, or `{}`.
+    """
+    try:
+        return json.loads(read_text(path))
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return {}
+        raise
+
+
+def crawl_directory(docs_dir, base_url):
+    """
+    Yields `(url, text)` for every documentation file under `docs_dir`.
+    URLs are `base_url` plus the relative path without its extension.
+    """
+    for root, dirs, files in os.walk(docs_dir):
+        dirs.sort()
+        for name in sorted(files):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() not in DOC_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(os.path.join(root, stem), docs_dir).replace(os.sep, "/")
+            if relative == "index" or relative.endswith("/index"):
+                relative = relative[:-len("index")].rstrip("/")
+            text = read_text(path)
+            if extension.lower() in (".html", ".htm"):
+                text = html_to_text(text)
+            yield f"{base_url.rstrip('/')}/{relative}", text
+
+
+def read_export(export_path):
+    """
+    Yields `(url, text)` from a sitemap export: a JSON array or JSON Lines of
+    objects with `url` and one of `text`, `content` or `html`.
+    """
+    raw = read_text(export_path).strip()
+    records = json.loads(raw) if raw.startswith("[") else [json.loads(line) for line in raw.splitlines() if line.strip()]
+    for record in records:
+        if record.get("html") and not (record.get("text") or record.get("content")):
+            yield record["url"], html_to_text(record["html"])
+        else:
+            yield record["url"], record.get("text") or record.get("content") or ""
+
+
+def _embedding_batches(chunks):
+    batch, batch_tokens = [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk["text"], EMBEDDING_MODEL)
+        if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_tokens + tokens > EMBED_BATCH_TOKENS):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def index_pages(pages, vector_store, gateway, manifest, max_tokens):
+    """
+    Chunks every page and syncs the vector store with the result: only chunks
+    whose content hash is new are embedded and upserted, and chunks that no
+    longer exist (edited or deleted pages) are removed.
+    Returns the new manifest and a report of what was done.
+    """
+    new_manifest = {}
+    chunks = {}
+    for url, text in pages:
+        ids = []
+        for piece in chunk_text(text, max_tokens):
+            piece_id = chunk_id(url, piece)
+            if piece_id not in chunks:
+                chunks[piece_id] = {"id": piece_id, "url": url, "text": piece}
+                ids.append(piece_id)
+        new_manifest[url] = ids
+
+    existing = {piece_id for ids in manifest.values() for piece_id in ids}
+    to_embed = [chunk for piece_id, chunk in chunks.items() if piece_id not in existing]
+    to_delete = sorted(existing - set(chunks))
+
+    records = []
+    for batch in _embedding_batches(to_embed):
+        response = gateway.embed([chunk["text"] for chunk in batch], EMBEDDING_MODEL)
+        for chunk, item in zip(batch, response.data):
+            records.append((chunk["id"], item.embedding,
+                            {"url": chunk["url"], "text": chunk["text"], "content_hash": content_hash(chunk["text"])}))
+        logger.info(f"Embedded {len(records)} of {len(to_embed)} new or changed chunks...")
+
+    if records:
+        vector_store.upsert(records)
+    if to_delete:
+        vector_store.delete(to_delete)
+
+    report = {
+        "pages": len(new_manifest),
+        "chunks": len(chunks),
+        "skipped": len(chunks) - len(to_embed),
+        "embedded": len(to_embed),
+        "deleted": len(to_delete),
+        "deleted_pages": len(set(manifest) - set(new_manifest))
+    }
+    return new_manifest, report
+
+
+@metrics.instrument()
+def handler(event, context):
+    """
+    Builds or refreshes the documentation vector index.
+
+    Event keys: `docs_dir` (local directory, with `base_url`) or `export_path`
+    (sitemap export; local path or s3:// URI), optional `backend`
+    (`pinecone`/`local`), `manifest_path` (defaults to `DOCS_MANIFEST_PATH`, or
+    next to the local index) and `max_tokens` per chunk.
+    """
+    logger.info("Starting documentation indexing...")
+    secrets = get_secrets_provider()
+
+    if event.get("docs_dir"):
+        if not event.get("base_url"):
+            raise ValueError("base_url is required when indexing a docs_dir.")
+        pages = crawl_directory(event["docs_dir"], event["base_url"])
+    elif event.get("export_path"):
+        pages = read_export(event["export_path"])
+    else:
+        raise ValueError("Provide either docs_dir or export_path.")
+
+    backend = event.get("backend")
+    manifest_path = event.get("manifest_path") or os.environ.get("DOCS_MANIFEST_PATH")
+    if not manifest_path and (backend or os.environ.get("VECTOR_BACKEND", "")).lower() == "local":
+        manifest_path = f"{os.environ.get('LOCAL_VECTOR_INDEX_PATH')}.manifest.json"
+    if not manifest_path:
+        raise ValueError("Set manifest_path or DOCS_MANIFEST_PATH so unchanged chunks can be skipped.")
+
+    vector_store = get_vector_store(secrets, backend)
+    gateway = get_openai_gateway(secrets.get("OPENAI_API_KEY"))
+
+    manifest = load_manifest(manifest_path)
+    new_manifest, report = index_pages(pages, vector_store, gateway, manifest,
+                                       int(event.get("max_tokens", 500)))
+    write_text(manifest_path, json.dumps(new_manifest, indent=1, sort_keys=True))
+
+    logger.info(f"Indexing report: {json.dumps(report)}")
+    return report
+
+
+if __name__ == "__main__":
+    # Local usage, from src/: python -m handlers.index_docs '{"docs_dir": "...", "base_url": "...", "backend": "local"}'
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(handler(json.loads(sys.argv[1]), None), indent=2))
@@ -1,22 +1,35 @@
 import os
-import requests
 import json
+import uuid
 import logging
 from datetime import datetime, timedelta, timezone
-from shared.utils import get_secrets
+from shared import metrics, checkpoints
+from shared.utils import get_secret, get_secrets_provider
+from shared.http_client import RateLimitedClient
+from shared.discord import DiscordIngestor
+from shared.watermarks import get_watermark_store
+from shared.payloads import spill
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+@metrics.instrument()
+@checkpoints.checkpointed(carry_run_id=True)
 def handler(event, context):
     """
     Ingests messages and their threads from specified Discord channels.
     Filters out messages from bots.
+
+    When a watermark store is configured, only messages newer than the last
+    run's high-water mark are fetched (still bounded by `since_days`), plus
+    new replies in threads on older messages. Pass `"full_backfill": true`
+    to ignore the stored watermarks. The new watermarks are only staged
+    under the run: `commit_watermarks` promotes them once every later step
+    has succeeded, so a failed run reads the same messages again.
     """
     logger.info("Starting Discord ingestion...")
-    secrets = get_secrets()
-    DISCORD_BOT_TOKEN = secrets.get("DISCORD_BOT_TOKEN")
+    DISCORD_BOT_TOKEN = get_secret("DISCORD_BOT_TOKEN")
     
     if not DISCORD_BOT_TOKEN:
         logger.error("DISCORD_BOT_TOKEN environment variable not set")
@@ -30,56 +43,32 @@ def handler(event, context):
     since_days = event.get("since_days", 7)
     after_timestamp = datetime.now(timezone.utc) - timedelta(days=since_days)
 
-    headers = {"Authorization": f"Bot {DISCORD_BOT_TOKEN}"}
-    all_conversations = []
-
-    for channel_id in channel_ids:
-        logger.info(f"Fetching messages from channel: {channel_id}")
-        messages_url = f"https://discord.com/api/v10/channels/{channel_id}/messages?limit=100"
-        
-        try:
-            response = requests.get(messages_url, headers=headers)
-            response.raise_for_status()
-            messages = response.json()
-
-            channel_info_res = requests.get(f"https://discord.com/api/v10/channels/{channel_id}", headers=headers)
-            channel_info_res.raise_for_status()
-            channel_name = channel_info_res.json().get('name', channel_id)
+    watermark_store = get_watermark_store()
+    watermarks = {}
+    if watermark_store and not event.get("full_backfill", False):
+        stored = watermark_store.get_many(channel_ids)
+        watermarks = {channel_id: mark for channel_id, mark in stored.items() if mark}
+        logger.info(f"Loaded watermarks for {len(watermarks)} of {len(channel_ids)} channels.")
+    elif watermark_store:
+        logger.info("Full backfill requested; ignoring stored watermarks.")
 
-            for msg in messages:
-                msg_timestamp = datetime.fromisoformat(msg['timestamp'].replace('Z', '+00:00'))
-                
-                if msg_timestamp > after_timestamp and not msg.get('author', {}).get('bot', False):
-                    author_info = msg.get('author', {})
-                    conversation = {
-                        "channel_id": channel_id,
-                        "channel_name": channel_name,
-                        "main_message": msg.get('content', ''),
-                        "author": author_info.get('username', 'Unknown'),
-                        "message_id": msg['id'],
-                        "quotes": [f"'{msg.get('content', '')}' - (from {author_info.get('username', 'Unknown')})"],
-                        "thread_messages": []
-                    }
+    max_workers = int(os.environ.get("DISCORD_MAX_WORKERS", "8"))
+    # A 401 means the token was rotated; the next invocation reads the new one.
+    client = RateLimitedClient(pool_size=max_workers, name="discord",
+                               on_unauthorized=get_secrets_provider().invalidate)
+    ingestor = DiscordIngestor(DISCORD_BOT_TOKEN, max_workers=max_workers, client=client)
+    all_conversations = ingestor.ingest(channel_ids, after_timestamp, watermarks)
+    logger.info(f"Discord ingestion stats: {ingestor.stats}, HTTP stats: {ingestor.client.stats}")
 
-                    if 'thread' in msg:
-                        thread_id = msg['thread']['id']
-                        logger.info(f"Fetching thread {thread_id} for message {msg['id']}")
-                        thread_url = f"https://discord.com/api/v10/channels/{thread_id}/messages?limit=100"
-                        thread_res = requests.get(thread_url, headers=headers)
-                        if thread_res.ok:
-                            thread_msgs = thread_res.json()
-                            for thread_msg in reversed(thread_msgs):
-                                if not thread_msg.get('author', {}).get('bot', False):
-                                    thread_author = thread_msg.get('author', {})
-                                    content = thread_msg.get('content', '')
-                                    conversation['thread_messages'].append(content)
-                                    conversation['quotes'].append(f"'{content}' - (from {thread_author.get('username', 'Unknown')})")
-                    
-                    all_conversations.append(conversation)
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch data for channel {channel_id}: {e}")
-            # Continue to the next channel instead of failing the whole function
-            continue
+    staged = {}
+    if watermark_store:
+        stage = checkpoints.run_id_of(event) or str(uuid.uuid4())
+        for channel_id, mark in ingestor.high_water.items():
+            watermark_store.stage(channel_id, stage, mark)
+        staged = {"watermarks": {"stage": stage, "channels": sorted(ingestor.high_water)}}
 
     logger.info(f"Ingested {len(all_conversations)} conversations.")
-    return {"conversations": all_conversations}
\ No newline at end of file
+    # A busy week can exceed the 256KB state limit, so large results go to S3.
+    return {**spill("conversations", all_conversations,
+                    summary={"conversations": len(all_conversations), "channels": len(channel_ids)}),
+            **staged}
\ No newline at end of file
@@ -1,44 +1,223 @@
 import os
+import hmac
 import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from shared import metrics
+from shared.utils import get_secret
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Linear signs every delivery and stamps it; older deliveries are treated as replays.
+DEFAULT_MAX_AGE_SECONDS = 60
+
+# Clients live for the life of the container so a burst of webhooks reuses them.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client(name):
+    with _clients_lock:
+        if name not in _clients:
+            if name == "table":
+                dynamodb = boto3.resource('dynamodb', config=Config(max_pool_connections=16))
+                _clients[name] = dynamodb.Table(os.environ.get("DYNAMODB_TABLE"))
+            else:
+                _clients[name] = boto3.client(name)
+        return _clients[name]
+
+
+def _raw_body(event):
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        return base64.b64decode(body)
+    return body.encode("utf-8")
+
+
+def verify_signature(raw_body, signature, secret):
+    """
+    Checks the `linear-signature` header: the hex HMAC-SHA256 of the raw
+    request body under the webhook's signing secret.
+    """
+    if not signature or not secret:
+        return False
+    expected = hmac.new(secret.encode("utf-8"), raw_body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def parse_status_update(body, received_at=None):
+    """
+    Returns the queued update for a webhook that changed an issue's state,
+    or None for any other delivery.
+    """
+    if body.get("action") != "update" or "stateId" not in body.get("updatedFrom", {}):
+        return None
+    data = body.get("data", {})
+    ticket_id = data.get("id")
+    status = data.get("state", {}).get("name")
+    if not ticket_id or not status:
+        return None
+    return {
+        "ticket_id": ticket_id,
+        "status": status,
+        "updated_at": data.get("updatedAt") or datetime.now(timezone.utc).isoformat(),
+        "received_at": received_at if received_at is not None else time.time()
+    }
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _sortable_time(value):
+    # Fixed-width UTC, so the condition expression can compare strings.
+    return _parse_time(value).astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def coalesce(updates):
+    """
+    Keeps only the latest update per `ticket_id`, by Linear's `updatedAt`.
+    """
+    latest = {}
+    for update in updates:
+        current = latest.get(update["ticket_id"])
+        if current is None or _parse_time(update["updated_at"]) >= _parse_time(current["updated_at"]):
+            latest[update["ticket_id"]] = update
+    return list(latest.values())
+
+
+def apply_update(table, update):
+    """
+    Writes one ticket's status unless a newer Linear state is already stored.
+    Returns False when the write was skipped as stale.
+    """
+    try:
+        table.update_item(
+            Key={"ticket_id": update["ticket_id"]},
+            UpdateExpression="SET #s = :s, status_updated_at = :u",
+            ConditionExpression="attribute_not_exists(status_updated_at) OR status_updated_at < :u",
+            ExpressionAttributeNames={"#s": "status"},
+            ExpressionAttributeValues={":s": update["status"],
+                                       ":u": _sortable_time(update["updated_at"])}
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+
+def apply_updates(updates, table=None):
+    """
+    Coalesces `updates` and applies them concurrently over the pooled table
+    resource (`WEBHOOK_WRITE_CONCURRENCY`, default 8). Conditional writes
+    cannot go in a BatchWriteItem, so coalescing is what cuts the write count.
+    Returns the per-ticket outcome (True written, False stale, or the
+    exception) and run metrics. Lag is measured from Linear's `updatedAt`
+    to the write; queue time from when the webhook was received.
+    """
+    table = table or _client("table")
+    latest = coalesce(updates)
+    concurrency = int(os.environ.get("WEBHOOK_WRITE_CONCURRENCY", "8"))
+
+    def write(update):
+        try:
+            return apply_update(table, update)
+        except Exception as e:
+            logger.error(f"Error updating ticket {update['ticket_id']}: {e}")
+            return e
 
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(latest)))) as executor:
+        outcomes = dict(zip((u["ticket_id"] for u in latest), executor.map(write, latest)))
+
+    now = time.time()
+    lags = [now - _parse_time(u["updated_at"]).timestamp() for u in latest]
+    queued = [now - u["received_at"] for u in updates if u.get("received_at")]
+    queue_metrics = {
+        "messages": len(updates),
+        "writes": len(latest),
+        "coalescing_ratio": round(len(updates) / len(latest), 2) if latest else 0,
+        "written": sum(1 for outcome in outcomes.values() if outcome is True),
+        "stale": sum(1 for outcome in outcomes.values() if outcome is False),
+        "failed": sum(1 for outcome in outcomes.values() if isinstance(outcome, Exception)),
+        "max_lag_seconds": round(max(lags), 3) if lags else 0,
+        "avg_lag_seconds": round(sum(lags) / len(lags), 3) if lags else 0,
+        "max_queue_seconds": round(max(queued), 3) if queued else 0
+    }
+    return outcomes, queue_metrics
+
+
+@metrics.instrument()
 def handler(event, context):
     """
-    Processes incoming webhooks from Linear to update ticket status in DynamoDB.
-    Triggered by API Gateway.
+    Receives Linear webhooks from API Gateway. Verifies the signature, then
+    enqueues state changes on `WEBHOOK_QUEUE_URL` for `queue_handler` and
+    answers right away. Without a queue the update is applied inline.
     """
-    print("Processing Linear webhook...")
-    DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE")
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(DYNAMODB_TABLE)
+    logger.info("Processing Linear webhook...")
+    raw_body = _raw_body(event)
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+
+    if not verify_signature(raw_body, headers.get("linear-signature"), get_secret("LINEAR_WEBHOOK_SECRET")):
+        logger.warning("Rejected webhook with a missing or invalid signature.")
+        return {"statusCode": 401, "body": "Invalid signature."}
 
     try:
-        body = json.loads(event.get("body", "{}"))
-        
-        # We only care about updates
-        if body.get("action") != "update":
-            return {"statusCode": 200, "body": "OK (Not an update action)"}
-
-        data = body.get("data", {})
-        updated_from = body.get("updatedFrom", {})
-        
-        # Check if the status (state) was changed
-        if "stateId" in updated_from:
-            ticket_id = data.get("id")
-            new_status = data.get("state", {}).get("name")
-            
-            if ticket_id and new_status:
-                print(f"Updating ticket {ticket_id} to status '{new_status}'")
-                table.update_item(
-                    Key={"ticket_id": ticket_id},
-                    UpdateExpression="SET #s = :s",
-                    ExpressionAttributeNames={"#s": "status"},
-                    ExpressionAttributeValues={":s": new_status}
-                )
-        
+        body = json.loads(raw_body or b"{}")
+        max_age = float(os.environ.get("WEBHOOK_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS))
+        sent_at = body.get("webhookTimestamp")
+        if sent_at is not None and abs(time.time() - sent_at / 1000) > max_age:
+            logger.warning(f"Rejected webhook sent {time.time() - sent_at / 1000:.0f}s ago.")
+            return {"statusCode": 401, "body": "Stale webhook."}
+
+        update = parse_status_update(body)
+        if update is None:
+            return {"statusCode": 200, "body": "OK (Not a status update)"}
+
+        queue_url = os.environ.get("WEBHOOK_QUEUE_URL")
+        if queue_url:
+            _client("sqs").send_message(QueueUrl=queue_url, MessageBody=json.dumps(update))
+            logger.info(f"Queued status '{update['status']}' for ticket {update['ticket_id']}")
+        else:
+            logger.info(f"Updating ticket {update['ticket_id']} to status '{update['status']}'")
+            apply_updates([update])
         return {"statusCode": 200, "body": "Webhook processed successfully."}
 
     except Exception as e:
-        print(f"Error processing webhook: {e}")
+        logger.error(f"Error processing webhook: {e}")
         # Return 200 even on error so Linear doesn't retry indefinitely
-        return {"statusCode": 200, "body": "Error processing webhook."}
\ No newline at end of file
+        return {"statusCode": 200, "body": "Error processing webhook."}
+
+
+@metrics.instrument()
+def queue_handler(event, context):
+    """
+    SQS consumer for queued status updates. Applies a batch of messages with
+    `apply_updates` and reports the messages of failed tickets back to SQS
+    (`ReportBatchItemFailures`), so only those are redelivered.
+    """
+    updates, message_ids = [], {}
+    for record in event.get("Records", []):
+        update = json.loads(record["body"])
+        updates.append(update)
+        message_ids.setdefault(update["ticket_id"], []).append(record["messageId"])
+
+    outcomes, queue_metrics = apply_updates(updates)
+    logger.info(f"Webhook queue metrics: {json.dumps(queue_metrics)}")
+    return {"batchItemFailures": [
+        {"itemIdentifier": message_id}
+        for ticket_id, outcome in outcomes.items() if isinstance(outcome, Exception)
+        for message_id in message_ids[ticket_id]
+    ]}
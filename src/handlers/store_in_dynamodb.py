@@ -1,42 +1,149 @@
 import os
-import json
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 from decimal import Decimal
+from botocore.config import Config
 
+from shared import metrics
+from shared.payloads import attach_field, iter_records, resolve_item
 
-def handler(event, context):
+# The resource and its connection pool live for the life of the container.
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    global _table
+    with _table_lock:
+        if _table is None:
+            dynamodb = boto3.resource('dynamodb', config=Config(max_pool_connections=16))
+            _table = dynamodb.Table(os.environ.get("DYNAMODB_TABLE"))
+        return _table
+
+
+def to_dynamodb(value):
     """
-    Stores the created ticket information in DynamoDB for the feedback loop.
+    Converts a JSON-like value for DynamoDB: floats become Decimals and None
+    values are dropped from dicts, recursively.
     """
-    print(
-        f"Storing ticket {event['ticket']['ticket_identifier']} in DynamoDB...")
-    DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE")
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(DYNAMODB_TABLE)
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: to_dynamodb(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [to_dynamodb(v) for v in value]
+    return value
 
+
+def build_item(event):
+    """
+    Builds the DynamoDB item for one ticketed insight.
+    """
     ticket_info = event.get('ticket', {})
     doc_info = event.get('documentation', {})
     suggestion_info = event.get('suggestion', {})
 
-    item = {
+    item = to_dynamodb({
         "ticket_id": ticket_info.get('ticket_id'),
         "ticket_identifier": ticket_info.get('ticket_identifier'),
         "ticket_url": ticket_info.get('ticket_url'),
         "insight_summary": event.get('summary'),
         "llm_suggestion": suggestion_info.get('llm_suggestion'),
         "doc_url": doc_info.get('url'),
+        "cluster_size": event.get('cluster_size'),
         "status": "Triage"
-    }
+    })
+
+    # The cluster centroid lets later runs match recurrences to this ticket. It is
+    # base64 of the float32 bytes stored here, so decoding needs no numpy.
+    if event.get('centroid'):
+        item["centroid"] = base64.b64decode(event['centroid'])
+    return item
 
-    # Filter out any keys with None values before saving
-    item_to_save = {k: v for k, v in item.items() if v is not None}
 
-    # Convert floats to Decimals for DynamoDB if necessary
-    item_to_save = json.loads(json.dumps(item_to_save), parse_float=Decimal)
+def write_item(table, item):
+    """
+    Writes one ticket with a single UpdateItem. Every field is set, but
+    `status` only when the ticket has none yet, so neither a retried step
+    nor a webhook that got there first has its status reset. Returns True
+    when the ticket was not stored before.
+    """
+    fields = {k: v for k, v in item.items() if k not in ("ticket_id", "status")}
+    names = {f"#f{i}": name for i, name in enumerate(fields)}
+    response = table.update_item(
+        Key={"ticket_id": item["ticket_id"]},
+        UpdateExpression="SET " + ", ".join(f"{alias} = :v{i}" for i, alias in enumerate(names))
+                         + ", #s = if_not_exists(#s, :s)",
+        ExpressionAttributeNames={**names, "#s": "status"},
+        ExpressionAttributeValues={**{f":v{i}": value for i, value in enumerate(fields.values())},
+                                   ":s": item.get("status", "Triage")},
+        ReturnValues="ALL_OLD"
+    )
+    return "ticket_identifier" not in response.get("Attributes", {})
+
+
+def store_items(items, table=None):
+    """
+    Writes ticket items without clobbering status changes. BatchWriteItem
+    cannot carry conditions, and a lookup before an unconditional put races
+    with the webhook, so each ticket is one `write_item` call. The calls run
+    concurrently over the pooled table (`STORE_WRITE_CONCURRENCY`, default 8).
+    Returns the number of tickets created and updated.
+    """
+    table = table or get_table()
+    by_id = {item["ticket_id"]: item for item in items}
+    if not by_id:
+        return 0, 0
+    concurrency = int(os.environ.get("STORE_WRITE_CONCURRENCY", "8"))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(by_id)))) as executor:
+        created = sum(executor.map(lambda item: write_item(table, item), by_id.values()))
+    return created, len(by_id) - created
 
-    table.put_item(Item=item_to_save)
-    print("Successfully stored ticket in DynamoDB.")
+
+@metrics.instrument()
+def handler(event, context):
+    """
+    Stores the created ticket information in DynamoDB for the feedback loop.
+    """
+    event, = attach_field([resolve_item(event)], "centroid")
+    print(
+        f"Storing ticket {event['ticket']['ticket_identifier']} in DynamoDB...")
+
+    item_to_save = build_item(event)
+
+    created, updated = store_items([item_to_save])
+    print(f"Successfully stored ticket in DynamoDB ({'created' if created else 'updated, status kept'}).")
     return {
         "status": "SUCCESS",
         "ticket_identifier": item_to_save.get('ticket_identifier')
     }
+
+
+@metrics.instrument()
+def batch_handler(event, context):
+    """
+    Batch variant of `handler` for the batch workflow. Takes `{"clusters": [...]}`
+    and writes every cluster that has a ticket through `store_items`.
+    Clusters whose ticket creation failed are skipped.
+    """
+    # The clusters are streamed from the claim check; the ones without a ticket are only counted.
+    total = 0
+    ticketed = []
+    for cluster in iter_records(event, 'clusters'):
+        total += 1
+        if cluster.get('ticket', {}).get('ticket_id'):
+            ticketed.append(cluster)
+    items = [build_item(cluster) for cluster in attach_field(ticketed, "centroid")]
+    print(f"Storing {len(items)} of {total} tickets in DynamoDB...")
+
+    created, updated = store_items(items)
+
+    print(f"Successfully stored tickets in DynamoDB ({created} created, {updated} updated).")
+    return {
+        "status": "SUCCESS",
+        "stored": len(items),
+        "skipped": total - len(items),
+        "ticket_identifiers": [item.get('ticket_identifier') for item in items]
+    }
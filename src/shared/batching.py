@@ -0,0 +1,72 @@
+import logging
+
+from shared.tokens import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tokens for the "Conversation N:\n---\n...\n---" wrapper and separators around each conversation.
+PER_CONVERSATION_OVERHEAD = 12
+
+
+class Batch:
+    """
+    One extraction prompt's worth of conversations. `conversations` keeps the
+    original conversation dicts so prompt indices map straight back to them.
+    """
+
+    def __init__(self):
+        self.channels = []
+        self.conversations = []
+        self.texts = []
+        self.tokens = 0
+
+    def add(self, channel_name, conversation, text, tokens):
+        if channel_name not in self.channels:
+            self.channels.append(channel_name)
+        self.conversations.append(conversation)
+        self.texts.append(text)
+        self.tokens += tokens
+
+    def __len__(self):
+        return len(self.conversations)
+
+
+def plan_batches(conversations_by_channel, token_budget, format_conversation, model="gpt-4-turbo-preview"):
+    """
+    Packs conversations into batches whose formatted text fits `token_budget`.
+
+    Channels are taken in order. A channel that fits in the current batch is
+    merged into it, so small channels share one prompt; a channel that does
+    not fit starts a new batch, and one larger than the budget is split across
+    consecutive batches. A single conversation larger than the budget is
+    truncated. Conversation order is preserved throughout.
+    """
+    sized = []
+    for channel_name, channel_convos in conversations_by_channel.items():
+        entries = []
+        for conv in channel_convos:
+            text = format_conversation(conv)
+            tokens = count_tokens(text, model) + PER_CONVERSATION_OVERHEAD
+            if tokens > token_budget:
+                logger.warning(
+                    f"Truncating a {tokens}-token conversation in {channel_name} to fit the {token_budget}-token budget.")
+                text = truncate_to_tokens(text, token_budget - PER_CONVERSATION_OVERHEAD, model)
+                tokens = token_budget
+            entries.append((conv, text, tokens))
+        sized.append((channel_name, entries))
+
+    batches = []
+    current = Batch()
+    for channel_name, entries in sized:
+        channel_tokens = sum(tokens for _, _, tokens in entries)
+        if current and current.tokens + channel_tokens > token_budget and channel_tokens <= token_budget:
+            batches.append(current)
+            current = Batch()
+        for conv, text, tokens in entries:
+            if current and current.tokens + tokens > token_budget:
+                batches.append(current)
+                current = Batch()
+            current.add(channel_name, conv, text, tokens)
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import functools
+import threading
+import contextvars
+
+import boto3
+from botocore.exceptions import ClientError
+
+from shared import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_DAYS = 7
+# DynamoDB items are capped at 400KB; step results are at most 256KB once spilled.
+MAX_ITEM_BYTES = 350 * 1024
+
+_incomplete = contextvars.ContextVar("checkpoint_incomplete", default=None)
+
+
+def content_hash(value):
+    """
+    SHA-256 of `value` as canonical JSON, so equal inputs hash equally
+    whatever their key order.
+    """
+    payload = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def run_id_of(event):
+    return event.get("run_id") if isinstance(event, dict) else None
+
+
+def stage_key(run_id, stage, event):
+    return f"{run_id}#{stage}#{content_hash(event)}"
+
+
+class DynamoDBCheckpointStore:
+    """
+    Stores one item per key, the result as a JSON string (floats stay
+    floats) with an `expires_at` epoch for the table's TTL.
+    """
+
+    def __init__(self, table_name, dynamodb=None):
+        self.table = (dynamodb or boto3.resource('dynamodb')).Table(table_name)
+
+    def get(self, key):
+        item = self.table.get_item(Key={"checkpoint_key": key}, ConsistentRead=True).get("Item")
+        if item and int(item["expires_at"]) > time.time():
+            return json.loads(item["result"])
+        return None
+
+    def put(self, key, result, expires_at):
+        self.table.put_item(Item={"checkpoint_key": key, "result": json.dumps(result, separators=(",", ":")),
+                                  "expires_at": int(expires_at)})
+
+
+class S3CheckpointStore:
+    """
+    Stores one JSON object per key under `prefix`.
+    """
+
+    def __init__(self, bucket, prefix="checkpoints/", s3=None):
+        self.s3 = s3 or boto3.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            body = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        item = json.loads(body)
+        return item["result"] if item["expires_at"] > time.time() else None
+
+    def put(self, key, result, expires_at):
+        self.s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}{key}",
+                           Body=json.dumps({"result": result, "expires_at": int(expires_at)}).encode("utf-8"))
+
+
+class FileCheckpointStore:
+    """
+    Keeps one JSON file per key in a local directory, for local runs and tests.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            item = json.load(f)
+        return item["result"] if item["expires_at"] > time.time() else None
+
+    def put(self, key, result, expires_at):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "result": result, "expires_at": int(expires_at)}, f)
+        os.replace(tmp_path, path)
+
+
+_store = None
+_store_config = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store():
+    """
+    Returns the configured store: DynamoDB when `CHECKPOINT_TABLE` is set,
+    S3 when `CHECKPOINT_BUCKET` is set, a local directory when
+    `CHECKPOINT_DIR` is set, otherwise None (nothing is checkpointed).
+    """
+    global _store, _store_config
+    config = tuple(os.environ.get(name) for name in ("CHECKPOINT_TABLE", "CHECKPOINT_BUCKET", "CHECKPOINT_DIR"))
+    with _store_lock:
+        if config != _store_config:
+            table_name, bucket, directory = config
+            if table_name:
+                _store = DynamoDBCheckpointStore(table_name)
+            elif bucket:
+                _store = S3CheckpointStore(bucket)
+            elif directory:
+                _store = FileCheckpointStore(directory)
+            else:
+                _store = None
+            _store_config = config
+        return _store
+
+
+def load_checkpoint(key):
+    """
+    Returns the result saved under `key`, or None. A store that fails is
+    treated as empty, so the work is redone rather than the run failing.
+    """
+    store = get_checkpoint_store()
+    if store is None:
+        return None
+    try:
+        return store.get(key)
+    except Exception as e:
+        logger.warning(f"Checkpoint read failed for {key}: {e}")
+        return None
+
+
+def save_checkpoint(key, result):
+    store = get_checkpoint_store()
+    if store is None:
+        return
+    if len(json.dumps(result, separators=(",", ":"))) > MAX_ITEM_BYTES:
+        logger.warning(f"Checkpoint for {key} is over {MAX_ITEM_BYTES} bytes; not saved.")
+        return
+    expires_at = time.time() + float(os.environ.get("CHECKPOINT_TTL_DAYS", DEFAULT_TTL_DAYS)) * 86400
+    try:
+        store.put(key, result, expires_at)
+    except Exception as e:
+        logger.warning(f"Checkpoint write failed for {key}: {e}")
+
+
+def with_run_id(event, result):
+    """
+    Returns `result` carrying the event's `run_id`, so the next step sees it.
+    """
+    run_id = run_id_of(event)
+    if run_id and isinstance(result, dict):
+        return {**result, "run_id": run_id}
+    return result
+
+
+def mark_incomplete(reason):
+    """
+    Keeps the running handler's result from being saved, so that a re-run
+    retries it; for partial failures the handler returns instead of raising.
+    Call it from the handler's own thread.
+    """
+    reasons = _incomplete.get()
+    if reasons is not None:
+        reasons.append(reason)
+
+
+def checkpointed(stage=None, carry_run_id=False):
+    """
+    Decorates a Lambda handler so a re-run or redrive of the same run skips
+    it. When the event has a `run_id` and a store is configured, the result
+    is saved under the run, the stage and a hash of the event, and an
+    identical event in the same run gets the saved result back without
+    running the handler. Failures, and results the handler passed to
+    `mark_incomplete`, are not saved. With `carry_run_id` the
+    result also carries the `run_id`, for steps whose output is the next
+    step's input. `stage` defaults as in `metrics.instrument`.
+    """
+    def decorate(handler):
+        name = stage or metrics.stage_name(handler)
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            run_id = run_id_of(event)
+            key = stage_key(run_id, name, event) if run_id and get_checkpoint_store() is not None else None
+            if key:
+                result = load_checkpoint(key)
+                if result is not None:
+                    logger.info(f"Checkpoint hit for {name} in run {run_id}; returning the saved result.")
+                    return result
+            token = _incomplete.set([])
+            try:
+                result = handler(event, context)
+                reasons = _incomplete.get()
+            finally:
+                _incomplete.reset(token)
+            if carry_run_id:
+                result = with_run_id(event, result)
+            if key and reasons:
+                logger.info(f"Not checkpointing {name} in run {run_id}: {'; '.join(reasons)}")
+            elif key:
+                save_checkpoint(key, result)
+            return result
+
+        return wrapper
+    return decorate
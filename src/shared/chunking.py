@@ -0,0 +1,124 @@
+import re
+import hashlib
+from html.parser import HTMLParser
+
+from shared.tokens import count_tokens
+
+DEFAULT_MAX_TOKENS = 500
+
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Tokens for the blank line that joins two paragraphs in a chunk.
+_SEPARATOR_TOKENS = 2
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Collects the visible text of an HTML page, one block per block-level element.
+    """
+
+    BLOCKS = {"p", "div", "section", "article", "li", "pre", "table", "tr", "br",
+              "h1", "h2", "h3", "h4", "h5", "h6"}
+    SKIP = {"script", "style", "nav", "header", "footer"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n\n")
+            if tag[0] == "h" and tag[1:].isdigit():
+                self.parts.append("#" * int(tag[1:]) + " ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    """
+    Returns the visible text of an HTML page with headings rendered as Markdown.
+    """
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    text = "".join(extractor.parts)
+    return re.sub(r"\n{3,}", "\n\n", re.sub(r"[ \t]+", " ", text)).strip()
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(url, text):
+    """
+    Stable chunk ID: the page URL hash plus the chunk content hash, so an
+    edited chunk gets a new ID and its old vector can be deleted.
+    """
+    return f"{content_hash(url)[:16]}-{content_hash(text)[:24]}"
+
+
+def _split_oversized(block, max_tokens):
+    """
+    Splits a block that exceeds `max_tokens` on sentence boundaries, and
+    falls back to words for single sentences that are still too long.
+    """
+    pieces, current = [], ""
+    for sentence in _SENTENCE_END.split(block):
+        candidate = f"{current} {sentence}".strip()
+        if count_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if count_tokens(sentence) <= max_tokens:
+            current = sentence
+            continue
+        current = ""
+        for word in sentence.split():
+            candidate = f"{current} {word}".strip()
+            if current and count_tokens(candidate) > max_tokens:
+                pieces.append(current)
+                candidate = word
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    Splits page text into chunks of at most `max_tokens`. Paragraphs are
+    packed together, and a Markdown heading always starts a new chunk so each
+    chunk stays within one section.
+    """
+    blocks = []
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        if count_tokens(block) > max_tokens:
+            blocks.extend(_split_oversized(block, max_tokens))
+        else:
+            blocks.append(block)
+
+    chunks, current, current_tokens = [], [], 0
+    for block in blocks:
+        block_tokens = count_tokens(block)
+        if current and (_HEADING.match(block) or current_tokens + _SEPARATOR_TOKENS + block_tokens > max_tokens):
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current_tokens += block_tokens + (_SEPARATOR_TOKENS if current else 0)
+        current.append(block)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
@@ -0,0 +1,123 @@
+import numpy as np
+
+from shared.vector_store import normalize_rows
+
+DEFAULT_EPS = 0.25
+DEFAULT_MIN_SAMPLES = 2
+# Rows per similarity tile. A tile is BLOCK_SIZE x BLOCK_SIZE float32 (4 MB at 1024).
+BLOCK_SIZE = 1024
+
+
+def _tiles(n, block_size):
+    """
+    Yields the `(rows, cols)` slices of the upper triangle of an n x n matrix.
+    """
+    for i in range(0, n, block_size):
+        for j in range(i, n, block_size):
+            yield slice(i, min(i + block_size, n)), slice(j, min(j + block_size, n))
+
+
+def _find(parent, nodes):
+    roots = parent[nodes]
+    while True:
+        next_roots = parent[roots]
+        if np.array_equal(next_roots, roots):
+            return roots
+        roots = next_roots
+
+
+def _union_pairs(parent, left, right):
+    """
+    Merges the components of every `(left[i], right[i])` pair. Roots always
+    hook onto the smaller root, so the forest stays acyclic.
+    """
+    while len(left):
+        left_roots, right_roots = _find(parent, left), _find(parent, right)
+        differ = left_roots != right_roots
+        if not differ.any():
+            return
+        low = np.minimum(left_roots[differ], right_roots[differ])
+        high = np.maximum(left_roots[differ], right_roots[differ])
+        np.minimum.at(parent, high, low)
+        left, right = left[differ], right[differ]
+
+
+def neighbour_pairs(matrix, threshold, block_size=BLOCK_SIZE):
+    """
+    Returns every pair `i < j` of rows of the unit-normalized `matrix` with
+    cosine similarity >= `threshold`, as `(left, right, similarity)` arrays.
+    Similarities are computed one tile at a time over the upper triangle, so
+    memory stays at O(block_size^2 + pairs) rather than O(n^2).
+    """
+    left, right, similarities = [], [], []
+    for rows, cols in _tiles(len(matrix), block_size):
+        similarity = matrix[rows] @ matrix[cols].T
+        close = similarity >= threshold
+        if rows == cols:
+            close = np.triu(close, k=1)
+        tile_left, tile_right = np.nonzero(close)
+        left.append((tile_left + rows.start).astype(np.int64))
+        right.append((tile_right + cols.start).astype(np.int64))
+        similarities.append(similarity[tile_left, tile_right])
+    if not left:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float32)
+    return np.concatenate(left), np.concatenate(right), np.concatenate(similarities)
+
+
+def cluster_embeddings(embeddings, eps=DEFAULT_EPS, min_samples=DEFAULT_MIN_SAMPLES, block_size=BLOCK_SIZE):
+    """
+    Density-based clustering with cosine distance and DBSCAN semantics:
+    points with at least `min_samples` neighbours (themselves included)
+    within distance `eps` are core points, connected core points form a
+    cluster, and other points within `eps` of a core point join the cluster
+    of their most similar core neighbour. Everything else is noise (-1).
+
+    Works on a normalized float32 matrix with blocked similarity
+    thresholding (`neighbour_pairs`) and a vectorized union-find.
+    Returns an int array of labels numbered in order of first appearance.
+    """
+    matrix = normalize_rows(embeddings)
+    n = len(matrix)
+    labels = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return labels
+
+    left, right, similarity = neighbour_pairs(matrix, np.float32(1.0 - eps), block_size)
+    counts = 1 + np.bincount(left, minlength=n) + np.bincount(right, minlength=n)
+    core = counts >= min_samples
+    if not core.any():
+        return labels
+
+    parent = np.arange(n)
+    both_core = core[left] & core[right]
+    _union_pairs(parent, left[both_core], right[both_core])
+    roots = np.where(core, _find(parent, np.arange(n)), -1)
+
+    # Border points join the cluster of their most similar core neighbour.
+    one_core = core[left] != core[right]
+    border = np.where(core[left[one_core]], right[one_core], left[one_core])
+    anchor = np.where(core[left[one_core]], left[one_core], right[one_core])
+    order = np.argsort(-similarity[one_core], kind="stable")
+    border_points, first = np.unique(border[order], return_index=True)
+    roots[border_points] = roots[anchor[order][first]]
+
+    clustered = roots >= 0
+    _, first_seen, inverse = np.unique(roots[clustered], return_index=True, return_inverse=True)
+    labels[clustered] = np.argsort(np.argsort(first_seen))[inverse]
+    return labels
+
+
+def medoid_index(embeddings, members):
+    """
+    Returns the member whose summed cosine similarity to the other members
+    is highest, i.e. the most central item of the cluster.
+    """
+    vectors = normalize_rows(np.asarray(embeddings)[members])
+    return members[int(np.argmax(vectors @ vectors.sum(axis=0)))]
+
+
+def centroid(embeddings, members):
+    """
+    Returns the unit-length mean direction of the cluster's members.
+    """
+    return normalize_rows(normalize_rows(np.asarray(embeddings)[members]).mean(axis=0))[0]
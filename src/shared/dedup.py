@@ -0,0 +1,137 @@
+import re
+import zlib
+from itertools import combinations
+
+import numpy as np
+
+from shared.tokens import count_tokens
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 128
+# 16 bands of 8 rows put the LSH candidate threshold near 0.7 Jaccard.
+LSH_BANDS = 16
+SHINGLE_SIZE = 3
+
+# Larger than 2^32, so (a * x + b) mod P permutes 32-bit shingle hashes.
+_PRIME = 4294967311
+_URL = re.compile(r"https?://\S+")
+_MENTION = re.compile(r"<[@#][!&]?\d+>")
+_HEX = re.compile(r"\b0x[0-9a-f]+\b|\b[0-9a-f]{8,}\b")
+_NUMBER = re.compile(r"\d+(?:[.:\-]\d+)*")
+_WORD = re.compile(r"[a-z_]+|#")
+
+
+def normalize_for_dedup(text):
+    """
+    Lowercases `text` and masks the parts that differ between copies of the
+    same post or error log: URLs, Discord mentions, hex IDs and numbers
+    (timestamps, line numbers, request IDs). Returns the remaining words.
+    """
+    text = (text or "").lower()
+    text = _URL.sub(" url ", text)
+    text = _MENTION.sub(" ", text)
+    text = _HEX.sub(" # ", text)
+    text = _NUMBER.sub(" # ", text)
+    return _WORD.findall(text)
+
+
+def shingles(words, size=SHINGLE_SIZE):
+    """
+    Word n-grams of `words`; a text shorter than `size` is one shingle.
+    """
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """
+    MinHash signatures over shingle sets using `num_perm` random affine
+    permutations of 32-bit CRC hashes, computed with NumPy.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64,
+                             count=len(shingle_set))
+        return ((np.outer(hashes, self.a) + self.b) % np.uint64(_PRIME)).min(axis=0)
+
+
+def near_duplicate_groups(texts, threshold=DEFAULT_THRESHOLD, bands=LSH_BANDS, hasher=None):
+    """
+    Groups texts whose estimated Jaccard similarity (over word shingles of the
+    normalized text) is at least `threshold`. Candidates come from LSH
+    banding of the MinHash signatures and are verified on the full signature.
+    Returns the groups as lists of indices, each in input order, ordered by
+    their first index.
+    """
+    if not texts:
+        return []
+    hasher = hasher or MinHasher()
+    signatures = np.array([hasher.signature(shingles(normalize_for_dedup(text))) for text in texts])
+    rows = signatures.shape[1] // bands
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        for i, signature in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(signature.tobytes(), []).append(i)
+        for members in buckets.values():
+            for i, j in combinations(members, 2):
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j and np.mean(signatures[i] == signatures[j]) >= threshold:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for i in range(len(texts)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values())
+
+
+def collapse_near_duplicates(conversations, format_conversation, threshold=DEFAULT_THRESHOLD,
+                             model="gpt-4-turbo-preview"):
+    """
+    Collapses near-duplicate conversations (cross-posts, bumps, pasted error
+    logs) into one conversation per group, compared on `main_message` plus
+    `thread_messages`. The kept conversation is the group's longest, placed
+    at the group's first position, and carries every member's quotes and a
+    `duplicates` count. Runs locally with no network calls.
+    Returns the remaining conversations and a report with the number removed
+    and the estimated prompt tokens saved.
+    """
+    texts = [format_conversation(conv) for conv in conversations]
+    groups = near_duplicate_groups(texts, threshold)
+
+    kept, tokens_saved = [], 0
+    for group in groups:
+        longest = max(group, key=lambda i: len(texts[i]))
+        conversation = dict(conversations[longest])
+        if len(group) > 1:
+            quotes = []
+            for i in group:
+                for quote in conversations[i].get('quotes', []):
+                    if quote not in quotes:
+                        quotes.append(quote)
+            conversation["quotes"] = quotes
+            conversation["duplicates"] = len(group) - 1
+            tokens_saved += sum(count_tokens(texts[i], model) for i in group if i != longest)
+        kept.append(conversation)
+
+    report = {
+        "conversations_in": len(conversations),
+        "conversations_out": len(kept),
+        "removed": len(conversations) - len(kept),
+        "estimated_tokens_saved": tokens_saved
+    }
+    return kept, report
@@ -0,0 +1,297 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from shared import metrics
+from shared.http_client import RateLimitedClient
+
+logger = logging.getLogger(__name__)
+
+DISCORD_API_BASE = os.environ.get("DISCORD_API_BASE", "https://discord.com/api/v10")
+PAGE_LIMIT = 100
+DISCORD_EPOCH_MS = 1420070400000
+
+
+def parse_timestamp(value):
+    """
+    Parses a Discord ISO-8601 timestamp into an aware datetime.
+    """
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def snowflake_at(moment):
+    """
+    Returns the smallest Discord snowflake ID (as a string) created at `moment`.
+    """
+    return str((int(moment.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22)
+
+
+def snowflake_time(snowflake):
+    """
+    Returns when a Discord snowflake ID was created, as an aware datetime.
+    """
+    return datetime.fromtimestamp(((int(snowflake) >> 22) + DISCORD_EPOCH_MS) / 1000, timezone.utc)
+
+
+def build_conversation(channel_id, channel_name, msg):
+    """
+    Builds the conversation dict that downstream steps expect from a top-level message.
+    """
+    author_info = msg.get('author', {})
+    return {
+        "channel_id": channel_id,
+        "channel_name": channel_name,
+        "main_message": msg.get('content', ''),
+        "author": author_info.get('username', 'Unknown'),
+        "message_id": msg['id'],
+        "quotes": [f"'{msg.get('content', '')}' - (from {author_info.get('username', 'Unknown')})"],
+        "thread_messages": []
+    }
+
+
+class DiscordIngestor:
+    """
+    Walks Discord channel history page by page and fetches message threads
+    concurrently over a single pooled, rate-limit-aware HTTP client.
+    """
+
+    def __init__(self, bot_token, api_base=DISCORD_API_BASE, max_workers=8, client=None):
+        self.api_base = api_base.rstrip('/')
+        self.max_workers = max_workers
+        self.client = client or RateLimitedClient(pool_size=max_workers, name="discord")
+        self.client.session.headers.update({"Authorization": f"Bot {bot_token}"})
+        self.stats = {"pages": 0, "threads": 0, "thread_errors": 0, "revisited_threads": 0}
+        # Watermark per channel ingested without errors, for incremental runs.
+        self.high_water = {}
+        self._active_threads = {}
+        # Highest thread cursor per channel whose threads could not all be read.
+        self._cursor_holds = {}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _hold_cursor(self, channel_id, cursor):
+        """
+        Keeps the channel's next thread cursor at or below `cursor`, so the
+        next run revisits the threads whose replies could not be read.
+        """
+        with self._stats_lock:
+            held = self._cursor_holds.get(channel_id)
+            if held is None or int(cursor) < int(held):
+                self._cursor_holds[channel_id] = cursor
+
+    def _get(self, path, params=None):
+        response = self.client.get(f"{self.api_base}{path}", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_channel(self, channel_id):
+        return self._get(f"/channels/{channel_id}")
+
+    def fetch_active_threads(self, guild_id):
+        """
+        Returns the guild's active threads, fetched once per ingestor.
+        """
+        if guild_id not in self._active_threads:
+            self._active_threads[guild_id] = self._get(f"/guilds/{guild_id}/threads/active").get('threads', [])
+        return self._active_threads[guild_id]
+
+    def iter_archived_threads(self, channel_id, archived_after):
+        """
+        Yields the channel's public threads archived after `archived_after`,
+        newest first.
+        """
+        before = None
+        while True:
+            params = {"limit": PAGE_LIMIT}
+            if before:
+                params["before"] = before
+            page = self._get(f"/channels/{channel_id}/threads/archived/public", params)
+            self._count("pages")
+            for thread in page.get('threads', []):
+                archived_at = thread.get('thread_metadata', {}).get('archive_timestamp')
+                if not archived_at or parse_timestamp(archived_at) <= archived_after:
+                    return
+                yield thread
+                before = archived_at
+            if not page.get('has_more') or before is None:
+                return
+
+    def iter_message_pages(self, channel_id, after_timestamp=None, after_id=None):
+        """
+        Yields pages of messages (newest first), following the `before` cursor
+        until a message at or before `after_timestamp`, or with an ID at or
+        below `after_id`, is reached or history runs out. Messages outside the
+        window are dropped from the final page.
+        """
+        before = None
+        while True:
+            params = {"limit": PAGE_LIMIT}
+            if before:
+                params["before"] = before
+            messages = self._get(f"/channels/{channel_id}/messages", params)
+            self._count("pages")
+            if not messages:
+                return
+            if before is None:
+                self.high_water[channel_id] = {"message_id": messages[0]['id'], "timestamp": messages[0]['timestamp']}
+
+            in_window = messages
+            if after_timestamp is not None:
+                in_window = [m for m in in_window if parse_timestamp(m['timestamp']) > after_timestamp]
+            if after_id is not None:
+                in_window = [m for m in in_window if int(m['id']) > int(after_id)]
+            if in_window:
+                yield in_window
+
+            if len(in_window) < len(messages) or len(messages) < PAGE_LIMIT:
+                return
+            before = messages[-1]['id']
+
+    def fetch_thread_messages(self, thread_id, after_id=None):
+        """
+        Returns the messages in a thread in chronological order, only those
+        with an ID above `after_id` when given.
+        """
+        pages = []
+        before = None
+        while True:
+            params = {"limit": PAGE_LIMIT}
+            if before:
+                params["before"] = before
+            messages = self._get(f"/channels/{thread_id}/messages", params)
+            self._count("pages")
+            newer = [m for m in messages if after_id is None or int(m['id']) > int(after_id)]
+            pages.extend(newer)
+            if len(newer) < len(messages) or len(messages) < PAGE_LIMIT:
+                break
+            before = messages[-1]['id']
+        self._count("threads")
+        return list(reversed(pages))
+
+    def _fill_thread(self, conversation, thread_id, after_id=None):
+        try:
+            thread_msgs = self.fetch_thread_messages(thread_id, after_id)
+        except requests.exceptions.RequestException as e:
+            self._count("thread_errors")
+            # Every reply of a new message's thread is above the thread's own ID.
+            self._hold_cursor(conversation['channel_id'], after_id or str(int(thread_id) - 1))
+            logger.warning(f"Failed to fetch thread {thread_id} for message {conversation['message_id']}: {e}")
+            return False
+
+        for thread_msg in thread_msgs:
+            if not thread_msg.get('author', {}).get('bot', False):
+                thread_author = thread_msg.get('author', {})
+                content = thread_msg.get('content', '')
+                conversation['thread_messages'].append(content)
+                conversation['quotes'].append(f"'{content}' - (from {thread_author.get('username', 'Unknown')})")
+        return True
+
+    def updated_threads(self, channel, after_id, thread_cursor):
+        """
+        Returns the channel's threads, active or archived since `thread_cursor`,
+        that started on a message at or below `after_id` (ingested by an
+        earlier run) and have messages above `thread_cursor`. A thread's ID is
+        the ID of the message it started on.
+        """
+        active = [t for t in self.fetch_active_threads(channel.get('guild_id'))
+                  if t.get('parent_id') == channel['id']] if channel.get('guild_id') else []
+        archived = list(self.iter_archived_threads(channel['id'], snowflake_time(thread_cursor)))
+        threads = {t['id']: t for t in active + archived}
+        return [t for t in threads.values()
+                if int(t['id']) <= int(after_id) and int(t.get('last_message_id') or 0) > int(thread_cursor)]
+
+    def _revisit_thread(self, conversations, channel_id, channel_name, thread, thread_cursor):
+        try:
+            starter = self._get(f"/channels/{channel_id}/messages/{thread['id']}")
+        except requests.exceptions.RequestException:
+            # The starter message may be gone; the thread's name still gives context.
+            starter = {"id": thread['id'], "content": thread.get('name', '')}
+        conversation = build_conversation(channel_id, channel_name, starter)
+        # The starter was quoted by the run that ingested it; only the new replies are quoted now.
+        conversation['quotes'] = []
+        if not self._fill_thread(conversation, thread['id'], thread_cursor):
+            return
+        self._count("revisited_threads")
+        if conversation['thread_messages']:
+            conversations.append(conversation)
+
+    def ingest_channel(self, channel_id, after_timestamp, executor, after_id=None, thread_cursor=None):
+        """
+        Returns the non-bot conversations of a channel newer than `after_timestamp`
+        (and `after_id`, when given). With a `thread_cursor` as well, threads
+        on older messages are revisited, and their replies above the cursor
+        become conversations too. Thread fetches are submitted to `executor`
+        while later pages are still loading. Requests are attributed to the
+        channel's name in the invocation's metrics.
+        """
+        channel = self.fetch_channel(channel_id)
+        channel_name = channel.get('name', channel_id)
+        conversations = []
+        revisited = []
+        pending = []
+
+        with metrics.channel(channel_name):
+            fill_thread = metrics.in_context(self._fill_thread)
+            for page in self.iter_message_pages(channel_id, after_timestamp, after_id):
+                for msg in page:
+                    if msg.get('author', {}).get('bot', False):
+                        continue
+                    conversation = build_conversation(channel_id, channel_name, msg)
+                    if 'thread' in msg:
+                        pending.append(executor.submit(fill_thread, conversation, msg['thread']['id']))
+                    conversations.append(conversation)
+
+            if after_id is not None and thread_cursor is not None:
+                revisit = metrics.in_context(self._revisit_thread)
+                try:
+                    threads = self.updated_threads({**channel, "id": channel_id}, after_id, thread_cursor)
+                except requests.exceptions.RequestException as e:
+                    self._count("thread_errors")
+                    self._hold_cursor(channel_id, thread_cursor)
+                    logger.warning(f"Failed to list threads of channel {channel_id}; they are revisited next run: {e}")
+                    threads = []
+                for thread in threads:
+                    pending.append(executor.submit(revisit, revisited, channel_id, channel_name, thread,
+                                                   thread_cursor))
+
+        for future in pending:
+            future.result()
+        return conversations + sorted(revisited, key=lambda conversation: int(conversation['message_id']))
+
+    def ingest(self, channel_ids, after_timestamp, watermarks=None):
+        """
+        Ingests every channel in order. `watermarks` maps channel IDs to the
+        stored watermark (`message_id`, `thread_cursor`); only newer messages,
+        and thread replies above the cursor, are fetched. Each channel's new
+        watermark goes to `high_water`, with this run's start as its thread
+        cursor, or a lower one when some threads could not be read. A failing channel is logged, skipped, and left out of `high_water`.
+        """
+        watermarks = watermarks or {}
+        thread_cursor = snowflake_at(datetime.now(timezone.utc))
+        all_conversations = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for channel_id in channel_ids:
+                mark = watermarks.get(channel_id) or {}
+                after_id = mark.get('message_id')
+                logger.info(f"Fetching messages from channel: {channel_id} (after message {after_id})")
+                try:
+                    all_conversations.extend(self.ingest_channel(channel_id, after_timestamp, executor, after_id,
+                                                                 mark.get('thread_cursor')))
+                except requests.exceptions.RequestException as e:
+                    self.high_water.pop(channel_id, None)
+                    logger.error(f"Failed to fetch data for channel {channel_id}: {e}")
+                    # Continue to the next channel instead of failing the whole function
+                    continue
+                newest = self.high_water.get(channel_id) or {key: mark.get(key) for key in ("message_id", "timestamp")}
+                if newest.get('message_id'):
+                    held = self._cursor_holds.get(channel_id)
+                    cursor = held if held is not None and int(held) < int(thread_cursor) else thread_cursor
+                    self.high_water[channel_id] = {**newest, "thread_cursor": cursor}
+        return all_conversations
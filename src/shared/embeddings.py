@@ -0,0 +1,214 @@
+import os
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+
+from shared.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "text-embedding-3-small"
+DYNAMODB_BATCH_GET_LIMIT = 100
+
+
+def embedding_key(model, text):
+    """
+    Content address of an embedding: a SHA-256 over the model name and the text.
+    """
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def to_bytes(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype=np.float32)
+
+
+class DynamoDBEmbeddingStore:
+    """
+    Persists float32 embeddings as binary attributes, one item per key.
+    Items carry an `expires_at` epoch so the table's TTL can age them out.
+    """
+
+    def __init__(self, table_name, ttl_days=90, dynamodb=None):
+        self.dynamodb = dynamodb or boto3.resource('dynamodb')
+        self.table_name = table_name
+        self.table = self.dynamodb.Table(table_name)
+        self.ttl_seconds = int(ttl_days * 86400)
+
+    def get_many(self, keys):
+        found = {}
+        for start in range(0, len(keys), DYNAMODB_BATCH_GET_LIMIT):
+            request = {self.table_name: {"Keys": [{"embedding_key": k} for k in keys[start:start + DYNAMODB_BATCH_GET_LIMIT]]}}
+            while request:
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(self.table_name, []):
+                    found[item["embedding_key"]] = from_bytes(item["vector"].value)
+                request = response.get("UnprocessedKeys") or None
+        return found
+
+    def put_many(self, vectors):
+        expires_at = int(time.time()) + self.ttl_seconds
+        with self.table.batch_writer(overwrite_by_pkeys=["embedding_key"]) as batch:
+            for key, vector in vectors.items():
+                batch.put_item(Item={"embedding_key": key, "vector": to_bytes(vector), "expires_at": expires_at})
+
+
+class S3EmbeddingStore:
+    """
+    Persists float32 embeddings as one raw object per key under `prefix`.
+    """
+
+    def __init__(self, bucket, prefix="embeddings/", max_workers=16, s3=None):
+        self.s3 = s3 or boto3.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_workers = max_workers
+
+    def _get(self, key):
+        try:
+            body = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")["Body"].read()
+            return key, from_bytes(body)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return key, None
+            raise
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(keys))) as executor:
+            return {key: vector for key, vector in executor.map(self._get, keys) if vector is not None}
+
+    def put_many(self, vectors):
+        if not vectors:
+            return
+
+        def put(item):
+            key, vector = item
+            self.s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}{key}", Body=to_bytes(vector))
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(vectors))) as executor:
+            list(executor.map(put, vectors.items()))
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: an in-process LRU in front of an
+    optional persistent store. Misses are embedded in one batched request.
+    """
+
+    def __init__(self, store=None, max_entries=10_000):
+        self.store = store
+        self.max_entries = max_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"requested": 0, "memory_hits": 0, "store_hits": 0, "misses": 0,
+                      "evictions": 0, "embedded_tokens": 0, "saved_tokens": 0}
+
+    def _count(self, key, amount):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _recall(self, key):
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+            return vector
+
+    def embed(self, gateway, texts, model=DEFAULT_MODEL):
+        """
+        Returns a float32 matrix with one row per text, in input order.
+        Misses are embedded through `gateway` (an `OpenAIGateway`).
+        """
+        keys = [embedding_key(model, text) for text in texts]
+        unique = dict(zip(keys, texts))
+        self._count("requested", len(texts))
+
+        vectors = {}
+        for key in unique:
+            vector = self._recall(key)
+            if vector is not None:
+                vectors[key] = vector
+        self._count("memory_hits", len(vectors))
+
+        missing = [key for key in unique if key not in vectors]
+        if missing and self.store:
+            try:
+                stored = self.store.get_many(missing)
+            except Exception as e:
+                logger.warning(f"Embedding cache read failed, embedding everything: {e}")
+                stored = {}
+            for key, vector in stored.items():
+                vectors[key] = vector
+                self._remember(key, vector)
+            self._count("store_hits", len(stored))
+            missing = [key for key in missing if key not in stored]
+
+        hit_tokens = sum(count_tokens(unique[key]) for key in unique if key not in missing)
+        self._count("saved_tokens", hit_tokens)
+
+        if missing:
+            self._count("misses", len(missing))
+            response = gateway.embed([unique[key] for key in missing], model)
+            embedded = {key: np.asarray(item.embedding, dtype=np.float32)
+                        for key, item in zip(missing, response.data)}
+            usage = getattr(response, "usage", None)
+            self._count("embedded_tokens", getattr(usage, "total_tokens", 0) or 0)
+            for key, vector in embedded.items():
+                vectors[key] = vector
+                self._remember(key, vector)
+            if self.store:
+                try:
+                    self.store.put_many(embedded)
+                except Exception as e:
+                    logger.warning(f"Embedding cache write failed: {e}")
+
+        return np.vstack([vectors[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    def hit_rate(self):
+        unique_lookups = self.stats["memory_hits"] + self.stats["store_hits"] + self.stats["misses"]
+        if not unique_lookups:
+            return 0.0
+        return (self.stats["memory_hits"] + self.stats["store_hits"]) / unique_lookups
+
+    def metrics(self):
+        return {**self.stats, "hit_rate": round(self.hit_rate(), 4)}
+
+
+_cache = None
+
+
+def get_embedding_cache():
+    """
+    Returns the process-wide cache, so warm Lambda containers keep their LRU.
+    Backed by DynamoDB when `EMBEDDING_CACHE_TABLE` is set, by S3 when
+    `EMBEDDING_CACHE_BUCKET` is set, otherwise in-memory only.
+    """
+    global _cache
+    if _cache is None:
+        store = None
+        if os.environ.get("EMBEDDING_CACHE_TABLE"):
+            store = DynamoDBEmbeddingStore(os.environ["EMBEDDING_CACHE_TABLE"])
+        elif os.environ.get("EMBEDDING_CACHE_BUCKET"):
+            store = S3EmbeddingStore(os.environ["EMBEDDING_CACHE_BUCKET"])
+        _cache = EmbeddingCache(store, int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "10000")))
+    return _cache
@@ -0,0 +1,219 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from shared import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Request budget for one rate-limit bucket, refilled from the server's
+    `X-RateLimit-*` headers rather than a locally guessed rate.
+    """
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes one token if available. Otherwise returns how long the caller
+        should sleep before trying again.
+        """
+        with self.lock:
+            if self.remaining is None:
+                return 0.0
+            now = time.monotonic()
+            if self.reset_at is not None and now >= self.reset_at:
+                self.remaining = self.limit
+                # The next response reports when the new window ends.
+                self.reset_at = None
+            if self.remaining > 0:
+                self.remaining -= 1
+                return 0.0
+            if self.reset_at is None:
+                return 0.05
+            return self.reset_at - now
+
+    def update(self, limit, remaining, reset_after):
+        with self.lock:
+            if limit is not None:
+                self.limit = limit
+            if remaining is not None:
+                # Responses to requests that were already in flight report a stale
+                # count, so never hand back tokens we have reserved since.
+                self.remaining = remaining if self.remaining is None else min(self.remaining, remaining)
+                if self.limit is None:
+                    self.limit = remaining + 1
+            if reset_after is not None:
+                self.reset_at = time.monotonic() + reset_after
+
+
+def _float_header(headers, name):
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimitedClient:
+    """
+    A pooled `requests` session that respects per-route rate-limit buckets,
+    honours 429 `retry_after`, and retries transient failures with jittered
+    exponential backoff.
+
+    Routes default to `METHOD host/path`. When a server reports an
+    `X-RateLimit-Bucket`, all routes that share that bucket share one budget.
+    Each request is recorded as a call to `name` (default: the host) in the
+    invocation's metrics. `on_unauthorized` is called on every 401, e.g. to
+    drop cached credentials that were rotated.
+    """
+
+    def __init__(self, headers=None, pool_size=10, max_retries=5, backoff_base=0.5, backoff_cap=30.0,
+                 timeout=30, session=None, name=None, on_unauthorized=None):
+        self.name = name
+        self.on_unauthorized = on_unauthorized
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+
+        self._buckets = {}
+        self._route_buckets = {}
+        self._global_reset_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "wait_seconds": 0.0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _bucket_for(self, route):
+        with self._lock:
+            key = self._route_buckets.get(route, route)
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket()
+            return self._buckets[key]
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            self._count("wait_seconds", seconds)
+            time.sleep(seconds)
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform between 0 and the capped exponential delay.
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _record_headers(self, route, headers):
+        bucket_id = headers.get("X-RateLimit-Bucket")
+        if bucket_id:
+            # Discord shares buckets across routes but scopes them per major parameter,
+            # so the route's path stays part of the key.
+            key = f"{bucket_id}:{route.split(' ', 1)[-1]}"
+            with self._lock:
+                if self._route_buckets.get(route) != key:
+                    self._route_buckets[route] = key
+                    self._buckets.setdefault(key, TokenBucket())
+        limit = _float_header(headers, "X-RateLimit-Limit")
+        remaining = _float_header(headers, "X-RateLimit-Remaining")
+        reset_after = _float_header(headers, "X-RateLimit-Reset-After")
+        if limit is None and remaining is None and reset_after is None:
+            return
+        self._bucket_for(route).update(
+            int(limit) if limit is not None else None,
+            int(remaining) if remaining is not None else None,
+            reset_after
+        )
+
+    def _retry_after(self, response):
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        retry_after = body.get("retry_after") if isinstance(body, dict) else None
+        if retry_after is None:
+            retry_after = _float_header(response.headers, "Retry-After")
+        is_global = (isinstance(body, dict) and body.get("global")) or \
+            response.headers.get("X-RateLimit-Global") == "true"
+        return float(retry_after if retry_after is not None else self.backoff_base), bool(is_global)
+
+    def request(self, method, url, route=None, **kwargs):
+        """
+        Sends a request, waiting on its bucket first and retrying 429s, 5xx
+        responses and connection errors. Returns the final `requests.Response`;
+        raises the last connection error if every attempt failed.
+        """
+        parsed = urlparse(url)
+        route = route or f"{method.upper()} {parsed.netloc}{parsed.path}"
+        kwargs.setdefault("timeout", self.timeout)
+        with metrics.span(self.name or parsed.netloc) as span:
+            response = self._request(method, url, route, span, **kwargs)
+            span.error = response.status_code >= 400
+            return response
+
+    def _request(self, method, url, route, span, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._sleep(self._global_reset_at - time.monotonic())
+            bucket = self._bucket_for(route)
+            while (wait := bucket.reserve()) > 0:
+                self._sleep(wait)
+
+            self._count("requests")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"{route} failed with {e.__class__.__name__}; retrying (attempt {attempt + 1})")
+                self._count("retries")
+                span.retries += 1
+                self._sleep(self._backoff(attempt))
+                continue
+
+            self._record_headers(route, response.headers)
+            if response.status_code == 401 and self.on_unauthorized:
+                self.on_unauthorized()
+            if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                return response
+
+            self._count("retries")
+            span.retries += 1
+            if response.status_code == 429:
+                self._count("rate_limited")
+                retry_after, is_global = self._retry_after(response)
+                # A little jitter keeps concurrent workers from stampeding the reset.
+                delay = retry_after + random.uniform(0, min(1.0, retry_after * 0.1 + 0.05))
+                logger.warning(f"{route} rate limited (global={is_global}); waiting {delay:.2f}s")
+                if is_global:
+                    with self._lock:
+                        self._global_reset_at = max(self._global_reset_at, time.monotonic() + delay)
+                else:
+                    self._sleep(delay)
+            else:
+                logger.warning(f"{route} returned {response.status_code}; retrying (attempt {attempt + 1})")
+                self._sleep(self._backoff(attempt))
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
@@ -0,0 +1,169 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_DAYS = 14
+
+
+def normalize_text(text):
+    """
+    Collapses whitespace so formatting-only differences map to the same key.
+    """
+    return " ".join((text or "").split())
+
+
+def response_cache_key(model, **inputs):
+    """
+    SHA-256 over the model name and the normalized prompt inputs. Lists are
+    deduplicated and sorted, so quote order does not change the key.
+    """
+    normalized = {}
+    for name, value in inputs.items():
+        if isinstance(value, (list, tuple)):
+            normalized[name] = sorted({normalize_text(v) for v in value})
+        else:
+            normalized[name] = normalize_text(value)
+    payload = json.dumps({"model": model, "inputs": normalized}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryResponseStore:
+    """
+    Keeps responses for the life of the process (a warm Lambda container).
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+        if item and item[1] > time.time():
+            return item[0]
+        return None
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            self._items[key] = (value, expires_at)
+
+    def claim(self, key, expires_at):
+        with self._lock:
+            item = self._items.get(key)
+            if item and item[1] > time.time():
+                return False
+            self._items[key] = ("", expires_at)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class DynamoDBResponseStore:
+    """
+    Stores one item per key with an `expires_at` epoch for the table's TTL.
+    DynamoDB deletes expired items lazily, so reads check the expiry too.
+    """
+
+    def __init__(self, table_name, dynamodb=None):
+        self.table = (dynamodb or boto3.resource('dynamodb')).Table(table_name)
+
+    def get(self, key):
+        item = self.table.get_item(Key={"cache_key": key}).get("Item")
+        if item and int(item["expires_at"]) > time.time():
+            return item["response"]
+        return None
+
+    def put(self, key, value, expires_at):
+        self.table.put_item(Item={"cache_key": key, "response": value, "expires_at": int(expires_at)})
+
+    def claim(self, key, expires_at):
+        try:
+            self.table.put_item(Item={"cache_key": key, "response": "", "expires_at": int(expires_at)},
+                                ConditionExpression="attribute_not_exists(cache_key) OR expires_at < :now",
+                                ExpressionAttributeValues={":now": int(time.time())})
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return False
+        return True
+
+    def delete(self, key):
+        self.table.delete_item(Key={"cache_key": key})
+
+
+class ResponseCache:
+    """
+    A TTL cache of LLM responses. Store failures are logged and treated as misses.
+    """
+
+    def __init__(self, store, ttl_seconds):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, key, count=True):
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            logger.warning(f"LLM response cache read failed: {e}")
+            value = None
+        if count:
+            self._count("hits" if value is not None else "misses")
+        return value
+
+    def put(self, key, value):
+        try:
+            self.store.put(key, value, time.time() + self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"LLM response cache write failed: {e}")
+
+    def claim(self, key, lease_seconds):
+        """
+        Takes a lease on `key` for `lease_seconds`, marking a call as in
+        flight. Returns False while another caller holds an unexpired lease.
+        A store failure grants the lease, so callers fall back to calling.
+        """
+        try:
+            return self.store.claim(key, time.time() + lease_seconds)
+        except Exception as e:
+            logger.warning(f"LLM response cache lease failed: {e}")
+            return True
+
+    def release(self, key):
+        try:
+            self.store.delete(key)
+        except Exception as e:
+            logger.warning(f"LLM response cache lease release failed: {e}")
+
+
+_cache = None
+
+
+def get_response_cache():
+    """
+    Returns the process-wide response cache. Backed by DynamoDB when
+    `LLM_CACHE_TABLE` is set, otherwise by process memory. Entries live for
+    `LLM_CACHE_TTL_DAYS` days (default 14).
+    """
+    global _cache
+    if _cache is None:
+        ttl_seconds = float(os.environ.get("LLM_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS)) * 86400
+        table_name = os.environ.get("LLM_CACHE_TABLE")
+        store = DynamoDBResponseStore(table_name) if table_name else MemoryResponseStore()
+        _cache = ResponseCache(store, ttl_seconds)
+    return _cache
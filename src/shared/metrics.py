@@ -0,0 +1,351 @@
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE = "DocInsightWorkflow"
+# USD per million tokens (prompt, completion); override with MODEL_PRICES='{"model": [prompt, completion]}'.
+MODEL_PRICES = {
+    "gpt-4-turbo-preview": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+_current = contextvars.ContextVar("metrics_recorder", default=None)
+_channel = contextvars.ContextVar("metrics_channel", default=None)
+# Threads started by a handler do not inherit its context; in Lambda only one invocation runs at a time.
+_active = None
+_cold_start = True
+_unpriced = set()
+
+
+def _write_stdout(document):
+    sys.stdout.write(json.dumps(document, separators=(",", ":")) + "\n")
+    sys.stdout.flush()
+
+
+_sink = _write_stdout
+
+
+def set_sink(sink):
+    """
+    Sends metric documents to `sink(document)` instead of stdout, e.g. to
+    aggregate them in the offline runner. Returns the previous sink.
+    """
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+
+@functools.lru_cache(maxsize=1)
+def model_prices():
+    prices = dict(MODEL_PRICES)
+    override = os.environ.get("MODEL_PRICES")
+    if override:
+        prices.update({model: tuple(value) for model, value in json.loads(override).items()})
+    return prices
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens=0):
+    """
+    Returns the estimated USD cost of a call, or 0 for a model without a price.
+    """
+    price = model_prices().get(model)
+    if price is None:
+        if model not in _unpriced:
+            _unpriced.add(model)
+            logger.warning(f"No price configured for model {model}; its cost is reported as 0.")
+        return 0.0
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+
+def _new_usage():
+    return {"calls": 0, "errors": 0, "retries": 0, "duration_ms": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+
+class Recorder:
+    """
+    Accumulates one invocation's calls and token usage by dependency, model
+    and channel, and emits them as CloudWatch Embedded Metric Format.
+    """
+
+    def __init__(self, stage, function_name=None, request_id=None, cold_start=False):
+        self.stage = stage
+        self.function_name = function_name
+        self.request_id = request_id
+        self.cold_start = cold_start
+        self.duration_ms = 0.0
+        self.failed = False
+        self.dependencies = {}
+        self.models = {}
+        self.channels = {}
+        self._lock = threading.Lock()
+
+    def record_call(self, dependency, duration_ms, error=False, retries=0, channel=None):
+        with self._lock:
+            for usage in self._usages(dependencies=dependency, channels=channel):
+                usage["calls"] += 1
+                usage["errors"] += int(error)
+                usage["retries"] += retries
+                usage["duration_ms"] += duration_ms
+
+    def record_tokens(self, model, prompt_tokens, completion_tokens=0, channels=None):
+        """
+        Adds a call's token usage. `channels` is a channel name, or a dict of
+        channel names to weights when one call served several channels.
+        """
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        if isinstance(channels, str):
+            channels = {channels: 1}
+        channels = channels or {}
+        total_weight = sum(channels.values())
+        with self._lock:
+            usage = self._usages(models=model)[0]
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["cost"] += cost
+            for channel, weight in channels.items():
+                share = weight / total_weight if total_weight else 0
+                usage = self._usages(channels=channel)[0]
+                usage["prompt_tokens"] += prompt_tokens * share
+                usage["completion_tokens"] += completion_tokens * share
+                usage["cost"] += cost * share
+
+    def _usages(self, dependencies=None, models=None, channels=None):
+        found = []
+        for table, key in ((self.dependencies, dependencies), (self.models, models), (self.channels, channels)):
+            if key is not None:
+                found.append(table.setdefault(str(key), _new_usage()))
+        return found
+
+    def documents(self, namespace=None):
+        """
+        Returns the EMF documents of this invocation: one for the stage and
+        one per dependency, model and channel, each with its own dimensions.
+        """
+        namespace = namespace or os.environ.get("METRICS_NAMESPACE", DEFAULT_NAMESPACE)
+        timestamp = int(time.time() * 1000)
+        properties = {key: value for key, value in (("FunctionName", self.function_name),
+                                                    ("RequestId", self.request_id)) if value}
+        prompt_tokens = sum(usage["prompt_tokens"] for usage in self.models.values())
+        completion_tokens = sum(usage["completion_tokens"] for usage in self.models.values())
+        cost = sum(usage["cost"] for usage in self.models.values())
+
+        def document(dimensions, metrics):
+            return {
+                "_aws": {"Timestamp": timestamp, "CloudWatchMetrics": [{
+                    "Namespace": namespace,
+                    "Dimensions": [["Stage", *dimensions]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()],
+                }]},
+                "Stage": self.stage, **dimensions, **properties,
+                **{name: value for name, (value, _) in metrics.items()},
+            }
+
+        documents = [document({}, {
+            "Duration": (round(self.duration_ms, 3), "Milliseconds"),
+            "Errors": (int(self.failed), "Count"),
+            "ColdStart": (int(self.cold_start), "Count"),
+            "PromptTokens": (prompt_tokens, "Count"),
+            "CompletionTokens": (completion_tokens, "Count"),
+            "EstimatedCost": (round(cost, 6), "None"),
+        })]
+        for name, usage in self.dependencies.items():
+            documents.append(document({"Dependency": name}, {
+                "Calls": (usage["calls"], "Count"),
+                "Errors": (usage["errors"], "Count"),
+                "Retries": (usage["retries"], "Count"),
+                "Duration": (round(usage["duration_ms"], 3), "Milliseconds"),
+            }))
+        for name, usage in self.models.items():
+            documents.append(document({"Model": name}, {
+                "PromptTokens": (usage["prompt_tokens"], "Count"),
+                "CompletionTokens": (usage["completion_tokens"], "Count"),
+                "EstimatedCost": (round(usage["cost"], 6), "None"),
+            }))
+        for name, usage in self.channels.items():
+            documents.append(document({"Channel": name}, {
+                "Calls": (usage["calls"], "Count"),
+                "Duration": (round(usage["duration_ms"], 3), "Milliseconds"),
+                "PromptTokens": (round(usage["prompt_tokens"]), "Count"),
+                "CompletionTokens": (round(usage["completion_tokens"]), "Count"),
+                "EstimatedCost": (round(usage["cost"], 6), "None"),
+            }))
+        return documents
+
+    def emit(self):
+        if os.environ.get("METRICS_ENABLED", "true").lower() != "true":
+            return
+        for document in self.documents():
+            try:
+                _sink(document)
+            except Exception as e:
+                logger.warning(f"Failed to emit metrics for {self.stage}: {e}")
+
+
+def current():
+    """
+    Returns the recorder of the running invocation, or None outside an instrumented handler.
+    """
+    return _current.get() or _active
+
+
+class Span:
+    def __init__(self, dependency, channel):
+        self.dependency = dependency
+        self.channel = channel
+        self.retries = 0
+        self.error = False
+
+
+@contextmanager
+def span(dependency, channel=None):
+    """
+    Times one call to `dependency` (e.g. "openai", "pinecone", "discord")
+    and records it on the running invocation. Set `.retries` on the yielded
+    span for attempts the call needed beyond the first; an exception counts
+    as an error and is re-raised.
+    """
+    recorder = current()
+    record = Span(dependency, channel or _channel.get())
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception:
+        record.error = True
+        raise
+    finally:
+        if recorder is not None:
+            recorder.record_call(dependency, (time.perf_counter() - start) * 1000, record.error, record.retries,
+                                 record.channel)
+
+
+def record_tokens(model, prompt_tokens, completion_tokens=0, channels=None):
+    recorder = current()
+    if recorder is not None:
+        recorder.record_tokens(model, prompt_tokens or 0, completion_tokens or 0, channels or _channel.get())
+
+
+@contextmanager
+def channel(name):
+    """
+    Attributes the calls and tokens recorded inside the block to channel `name`.
+    """
+    token = _channel.set(name)
+    try:
+        yield
+    finally:
+        _channel.reset(token)
+
+
+def in_context(function):
+    """
+    Wraps `function` to run in a copy of the caller's context, so work handed
+    to a thread pool keeps its invocation and channel attribution.
+    """
+    context = contextvars.copy_context()
+    return functools.wraps(function)(lambda *args, **kwargs: context.copy().run(function, *args, **kwargs))
+
+
+def _before_aws_call(model, context, **kwargs):
+    context["metrics_service"] = model.service_model.service_name
+    context["metrics_start"] = time.perf_counter()
+
+
+def _record_aws_call(context, error, retries=0):
+    recorder = current()
+    start = context.get("metrics_start")
+    if recorder is not None and start is not None:
+        recorder.record_call(context["metrics_service"], (time.perf_counter() - start) * 1000, error, retries,
+                             _channel.get())
+
+
+def _after_aws_call(context, parsed, **kwargs):
+    _record_aws_call(context, "Error" in parsed, parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+
+
+def _after_aws_call_error(context, **kwargs):
+    # Raised before a response was parsed, e.g. a connection error after all retries.
+    _record_aws_call(context, True)
+
+
+_hooked_session = None
+_hook_lock = threading.Lock()
+
+
+def install_aws_hooks():
+    """
+    Times every call made by boto3 clients of the default session. Clients
+    copy the session's hooks when they are created, so this runs at import,
+    before handlers create their clients.
+    """
+    global _hooked_session
+    with _hook_lock:
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        session = boto3.DEFAULT_SESSION
+        if session is _hooked_session:
+            return
+        session.events.register("before-call", _before_aws_call, unique_id="shared.metrics.before-call")
+        session.events.register("after-call", _after_aws_call, unique_id="shared.metrics.after-call")
+        session.events.register("after-call-error", _after_aws_call_error,
+                                unique_id="shared.metrics.after-call-error")
+        _hooked_session = session
+
+
+def stage_name(handler):
+    """
+    Returns the stage a handler reports as: its module name, suffixed with
+    the function name for handlers other than `handler`.
+    """
+    module = handler.__module__.rsplit(".", 1)[-1]
+    return module if handler.__name__ == "handler" else f"{module}.{handler.__name__}"
+
+
+def instrument(stage=None):
+    """
+    Decorates a Lambda handler: its duration, errors, cold start, and the
+    calls and tokens recorded by spans while it runs are emitted as EMF when
+    it returns. `stage` defaults to `stage_name(handler)`.
+    """
+    def decorate(handler):
+        name = stage or stage_name(handler)
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _active, _cold_start
+            install_aws_hooks()
+            recorder = Recorder(name, getattr(context, "function_name", None),
+                                getattr(context, "aws_request_id", None), _cold_start)
+            _cold_start = False
+            token = _current.set(recorder)
+            _active = recorder
+            start = time.perf_counter()
+            try:
+                return handler(event, context)
+            except Exception:
+                recorder.failed = True
+                raise
+            finally:
+                recorder.duration_ms = (time.perf_counter() - start) * 1000
+                _current.reset(token)
+                if _active is recorder:
+                    _active = None
+                recorder.emit()
+
+        return wrapper
+    return decorate
+
+
+install_aws_hooks()
@@ -0,0 +1,382 @@
+import os
+import re
+import heapq
+import random
+import logging
+import itertools
+import threading
+import time
+
+from shared import metrics
+from shared.tokens import count_tokens
+from shared.utils import get_secret, get_secrets_provider
+
+logger = logging.getLogger(__name__)
+
+# Call priorities; a lower value is admitted first when calls queue for the same limits.
+EXTRACTION = 0
+EMBEDDING = 1
+SUGGESTION = 2
+
+# Tokens the chat format adds around each message, and around the whole prompt.
+PER_MESSAGE_TOKENS = 4
+PER_PROMPT_TOKENS = 3
+# Completion tokens reserved for a chat call without `max_tokens`; corrected from `usage` afterwards.
+DEFAULT_COMPLETION_TOKENS = 1000
+DEFAULT_MAX_RETRIES = 6
+# Share of each limit that suggestion and embedding calls leave free for extraction calls.
+DEFAULT_LOW_PRIORITY_HEADROOM = 0.2
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value):
+    """
+    Parses an OpenAI reset duration such as "1s", "6m0s" or "20ms" (or plain
+    seconds) into seconds. Returns None when there is nothing to parse.
+    """
+    if value is None:
+        return None
+    parts = _DURATION.findall(str(value))
+    if parts:
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _int_header(headers, name):
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_chat_tokens(messages, model, max_tokens=None):
+    """
+    Estimates what a chat call counts against the tokens-per-minute limit:
+    the prompt plus the completion budget.
+    """
+    prompt = sum(count_tokens(str(message.get("content", "")), model) + PER_MESSAGE_TOKENS for message in messages)
+    return prompt + PER_PROMPT_TOKENS + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class RateBucket:
+    """
+    One per-minute limit (requests or tokens) as a continuously refilling
+    bucket, which is how OpenAI replenishes them. Until a limit is known,
+    from config or a response header, everything is admitted.
+    """
+
+    def __init__(self, limit=None, period=60.0):
+        self.limit = limit
+        self.period = period
+        self.available = float(limit) if limit else None
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        if self.limit and self.available is not None:
+            self.available = min(self.limit, self.available + (now - self.updated_at) * self.limit / self.period)
+        self.updated_at = now
+
+    def wait_time(self, amount, reserve, now):
+        """
+        Seconds until `amount` can be taken while leaving `reserve` (a share
+        of the limit) untouched. A request larger than the whole limit waits
+        for a full bucket.
+        """
+        if not self.limit or self.available is None:
+            return 0.0
+        self._refill(now)
+        needed = min(amount + reserve * self.limit, self.limit)
+        return max(0.0, (needed - self.available) * self.period / self.limit)
+
+    def take(self, amount):
+        if self.available is not None:
+            self.available -= amount
+
+    def update(self, limit, remaining, in_flight, now):
+        """
+        Follows the limit and remaining amount a response reported. The
+        response may not count calls this process still has in flight, so
+        their reservations stay taken.
+        """
+        self._refill(now)
+        if limit:
+            self.limit = limit
+            if self.available is None:
+                self.available = float(limit)
+        if remaining is not None and self.available is not None:
+            self.available = remaining - in_flight
+
+
+class RateLimiter:
+    """
+    Admits calls against one model's request and token limits. Waiting calls
+    are served by priority, then in arrival order; calls below extraction
+    priority also leave `low_priority_headroom` of each limit free, so that
+    other containers' extraction calls find room even though only this
+    process's queue is ordered.
+    """
+
+    def __init__(self, rpm=None, tpm=None, low_priority_headroom=0.0):
+        self.requests = RateBucket(rpm)
+        self.tokens = RateBucket(tpm)
+        self.low_priority_headroom = low_priority_headroom
+        self._paused_until = 0.0
+        self._in_flight_requests = 0
+        self._in_flight_tokens = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens, priority):
+        """
+        Blocks until a call of `tokens` estimated tokens may be sent.
+        Returns the seconds spent waiting.
+        """
+        entry = (priority, next(self._sequence))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._queue[0] != entry:
+                        self._cond.wait()
+                        continue
+                    now = time.monotonic()
+                    reserve = self.low_priority_headroom if priority > EXTRACTION else 0.0
+                    wait = max(self._paused_until - now, self.requests.wait_time(1, reserve, now),
+                               self.tokens.wait_time(tokens, reserve, now))
+                    if wait <= 0:
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        self._in_flight_requests += 1
+                        self._in_flight_tokens += tokens
+                        return time.monotonic() - start
+                    self._cond.wait(wait)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def release(self, estimated, used=0):
+        """
+        Ends a call admitted for `estimated` tokens. Usage beyond the
+        estimate is charged; unused tokens are not returned, as OpenAI
+        counts the estimate too.
+        """
+        with self._cond:
+            self._in_flight_requests -= 1
+            self._in_flight_tokens -= estimated
+            self.tokens.take(max(0, used - estimated))
+
+    def update(self, headers):
+        """
+        Corrects both buckets from a response's `x-ratelimit-*` headers.
+        Release the call the response belongs to first.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self.requests.update(_int_header(headers, "x-ratelimit-limit-requests"),
+                                 _int_header(headers, "x-ratelimit-remaining-requests"),
+                                 self._in_flight_requests, now)
+            self.tokens.update(_int_header(headers, "x-ratelimit-limit-tokens"),
+                               _int_header(headers, "x-ratelimit-remaining-tokens"),
+                               self._in_flight_tokens, now)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """
+        Holds every call for `seconds`, after a 429.
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+
+class OpenAIGateway:
+    """
+    The single path for OpenAI calls. Each call's tokens are estimated before
+    it is sent and admitted through its model's `RateLimiter`. Limits start
+    from `rpm`/`tpm` (unknown when None) and follow the `x-ratelimit-*`
+    headers of every response. 429s, 5xx and connection errors are retried
+    with jittered exponential backoff, honouring `retry-after`. Usage is
+    recorded in the invocation's metrics. `on_unauthorized` is called when
+    OpenAI rejects the API key.
+    """
+
+    def __init__(self, client, rpm=None, tpm=None, max_retries=DEFAULT_MAX_RETRIES, backoff_base=1.0,
+                 backoff_cap=60.0, low_priority_headroom=DEFAULT_LOW_PRIORITY_HEADROOM, on_unauthorized=None):
+        self.client = client
+        self.on_unauthorized = on_unauthorized
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.low_priority_headroom = low_priority_headroom
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0, "wait_seconds": 0.0,
+                      "estimated_tokens": 0, "used_tokens": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def limiter(self, model):
+        with self._lock:
+            if model not in self._limiters:
+                self._limiters[model] = RateLimiter(self.rpm, self.tpm, self.low_priority_headroom)
+            return self._limiters[model]
+
+    def chat(self, messages, model, priority=SUGGESTION, channels=None, deadline=None, **kwargs):
+        """
+        Sends a chat completion and returns the parsed response. `channels`
+        attributes its cost, as for `metrics.record_tokens`. With a `deadline`
+        (a `time.monotonic()` value), each attempt's `timeout` is cut to the
+        time left and no retry is made that could not finish before it.
+        """
+        estimate = estimate_chat_tokens(messages, model, kwargs.get("max_tokens"))
+        timeout = kwargs.pop("timeout", None)
+
+        def send():
+            left = _time_left(deadline)
+            attempt_timeout = timeout if left is None else min(left, timeout or left)
+            if attempt_timeout is not None:
+                return self.client.chat.completions.with_raw_response.create(
+                    model=model, messages=messages, timeout=attempt_timeout, **kwargs)
+            return self.client.chat.completions.with_raw_response.create(model=model, messages=messages, **kwargs)
+
+        return self._call(model, priority, estimate, channels, send, deadline)
+
+    def embed(self, texts, model, priority=EMBEDDING, channels=None):
+        """
+        Embeds `texts` in one request and returns the parsed response.
+        """
+        estimate = sum(count_tokens(text, model) for text in texts)
+        return self._call(model, priority, estimate, channels, lambda: self.client.embeddings.with_raw_response
+                          .create(input=texts, model=model))
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, headers, attempt):
+        for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            value = parse_duration(headers.get(name))
+            if value is not None:
+                return value * scale
+        resets = [parse_duration(headers.get(name)) for name in ("x-ratelimit-reset-requests",
+                                                                 "x-ratelimit-reset-tokens")]
+        # A reset is the time until the bucket is full again, more than the call needs.
+        resets = [reset for reset in resets if reset]
+        return min(min(resets), self.backoff_cap) if resets else self._backoff(attempt)
+
+    def _can_retry(self, attempt, delay, deadline):
+        left = _time_left(deadline)
+        return attempt < self.max_retries and (left is None or delay < left)
+
+    def _call(self, model, priority, estimate, channels, send, deadline=None):
+        import openai
+
+        limiter = self.limiter(model)
+        self._count("estimated_tokens", estimate)
+        with metrics.span("openai", channel=channels if isinstance(channels, str) else None) as span:
+            for attempt in range(self.max_retries + 1):
+                self._count("wait_seconds", limiter.acquire(estimate, priority))
+                left = _time_left(deadline)
+                if left is not None and left <= 0:
+                    limiter.release(estimate)
+                    self._count("failed")
+                    raise TimeoutError(f"OpenAI {model} call passed its deadline after {attempt} attempts")
+                self._count("requests")
+                used = 0
+                try:
+                    try:
+                        raw = send()
+                        response = raw.parse()
+                        usage = getattr(response, "usage", None)
+                        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+                        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+                        used = prompt_tokens + completion_tokens
+                    finally:
+                        # Whatever is raised, the reservation must not outlive the call.
+                        limiter.release(estimate, used)
+                except openai.APIStatusError as e:
+                    limiter.update(e.response.headers)
+                    if e.status_code == 401 and self.on_unauthorized:
+                        self.on_unauthorized()
+                    body = e.body if isinstance(e.body, dict) else {}
+                    permanent = e.status_code not in RETRYABLE_STATUS or body.get("code") == "insufficient_quota"
+                    delay = self._retry_after(e.response.headers, attempt)
+                    if permanent or not self._can_retry(attempt, delay, deadline):
+                        self._count("failed")
+                        raise
+                    if e.status_code == 429:
+                        self._count("rate_limited")
+                        # Jitter keeps the waiting calls from all retrying at the same instant.
+                        limiter.pause(delay + random.uniform(0, min(1.0, delay * 0.1 + 0.05)))
+                    else:
+                        time.sleep(delay)
+                    logger.warning(f"OpenAI {model} returned {e.status_code}; retrying in {delay:.2f}s "
+                                   f"(attempt {attempt + 1})")
+                except openai.APIConnectionError as e:
+                    delay = self._backoff(attempt)
+                    if not self._can_retry(attempt, delay, deadline):
+                        self._count("failed")
+                        raise
+                    logger.warning(f"OpenAI {model} failed with {e.__class__.__name__}; retrying in {delay:.2f}s "
+                                   f"(attempt {attempt + 1})")
+                    time.sleep(delay)
+                else:
+                    limiter.update(raw.headers)
+                    self._count("used_tokens", used)
+                    metrics.record_tokens(model, prompt_tokens, completion_tokens, channels)
+                    return response
+                self._count("retries")
+                span.retries += 1
+
+
+def _time_left(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+
+_gateway = None
+_gateway_key = None
+_gateway_lock = threading.Lock()
+
+
+def _optional_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def get_openai_gateway(api_key=None):
+    """
+    Returns the process-wide gateway, created on first use. The SDK takes most
+    of a handler's import time, so it is only imported here. The client does
+    not retry on its own, since the gateway does. Limits come from
+    `OPENAI_RPM_LIMIT` and `OPENAI_TPM_LIMIT` (per model) until responses
+    report them. A rejected key invalidates the cached secrets, and the
+    rotated key that is read next gets a new gateway.
+    """
+    global _gateway, _gateway_key
+    api_key = api_key or get_secret("OPENAI_API_KEY")
+    with _gateway_lock:
+        if _gateway is None or _gateway_key != api_key:
+            import openai
+            _gateway = OpenAIGateway(
+                openai.OpenAI(api_key=api_key, max_retries=0),
+                rpm=_optional_int("OPENAI_RPM_LIMIT"),
+                tpm=_optional_int("OPENAI_TPM_LIMIT"),
+                max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                low_priority_headroom=float(os.environ.get("OPENAI_LOW_PRIORITY_HEADROOM",
+                                                           DEFAULT_LOW_PRIORITY_HEADROOM)),
+                on_unauthorized=get_secrets_provider().invalidate)
+            _gateway_key = api_key
+        return _gateway
@@ -0,0 +1,278 @@
+import os
+import io
+import gzip
+import json
+import itertools
+import uuid
+import logging
+import threading
+import tempfile
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# Step Functions caps the whole execution state at 256KB. Each step's result
+# is merged into it by ResultPath, so a result keeps at most this much inline.
+STATE_LIMIT_BYTES = 256 * 1024
+DEFAULT_INLINE_LIMIT = 64 * 1024
+DEFAULT_PREFIX = "payloads/"
+# Uploads are buffered in memory up to this size, then on /tmp.
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+_s3 = None
+_s3_lock = threading.Lock()
+
+
+def get_s3_client():
+    global _s3
+    with _s3_lock:
+        if _s3 is None:
+            _s3 = boto3.client('s3')
+        return _s3
+
+
+def _settings():
+    return (os.environ.get("PAYLOAD_BUCKET"),
+            int(os.environ.get("PAYLOAD_INLINE_LIMIT", DEFAULT_INLINE_LIMIT)),
+            os.environ.get("PAYLOAD_PREFIX", DEFAULT_PREFIX))
+
+
+def _encode(record):
+    return (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+
+class InlineBudget:
+    """
+    Bytes one step result may keep inline, shared by every `spill` that
+    builds it. Pass the step's input as `state` when the result is merged
+    next to it (e.g. `ResultPath: "$.insights"` on the full state); the
+    budget is then also capped by what is left of the 256KB state.
+    """
+
+    def __init__(self, state=None):
+        self.remaining = _settings()[1]
+        if state is not None:
+            self.remaining = min(self.remaining, STATE_LIMIT_BYTES - len(_encode(state)))
+
+    def charge(self, size):
+        self.remaining -= size
+
+
+def _read_inline(records, budget):
+    """
+    Reads `records` while they fit in `budget`, encoding each one once.
+    Returns the records read, their encodings and the iterator of records
+    not read yet, which is None when all of them fit (and were charged).
+    """
+    records = iter(records)
+    read, encoded, size = [], [], 0
+    for record in records:
+        line = _encode(record)
+        read.append(record)
+        encoded.append(line)
+        size += len(line)
+        if size > budget.remaining:
+            return read, encoded, records
+    budget.charge(size)
+    return read, encoded, None
+
+
+def _upload(name, chunks, bucket, prefix):
+    """
+    Writes the byte `chunks` to a new `<prefix><uuid>/<name>.jsonl.gz` object
+    through a spooled buffer, so large payloads never sit in memory twice.
+    Returns the object key and size.
+    """
+    key = f"{prefix}{uuid.uuid4().hex}/{name}.jsonl.gz"
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as buffer:
+        for chunk in chunks:
+            buffer.write(chunk)
+        size = buffer.tell()
+        buffer.seek(0)
+        get_s3_client().upload_fileobj(buffer, bucket, key)
+    return key, size
+
+
+def spill(name, records, summary=None, budget=None):
+    """
+    Returns `{name: records}` when the records fit inline. Otherwise writes
+    them to `PAYLOAD_BUCKET` as gzip-compressed JSON Lines and returns a
+    claim check instead: `{"<name>_ref": {"bucket", "key", "count", "bytes"}}`,
+    plus `summary` (a small dict for the state) under `<name>_summary`.
+    Without a bucket the records always stay inline.
+
+    `records` may be any iterable; past the inline budget it is streamed
+    to S3 without being held in memory. Spills that end up in the same
+    step result should share one `budget`.
+    """
+    bucket, _, prefix = _settings()
+    budget = budget or InlineBudget()
+    read, encoded, rest = _read_inline(records, budget)
+    if rest is None:
+        return {name: read}
+    if not bucket:
+        logger.warning(f"'{name}' exceeds the inline budget but PAYLOAD_BUCKET is not set; returning it inline.")
+        return {name: read + list(rest)}
+    count = len(read)
+    del read
+
+    def compressed():
+        nonlocal count
+        stream = io.BytesIO()
+        with gzip.GzipFile(fileobj=stream, mode="wb") as gz:
+            for line in encoded:
+                gz.write(line)
+            encoded.clear()
+            for record in rest:
+                gz.write(_encode(record))
+                count += 1
+                if stream.tell() >= SPOOL_MAX_BYTES:
+                    yield stream.getvalue()
+                    stream.seek(0)
+                    stream.truncate()
+        yield stream.getvalue()
+
+    key, size = _upload(name, compressed(), bucket, prefix)
+    logger.info(f"Spilled {count} '{name}' records ({size} compressed bytes) to s3://{bucket}/{key}")
+    result = {f"{name}_ref": {"bucket": bucket, "key": key, "count": count, "bytes": size}}
+    if summary is not None:
+        result[f"{name}_summary"] = summary
+        budget.charge(len(_encode(summary)))
+    return result
+
+
+def spill_items(name, records, keep=("summary",), budget=None):
+    """
+    Like `spill`, for records that a Map state iterates over. When spilled,
+    the state keeps one small stub per record (the `keep` fields plus a
+    `record_ref`) and each record is its own gzip member in the object, so
+    `resolve_item` can fetch it with a single ranged GET.
+    """
+    bucket, _, prefix = _settings()
+    budget = budget or InlineBudget()
+    read, encoded, rest = _read_inline(records, budget)
+    if rest is None:
+        return {name: read}
+    if not bucket:
+        logger.warning(f"'{name}' exceeds the inline budget but PAYLOAD_BUCKET is not set; returning it inline.")
+        return {name: read + list(rest)}
+
+    # The stubs are filled in as the members are written, since the object key comes last.
+    stubs = []
+
+    def members():
+        position = 0
+        pending = zip(read, encoded)
+        for record, line in itertools.chain(pending, ((record, _encode(record)) for record in rest)):
+            member = gzip.compress(line)
+            stubs.append(({field: record.get(field) for field in keep if field in record}, position, len(member)))
+            position += len(member)
+            yield member
+
+    key, size = _upload(name, members(), bucket, prefix)
+    logger.info(f"Spilled {len(stubs)} '{name}' items ({size} compressed bytes) to s3://{bucket}/{key}")
+    stubs = [{**fields, "record_ref": {"bucket": bucket, "key": key, "offset": offset, "length": length}}
+             for fields, offset, length in stubs]
+    budget.charge(sum(len(_encode(stub)) for stub in stubs))
+    return {name: stubs, f"{name}_ref": {"bucket": bucket, "key": key, "count": len(stubs), "bytes": size}}
+
+
+def iter_records(event, name):
+    """
+    Yields the `name` records of a step's input, reading them inline or
+    streaming them line by line from the `<name>_ref` claim check.
+    Spilled Map items (stubs) are yielded resolved.
+    """
+    ref = event.get(f"{name}_ref")
+    if ref is None:
+        for record in event.get(name, []):
+            yield resolve_item(record)
+        return
+    body = get_s3_client().get_object(Bucket=ref["bucket"], Key=ref["key"])["Body"]
+    with gzip.GzipFile(fileobj=body, mode="rb") as gz:
+        for line in gz:
+            if line.strip():
+                yield json.loads(line)
+
+
+def resolve_item(event):
+    """
+    Returns a Map item with its spilled record merged back in. Fields added
+    to the item by earlier steps (e.g. `documentation`) are kept.
+    """
+    ref = event.get("record_ref") if isinstance(event, dict) else None
+    if not ref:
+        return event
+    record = json.loads(gzip.decompress(_read_range(ref)))
+    extra = {key: value for key, value in event.items() if key != "record_ref"}
+    return {**record, **extra}
+
+
+def _read_range(ref):
+    end = ref["offset"] + ref["length"] - 1
+    return get_s3_client().get_object(Bucket=ref["bucket"], Key=ref["key"],
+                                      Range=f"bytes={ref['offset']}-{end}")["Body"].read()
+
+
+def detach_field(name, records, field):
+    """
+    Moves `field` out of each record into one `PAYLOAD_BUCKET` object (a
+    gzip member per value) and leaves a `<field>_ref` byte range in its
+    place. For bulky values that only the last step of a workflow reads,
+    so the steps in between neither carry nor resolve them. Without a
+    bucket the records are returned as they are.
+    """
+    bucket, _, prefix = _settings()
+    if not bucket or not any(field in record for record in records):
+        return records
+    ranges = []
+
+    def members():
+        position = 0
+        for record in records:
+            if field not in record:
+                ranges.append(None)
+                continue
+            member = gzip.compress(_encode(record[field]))
+            ranges.append((position, len(member)))
+            position += len(member)
+            yield member
+
+    key, size = _upload(f"{name}-{field}", members(), bucket, prefix)
+    logger.info(f"Detached '{field}' of {len(records)} '{name}' records ({size} compressed bytes) "
+                f"to s3://{bucket}/{key}")
+    detached = []
+    for record, span in zip(records, ranges):
+        if span is None:
+            detached.append(record)
+            continue
+        rest = {k: v for k, v in record.items() if k != field}
+        detached.append({**rest, f"{field}_ref": {"bucket": bucket, "key": key,
+                                                  "offset": span[0], "length": span[1]}})
+    return detached
+
+
+def attach_field(records, field):
+    """
+    Returns the records with `field` read back from their `<field>_ref`
+    (see `detach_field`). Refs into the same object are served by one GET
+    of the whole object, a single ref by a ranged GET.
+    """
+    records = list(records)
+    by_object = {}
+    for i, record in enumerate(records):
+        ref = record.get(f"{field}_ref")
+        if ref:
+            by_object.setdefault((ref["bucket"], ref["key"]), []).append(i)
+    for (bucket, key), positions in by_object.items():
+        body = None
+        if len(positions) > 1:
+            body = get_s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+        for i in positions:
+            ref = records[i][f"{field}_ref"]
+            member = (body[ref["offset"]:ref["offset"] + ref["length"]] if body is not None
+                      else _read_range(ref))
+            rest = {k: v for k, v in records[i].items() if k != f"{field}_ref"}
+            records[i] = {**rest, field: json.loads(gzip.decompress(member))}
+    return records
@@ -0,0 +1,100 @@
+import re
+import math
+from collections import Counter
+
+from shared.tokens import count_tokens
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text):
+    return _WORD.findall((text or "").lower())
+
+
+def bm25_scores(query, documents, k1=BM25_K1, b=BM25_B):
+    """
+    Okapi BM25 score of each document for `query`. Term statistics come from
+    `documents` themselves, which here are the retrieved candidates.
+    """
+    docs = [tokenize(document) for document in documents]
+    if not docs:
+        return []
+    avg_length = sum(map(len, docs)) / len(docs) or 1.0
+    doc_freq = Counter(term for doc in docs for term in set(doc))
+    query_terms = set(tokenize(query))
+
+    scores = []
+    for doc in docs:
+        term_freq = Counter(doc)
+        score = 0.0
+        for term in query_terms:
+            tf = term_freq[term]
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_length))
+        scores.append(score)
+    return scores
+
+
+def rerank(matches, query, bm25_weight=0.3):
+    """
+    Reorders vector store matches by a blend of their cosine similarity and
+    their BM25 score for `query` (scaled to [0, 1] by the best candidate).
+    Returns new match dicts with `score`, `cosine` and `bm25` set, best first.
+    """
+    lexical = bm25_scores(query, [match['metadata'].get('text', '') for match in matches])
+    best = max(lexical, default=0.0) or 1.0
+    ranked = []
+    for match, bm25 in zip(matches, lexical):
+        cosine = float(match.get('score') or 0.0)
+        ranked.append({
+            **match,
+            "cosine": round(cosine, 4),
+            "bm25": round(bm25 / best, 4),
+            "score": round((1 - bm25_weight) * cosine + bm25_weight * bm25 / best, 4)
+        })
+    return sorted(ranked, key=lambda match: match["score"], reverse=True)
+
+
+def assemble_context(ranked, token_budget, min_relative_score=0.0, model="gpt-4o"):
+    """
+    Picks the best ranked chunks that fit in `token_budget`, dropping chunks
+    scoring below `min_relative_score` times the top score, and groups them
+    by page URL, pages ordered by their best chunk. Returns the documentation
+    payload passed to the suggestion step: the top page `url`, the selected
+    `chunks` with their scores, and the `context_tokens` they use.
+    """
+    selected, seen, used = [], set(), 0
+    cutoff = ranked[0]["score"] * min_relative_score if ranked else 0.0
+    for match in ranked:
+        text = (match['metadata'].get('text') or '').strip()
+        if not text or text in seen or match["score"] < cutoff:
+            continue
+        tokens = count_tokens(text, model)
+        if used + tokens > token_budget:
+            continue
+        seen.add(text)
+        used += tokens
+        selected.append({
+            "id": match.get('id'),
+            "url": match['metadata'].get('url'),
+            "text": text,
+            "score": match["score"],
+            "cosine": match["cosine"],
+            "bm25": match["bm25"],
+            "tokens": tokens
+        })
+
+    pages = {}
+    for chunk in selected:
+        pages.setdefault(chunk["url"], []).append(chunk)
+    chunks = [chunk for page in pages.values() for chunk in page]
+    return {
+        "url": chunks[0]["url"] if chunks else None,
+        "chunks": chunks,
+        "context_tokens": used
+    }
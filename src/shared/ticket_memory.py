@@ -0,0 +1,103 @@
+import os
+import base64
+import logging
+
+import boto3
+import numpy as np
+
+from shared.embeddings import to_bytes, from_bytes
+from shared.vector_store import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MATCH_THRESHOLD = 0.85
+# Linear workflow states after which a recurring issue should get a new ticket.
+CLOSED_STATUSES = {"Done", "Canceled", "Cancelled", "Duplicate"}
+
+
+def encode_centroid(vector):
+    """
+    Encodes a centroid as base64 float32 bytes, compact enough for the
+    workflow state and decodable without loss.
+    """
+    return base64.b64encode(to_bytes(vector)).decode("ascii")
+
+
+def decode_centroid(value):
+    return from_bytes(base64.b64decode(value))
+
+
+def merge_centroids(centroids, sizes):
+    """
+    Size-weighted mean of unit centroids, renormalized.
+    """
+    weighted = np.sum([np.asarray(c, dtype=np.float32) * size for c, size in zip(centroids, sizes)], axis=0)
+    return normalize_rows(weighted)[0]
+
+
+class TicketMemory:
+    """
+    Centroids of the clusters behind open tickets, as one normalized float32
+    matrix. `match` assigns new cluster centroids to the most similar open
+    ticket with a single matrix product.
+    """
+
+    def __init__(self, tickets, centroids):
+        self.tickets = tickets
+        self.matrix = normalize_rows(centroids) if tickets else np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.tickets)
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Loads every open ticket that has a stored centroid from the tickets table.
+        """
+        tickets, centroids = [], []
+        kwargs = {
+            "ProjectionExpression": "ticket_id, ticket_identifier, ticket_url, #s, centroid, cluster_size",
+            "ExpressionAttributeNames": {"#s": "status"}
+        }
+        while True:
+            response = table.scan(**kwargs)
+            for item in response.get("Items", []):
+                if "centroid" not in item or item.get("status") in CLOSED_STATUSES:
+                    continue
+                tickets.append({
+                    "ticket_id": item["ticket_id"],
+                    "ticket_identifier": item.get("ticket_identifier"),
+                    "ticket_url": item.get("ticket_url"),
+                    "cluster_size": int(item.get("cluster_size", 1))
+                })
+                centroids.append(from_bytes(bytes(item["centroid"])))
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        logger.info(f"Loaded {len(tickets)} open ticket centroids.")
+        return cls(tickets, centroids)
+
+    def match(self, centroids, threshold=DEFAULT_MATCH_THRESHOLD):
+        """
+        Returns, per centroid, `(position, similarity)` of the most similar
+        open ticket in `tickets` at or above `threshold`, or None.
+        """
+        if not len(self) or not len(centroids):
+            return [None] * len(centroids)
+        scores = normalize_rows(centroids) @ self.matrix.T
+        best = scores.argmax(axis=1)
+        return [
+            (int(j), float(scores[i, j])) if scores[i, j] >= threshold else None
+            for i, j in enumerate(best)
+        ]
+
+
+def get_ticket_memory(table_name=None, dynamodb=None):
+    """
+    Loads the memory from `DYNAMODB_TABLE`; returns None when no table is configured.
+    """
+    table_name = table_name or os.environ.get("DYNAMODB_TABLE")
+    if not table_name:
+        return None
+    dynamodb = dynamodb or boto3.resource('dynamodb')
+    return TicketMemory.from_table(dynamodb.Table(table_name))
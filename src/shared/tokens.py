@@ -0,0 +1,47 @@
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Rough average for English prose with OpenAI tokenizers, used when tiktoken is unavailable.
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken fetches its BPE files on first use; fall back rather than fail the run.
+        logger.warning(f"Could not load tiktoken encoding for {model}, estimating tokens instead: {e}")
+        return None
+
+
+def count_tokens(text, model="gpt-4-turbo-preview"):
+    """
+    Counts the tokens `text` occupies for `model`. Uses tiktoken when it is
+    installed, otherwise a characters-per-token estimate.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model="gpt-4-turbo-preview"):
+    """
+    Returns the longest prefix of `text` that fits in `max_tokens`.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
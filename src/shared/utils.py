@@ -1,46 +1,241 @@
 import os
-import boto3
 import json
+import time
+import logging
+import threading
+import urllib.request
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# Secrets are re-read after this long; a stale value is served while a refresh runs.
+DEFAULT_TTL_SECONDS = 300
+# The AWS Parameters and Secrets Lambda Extension listens here by default.
+DEFAULT_EXTENSION_PORT = 2773
+# A missing key triggers at most one refetch per interval, in case the secret was rotated.
+MISSING_KEY_REFETCH_SECONDS = 30
+
+LOCAL_SECRET_KEYS = ("DISCORD_BOT_TOKEN", "DISCORD_CHANNEL_IDS", "LINEAR_API_KEY", "LINEAR_WEBHOOK_SECRET",
+                     "OPENAI_API_KEY", "PINECONE_API_KEY", "PINECONE_ENVIRONMENT", "PINECONE_INDEX_NAME")
+
+_secretsmanager = None
+_secretsmanager_lock = threading.Lock()
+
+
+def get_secretsmanager_client():
+    """
+    Returns the process-wide Secrets Manager client.
+    """
+    global _secretsmanager
+    with _secretsmanager_lock:
+        if _secretsmanager is None:
+            _secretsmanager = boto3.client('secretsmanager')
+        return _secretsmanager
+
+
+class EnvironmentBackend:
+    """
+    Reads secrets from environment variables, for `sam local` and local runs.
+    """
+    name = "environment"
+
+    def fetch(self, secret_id):
+        return {key: os.environ.get(key) for key in LOCAL_SECRET_KEYS}
+
+
+class SecretsManagerBackend:
+    name = "secretsmanager"
+
+    def fetch(self, secret_id):
+        response = get_secretsmanager_client().get_secret_value(SecretId=secret_id)
+        return json.loads(response['SecretString'])
+
+
+class ExtensionBackend:
+    """
+    Reads secrets through the AWS Parameters and Secrets Lambda Extension,
+    which caches them inside the execution environment. `endpoint` defaults
+    to the extension's localhost port, so a local stub can stand in for it.
+    """
+    name = "extension"
+
+    def __init__(self, endpoint=None, timeout=5):
+        port = os.environ.get("PARAMETERS_SECRETS_EXTENSION_HTTP_PORT", DEFAULT_EXTENSION_PORT)
+        self.endpoint = (endpoint or os.environ.get("SECRETS_EXTENSION_ENDPOINT")
+                         or f"http://localhost:{port}").rstrip("/")
+        self.timeout = timeout
+
+    def fetch(self, secret_id):
+        url = f"{self.endpoint}/secretsmanager/get?secretId={urllib.request.quote(secret_id, safe='')}"
+        request = urllib.request.Request(url, headers={
+            "X-Aws-Parameters-Secrets-Token": os.environ.get("AWS_SESSION_TOKEN", "")})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(json.loads(response.read())["SecretString"])
+
+
+def default_backend():
+    if os.environ.get("AWS_SAM_LOCAL"):
+        return EnvironmentBackend()
+    if os.environ.get("SECRETS_BACKEND", "secretsmanager") == "extension":
+        return ExtensionBackend()
+    return SecretsManagerBackend()
+
+
+class SecretsProvider:
+    """
+    Caches one JSON secret with a TTL. Within `ttl` the cached value is
+    returned; for another `ttl` after that it is still returned while a
+    background thread refreshes it; beyond that callers wait for a fetch.
+    A failed background refresh keeps the old value. Asking for a key the
+    cached secret does not have refetches it once, for rotated secrets.
+    """
+
+    def __init__(self, secret_id=None, backend=None, ttl=None):
+        self.secret_id = secret_id
+        self.backend = backend
+        self.ttl = float(ttl if ttl is not None else os.environ.get("SECRETS_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self._value = None
+        self._fetched_at = 0.0
+        self._missing_refetch_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._reported = False
+        self.stats = {"fetches": 0, "refreshes": 0, "refresh_errors": 0, "fetch_seconds": 0.0,
+                      "wait_seconds": 0.0, "prefetched": False, "backend": None}
+
+    def _backend(self):
+        if self.backend is None:
+            self.backend = default_backend()
+        return self.backend
+
+    def _secret_id(self):
+        secret_id = self.secret_id or os.environ.get("SECRETS_ARN")
+        if not secret_id and not isinstance(self._backend(), EnvironmentBackend):
+            raise ValueError("SECRETS_ARN environment variable not set.")
+        return secret_id
+
+    def _fetch(self, force=True):
+        with self._fetch_lock:
+            with self._lock:
+                # Whoever held the fetch lock before us (e.g. the prefetch) may have just fetched it.
+                if not force and self._value is not None and time.monotonic() - self._fetched_at < self.ttl:
+                    return self._value
+            start = time.perf_counter()
+            value = self._backend().fetch(self._secret_id())
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._value = value
+                self._fetched_at = time.monotonic()
+                self.stats["fetches"] += 1
+                self.stats["fetch_seconds"] += elapsed
+                self.stats["backend"] = self._backend().name
+            return value
+
+    def _refresh_in_background(self, force=True):
+        try:
+            self._fetch(force)
+            with self._lock:
+                self.stats["refreshes"] += 1
+        except Exception as e:
+            logger.warning(f"Background secrets refresh failed; keeping the cached value: {e}")
+            with self._lock:
+                self.stats["refresh_errors"] += 1
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def prefetch(self):
+        """
+        Starts fetching in a background thread, so the round trip overlaps
+        with the rest of the cold start.
+        """
+        with self._lock:
+            if self._value is not None or self._refreshing:
+                return
+            self._refreshing = True
+            self.stats["prefetched"] = True
+        threading.Thread(target=self._refresh_in_background, args=(False,), daemon=True).start()
+
+    def get_all(self):
+        start = time.perf_counter()
+        with self._lock:
+            value, age = self._value, time.monotonic() - self._fetched_at
+            start_refresh = value is not None and self.ttl <= age < 2 * self.ttl and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        if start_refresh:
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        if value is None or age >= 2 * self.ttl:
+            # A prefetch in flight holds the fetch lock; waiting on it reuses its result.
+            value = self._fetch(force=False)
+        self._report(time.perf_counter() - start)
+        return value
+
+    def get(self, key, default=None):
+        value = self.get_all()
+        if key in value:
+            return value[key]
+        with self._lock:
+            refetch = time.monotonic() >= self._missing_refetch_at
+            if refetch:
+                self._missing_refetch_at = time.monotonic() + MISSING_KEY_REFETCH_SECONDS
+        if refetch:
+            value = self._fetch()
+        return value.get(key, default)
+
+    def invalidate(self):
+        """
+        Drops the cached value after a credential was rejected, so the next
+        read fetches the rotated one. A value fetched in the last
+        MISSING_KEY_REFETCH_SECONDS is kept, so a revoked key does not turn
+        every failed call into a fetch. Returns whether it was dropped.
+        """
+        with self._lock:
+            if self._value is None or time.monotonic() - self._fetched_at < MISSING_KEY_REFETCH_SECONDS:
+                return False
+            self._value = None
+        logger.info("Cached secrets invalidated after a rejected credential.")
+        return True
+
+    def _report(self, waited):
+        with self._lock:
+            self.stats["wait_seconds"] += waited
+            if self._reported:
+                return
+            self._reported = True
+            report = {"backend": self.stats["backend"], "prefetched": self.stats["prefetched"],
+                      "fetch_ms": round(self.stats["fetch_seconds"] * 1000, 1),
+                      "waited_ms": round(waited * 1000, 1)}
+        # Only the first read of a cold container carries the secrets cost of its start.
+        logger.info(f"Secrets cold start: {json.dumps(report)}")
+
+
+_provider = SecretsProvider()
+
+
+def get_secrets_provider():
+    return _provider
+
+
+def get_secret(key, default=None):
+    """
+    Returns one secret through the shared provider. A key missing from the
+    cached secret is refetched (at most every MISSING_KEY_REFETCH_SECONDS).
+    """
+    return _provider.get(key, default)
 
-_secrets_cache = None
 
 def get_secrets():
     """
     Retrieves secrets.
     If running locally (AWS_SAM_LOCAL is true), it reads secrets directly from environment variables.
-    Otherwise, it fetches them from AWS Secrets Manager and caches the result.
+    Otherwise, it fetches them from AWS Secrets Manager (or the Lambda extension with
+    SECRETS_BACKEND=extension) through the shared, TTL-refreshed provider.
     """
-    global _secrets_cache
-    if _secrets_cache:
-        return _secrets_cache
+    return _provider.get_all()
 
-    # Check if we are in a local SAM environment
-    if os.environ.get("AWS_SAM_LOCAL"):
-        print("Running in local mode. Loading secrets from environment variables.")
-        _secrets_cache = {
-            "DISCORD_BOT_TOKEN": os.environ.get("DISCORD_BOT_TOKEN"),
-            "DISCORD_CHANNEL_IDS": os.environ.get("DISCORD_CHANNEL_IDS"),
-            "LINEAR_API_KEY": os.environ.get("LINEAR_API_KEY"),
-            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY"),
-            "PINECONE_API_KEY": os.environ.get("PINECONE_API_KEY"),
-            "PINECONE_ENVIRONMENT": os.environ.get("PINECONE_ENVIRONMENT"),
-            "PINECONE_INDEX_NAME": os.environ.get("PINECONE_INDEX_NAME"),
-        }
-        return _secrets_cache
-
-    # --- Deployed environment logic ---
-    secret_arn = os.environ.get("SECRETS_ARN")
-    if not secret_arn:
-        raise ValueError("SECRETS_ARN environment variable not set.")
-
-    session = boto3.session.Session()
-    client = session.client(service_name='secretsmanager')
-
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_arn)
-        secret = get_secret_value_response['SecretString']
-        _secrets_cache = json.loads(secret)
-        return _secrets_cache
-    except Exception as e:
-        print(f"Error retrieving secrets from AWS Secrets Manager: {e}")
-        raise e
\ No newline at end of file
+
+if os.environ.get("SECRETS_PREFETCH", "").lower() in ("1", "true", "yes") and os.environ.get("SECRETS_ARN"):
+    _provider.prefetch()
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from shared import metrics
+
+logger = logging.getLogger(__name__)
+
+PINECONE_UPSERT_BATCH = 100
+
+
+def normalize_rows(vectors):
+    """
+    Returns `vectors` as a float32 matrix with unit-length rows.
+    """
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorStore:
+    """
+    Nearest-neighbour search over documentation chunks. Matches are dicts
+    with `id`, `score` (cosine similarity) and `metadata`.
+    """
+
+    def query_many(self, vectors, top_k=1, timings=None):
+        """
+        Returns one list of matches per query vector, best first. When
+        `timings` is a list, per-query latencies in seconds are appended to it.
+        """
+        raise NotImplementedError
+
+    def query(self, vector, top_k=1):
+        return self.query_many([vector], top_k)[0]
+
+    def upsert(self, records):
+        """
+        Inserts or replaces `(id, vector, metadata)` records.
+        """
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    Pinecone-backed store. Queries for a batch run concurrently, one request each.
+    """
+
+    def __init__(self, index, concurrency=8, namespace=None):
+        self.index = index
+        self.concurrency = concurrency
+        self.namespace = namespace
+
+    def _query(self, vector, top_k):
+        start = time.perf_counter()
+        kwargs = {"namespace": self.namespace} if self.namespace else {}
+        with metrics.span("pinecone"):
+            response = self.index.query(vector=list(map(float, vector)), top_k=top_k, include_metadata=True,
+                                        **kwargs)
+        matches = [
+            {"id": match.get('id'), "score": match.get('score'), "metadata": match.get('metadata', {}) or {}}
+            for match in response.get('matches', [])
+        ]
+        return matches, time.perf_counter() - start
+
+    def query_many(self, vectors, top_k=1, timings=None):
+        vectors = list(vectors)
+        if not vectors:
+            return []
+        query = metrics.in_context(self._query)
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(vectors))) as executor:
+            results = list(executor.map(lambda vector: query(vector, top_k), vectors))
+        if timings is not None:
+            timings.extend(latency for _, latency in results)
+        return [matches for matches, _ in results]
+
+    def upsert(self, records):
+        kwargs = {"namespace": self.namespace} if self.namespace else {}
+        records = list(records)
+        for start in range(0, len(records), PINECONE_UPSERT_BATCH):
+            batch = records[start:start + PINECONE_UPSERT_BATCH]
+            with metrics.span("pinecone"):
+                self.index.upsert(vectors=[
+                    {"id": record_id, "values": list(map(float, vector)), "metadata": metadata}
+                    for record_id, vector, metadata in batch
+                ], **kwargs)
+
+    def delete(self, ids):
+        kwargs = {"namespace": self.namespace} if self.namespace else {}
+        ids = list(ids)
+        for start in range(0, len(ids), PINECONE_UPSERT_BATCH):
+            with metrics.span("pinecone"):
+                self.index.delete(ids=ids[start:start + PINECONE_UPSERT_BATCH], **kwargs)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Exact in-process search over a float32 matrix of unit-normalized
+    embeddings, memory-mapped from `<path>.npy`. Chunk IDs and metadata live in
+    the `<path>.json` sidecar, row-aligned with the matrix. A batch of queries
+    is answered with a single matrix product.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.matrix_path = f"{path}.npy"
+        self.sidecar_path = f"{path}.json"
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.matrix_path):
+            self.matrix = np.load(self.matrix_path, mmap_mode='r')
+            with open(self.sidecar_path) as f:
+                sidecar = json.load(f)
+            self.ids = sidecar["ids"]
+            self.metadata = sidecar["metadata"]
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            self.ids, self.metadata = [], []
+        self._positions = {record_id: i for i, record_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query_many(self, vectors, top_k=1, timings=None):
+        vectors = list(vectors)
+        if not vectors:
+            return []
+        start = time.perf_counter()
+        queries = normalize_rows(vectors)
+        if not len(self.ids):
+            results = [[] for _ in range(len(queries))]
+        else:
+            results = []
+            scores = queries @ self.matrix.T
+            k = min(top_k, scores.shape[1])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, candidates in enumerate(top):
+                ordered = candidates[np.argsort(-scores[row, candidates])]
+                results.append([
+                    {"id": self.ids[i], "score": float(scores[row, i]), "metadata": self.metadata[i]}
+                    for i in ordered
+                ])
+
+        if timings is not None:
+            # One product answers the whole batch, so each query is charged its share.
+            timings.extend([(time.perf_counter() - start) / len(queries)] * len(queries))
+        return results
+
+    def _write(self, ids, matrix, metadata):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.matrix_path}.tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+        with open(f"{self.sidecar_path}.tmp", "w") as f:
+            json.dump({"ids": ids, "metadata": metadata}, f)
+        os.replace(f"{self.matrix_path}.tmp", self.matrix_path)
+        os.replace(f"{self.sidecar_path}.tmp", self.sidecar_path)
+        self._load()
+
+    def upsert(self, records):
+        records = list(records)
+        if not records:
+            return
+        ids, metadata = list(self.ids), list(self.metadata)
+        positions = dict(self._positions)
+        new_vectors = normalize_rows([vector for _, vector, _ in records])
+        matrix = np.array(self.matrix, dtype=np.float32) if ids else np.zeros((0, new_vectors.shape[1]), dtype=np.float32)
+
+        appended = []
+        for (record_id, _, record_metadata), vector in zip(records, new_vectors):
+            if record_id in positions and positions[record_id] < len(matrix):
+                matrix[positions[record_id]] = vector
+                metadata[positions[record_id]] = record_metadata
+            elif record_id in positions:
+                appended[positions[record_id] - len(matrix)] = vector
+                metadata[positions[record_id]] = record_metadata
+            else:
+                positions[record_id] = len(ids)
+                ids.append(record_id)
+                appended.append(vector)
+                metadata.append(record_metadata)
+        if appended:
+            matrix = np.vstack([matrix, np.vstack(appended)])
+        self._write(ids, matrix, metadata)
+
+    def delete(self, ids):
+        doomed = set(ids) & set(self._positions)
+        if not doomed:
+            return
+        keep = [i for i, record_id in enumerate(self.ids) if record_id not in doomed]
+        matrix = np.asarray(self.matrix)[keep] if keep else np.zeros((0, self.matrix.shape[1]), dtype=np.float32)
+        self._write([self.ids[i] for i in keep], matrix, [self.metadata[i] for i in keep])
+
+
+def get_vector_store(secrets, backend=None):
+    """
+    Returns the store selected by `backend` or `VECTOR_BACKEND`: `pinecone`
+    (default) or `local`, which reads the index at `LOCAL_VECTOR_INDEX_PATH`.
+    `secrets` is anything with `get(key)`, such as the secrets provider.
+    """
+    backend = (backend or os.environ.get("VECTOR_BACKEND", "pinecone")).lower()
+    if backend == "local":
+        path = os.environ.get("LOCAL_VECTOR_INDEX_PATH")
+        if not path:
+            raise ValueError("LOCAL_VECTOR_INDEX_PATH must be set when VECTOR_BACKEND=local.")
+        return LocalVectorStore(path)
+    if backend != "pinecone":
+        raise ValueError(f"Unknown VECTOR_BACKEND '{backend}'.")
+
+    import pinecone
+
+    pc = pinecone.Pinecone(api_key=secrets.get("PINECONE_API_KEY"))
+    index_name = secrets.get("PINECONE_INDEX_NAME")
+
+    if index_name not in pc.list_indexes().names():
+        logger.error(f"Pinecone index '{index_name}' does not exist.")
+        raise ValueError(f"Pinecone index '{index_name}' does not exist.")
+
+    return PineconeVectorStore(pc.Index(index_name), int(os.environ.get("FIND_DOCS_CONCURRENCY", "8")))
@@ -0,0 +1,223 @@
+import os
+import json
+import logging
+import threading
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+
+class WatermarkStore:
+    """
+    Remembers the newest Discord message seen per channel so the next run
+    only fetches what arrived since. Watermarks are dicts with
+    `message_id` (snowflake string), `timestamp` (ISO-8601) and
+    `thread_cursor` (snowflake string of when the run started; thread
+    replies above it have not been read yet).
+
+    A run stages its watermarks under a stage key (its run ID) and the
+    last workflow step promotes them, so a run that fails part way leaves
+    the previous watermarks in place. Staging again replaces what another
+    run staged; only the run that staged a watermark can promote it.
+    """
+
+    def get(self, channel_id):
+        raise NotImplementedError
+
+    def put(self, channel_id, message_id, timestamp, thread_cursor=None, stage=None):
+        """
+        Moves the channel's watermark forward; a watermark older than the
+        current one is not written. With `stage`, the write also needs that
+        stage's watermark to still be staged, and drops it. Returns whether
+        the watermark was written.
+        """
+        raise NotImplementedError
+
+    def stage(self, channel_id, stage, mark):
+        raise NotImplementedError
+
+    def withdraw(self, channel_id, stage):
+        """
+        Drops the watermark `stage` staged for the channel, if it is still there.
+        """
+        raise NotImplementedError
+
+    def promote(self, channel_id, stage):
+        """
+        Makes the watermark `stage` staged for the channel current. Returns
+        whether there was one to promote.
+        """
+        raise NotImplementedError
+
+    def get_many(self, channel_ids):
+        return {channel_id: self.get(channel_id) for channel_id in channel_ids}
+
+
+class DynamoDBWatermarkStore(WatermarkStore):
+    """
+    Stores one item per channel, keyed by `channel_id`, with the staged
+    watermark in `staged` and its stage key in `staged_run`. Writes are
+    conditional so an older run can never move a watermark backwards.
+    """
+
+    def __init__(self, table_name, dynamodb=None):
+        self.table = (dynamodb or boto3.resource('dynamodb')).Table(table_name)
+
+    def get(self, channel_id):
+        item = self.table.get_item(Key={"channel_id": channel_id}, ConsistentRead=True).get("Item")
+        if not item or "last_message_id" not in item:
+            return None
+        cursor = item.get("thread_cursor")
+        return {"message_id": str(int(item["last_message_id"])), "timestamp": item.get("last_timestamp"),
+                "thread_cursor": str(int(cursor)) if cursor is not None else None}
+
+    def _update(self, channel_id, update, condition, values):
+        try:
+            self.table.update_item(Key={"channel_id": channel_id}, UpdateExpression=update,
+                                   ConditionExpression=condition, ExpressionAttributeValues=values)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def put(self, channel_id, message_id, timestamp, thread_cursor=None, stage=None):
+        update = "SET last_message_id = :id, last_timestamp = :t"
+        values = {":id": Decimal(message_id), ":t": timestamp}
+        # An equal message ID still moves the thread cursor on.
+        condition = "(attribute_not_exists(last_message_id) OR last_message_id <= :id)"
+        if thread_cursor is not None:
+            update += ", thread_cursor = :c"
+            condition += " AND (attribute_not_exists(thread_cursor) OR thread_cursor < :c)"
+            values[":c"] = Decimal(thread_cursor)
+        if stage is not None:
+            update += " REMOVE staged, staged_run"
+            condition += " AND staged_run = :r"
+            values[":r"] = stage
+        written = self._update(channel_id, update, condition, values)
+        if not written:
+            logger.info(f"Watermark for channel {channel_id} is already at or past {message_id}.")
+        return written
+
+    def stage(self, channel_id, stage, mark):
+        self.table.update_item(
+            Key={"channel_id": channel_id},
+            UpdateExpression="SET staged = :m, staged_run = :r",
+            ExpressionAttributeValues={":m": mark, ":r": stage}
+        )
+
+    def withdraw(self, channel_id, stage):
+        self._update(channel_id, "REMOVE staged, staged_run", "staged_run = :r", {":r": stage})
+
+    def promote(self, channel_id, stage):
+        item = self.table.get_item(Key={"channel_id": channel_id}, ConsistentRead=True).get("Item") or {}
+        if item.get("staged_run") != stage:
+            return False
+        mark = item["staged"]
+        if self.put(channel_id, mark["message_id"], mark.get("timestamp"), mark.get("thread_cursor"), stage):
+            return True
+        # Another run already moved the watermark past this one; the staged copy is stale.
+        self.withdraw(channel_id, stage)
+        return False
+
+
+class FileWatermarkStore(WatermarkStore):
+    """
+    Keeps watermarks in a local JSON file, for local runs and tests.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _save(self, state):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, channel_id):
+        entry = self._load().get(channel_id)
+        if not entry or "message_id" not in entry:
+            return None
+        return {key: entry.get(key) for key in ("message_id", "timestamp", "thread_cursor")}
+
+    def _put(self, state, channel_id, message_id, timestamp, thread_cursor, stage):
+        entry = state.get(channel_id, {})
+        if stage is not None and entry.get("staged_run") != stage:
+            return False
+        if "message_id" in entry and int(entry["message_id"]) > int(message_id):
+            return False
+        if thread_cursor is not None and entry.get("thread_cursor") is not None:
+            if int(entry["thread_cursor"]) >= int(thread_cursor):
+                return False
+        entry.update({"message_id": message_id, "timestamp": timestamp})
+        if thread_cursor is not None:
+            entry["thread_cursor"] = thread_cursor
+        if stage is not None:
+            del entry["staged"], entry["staged_run"]
+        state[channel_id] = entry
+        return True
+
+    def put(self, channel_id, message_id, timestamp, thread_cursor=None, stage=None):
+        with self._lock:
+            state = self._load()
+            written = self._put(state, channel_id, message_id, timestamp, thread_cursor, stage)
+            if written:
+                self._save(state)
+            else:
+                logger.info(f"Watermark for channel {channel_id} is already at or past {message_id}.")
+            return written
+
+    def stage(self, channel_id, stage, mark):
+        with self._lock:
+            state = self._load()
+            state.setdefault(channel_id, {}).update({"staged": mark, "staged_run": stage})
+            self._save(state)
+
+    def withdraw(self, channel_id, stage):
+        with self._lock:
+            state = self._load()
+            entry = state.get(channel_id, {})
+            if entry.get("staged_run") == stage:
+                del entry["staged"], entry["staged_run"]
+                self._save(state)
+
+    def promote(self, channel_id, stage):
+        with self._lock:
+            state = self._load()
+            entry = state.get(channel_id, {})
+            if entry.get("staged_run") != stage:
+                return False
+            mark = entry["staged"]
+            promoted = self._put(state, channel_id, mark["message_id"], mark.get("timestamp"),
+                                 mark.get("thread_cursor"), stage)
+            if not promoted:
+                # Another run already moved the watermark past this one; the staged copy is stale.
+                del entry["staged"], entry["staged_run"]
+            self._save(state)
+            return promoted
+
+
+def get_watermark_store():
+    """
+    Returns the configured store: DynamoDB when `INGESTION_STATE_TABLE` is set,
+    a local file when `INGESTION_STATE_FILE` is set, otherwise None
+    (every run reads the full `since_days` window).
+    """
+    table_name = os.environ.get("INGESTION_STATE_TABLE")
+    if table_name:
+        return DynamoDBWatermarkStore(table_name)
+    path = os.environ.get("INGESTION_STATE_FILE")
+    if path:
+        return FileWatermarkStore(path)
+    return None
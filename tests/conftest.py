@@ -0,0 +1,15 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+# The fakes and the synthetic corpora live with the benchmarks.
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+# Tests never read checkpoints or metrics a developer's shell may have configured.
+for name in ("CHECKPOINT_TABLE", "CHECKPOINT_BUCKET", "CHECKPOINT_DIR", "PAYLOAD_BUCKET"):
+    os.environ.pop(name, None)
+os.environ["METRICS_ENABLED"] = "false"
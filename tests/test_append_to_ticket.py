@@ -0,0 +1,98 @@
+import base64
+
+import boto3
+import numpy as np
+import pytest
+from moto import mock_aws
+
+from handlers import append_to_ticket
+
+
+@pytest.fixture
+def table(monkeypatch):
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb")
+        dynamodb.create_table(TableName="tickets", BillingMode="PAY_PER_REQUEST",
+                              KeySchema=[{"AttributeName": "ticket_id", "KeyType": "HASH"}],
+                              AttributeDefinitions=[{"AttributeName": "ticket_id", "AttributeType": "S"}])
+        table = dynamodb.Table("tickets")
+        table.put_item(Item={"ticket_id": "t-1", "ticket_identifier": "DOC-1", "status": "In Progress",
+                             "cluster_size": 3, "recurrences": 0, "quote_count": 3})
+        monkeypatch.setattr(append_to_ticket, "get_table", lambda: table)
+        monkeypatch.setattr(append_to_ticket, "get_secret", lambda key, default=None: "linear-key")
+        yield table
+
+
+@pytest.fixture
+def comments(monkeypatch):
+    posted = []
+    failures = []
+
+    def comment(ticket_id, body, api_key):
+        if failures:
+            raise failures.pop(0)
+        posted.append(ticket_id)
+
+    monkeypatch.setattr(append_to_ticket, "comment_on_ticket", comment)
+    return posted, failures
+
+
+def matched(quotes=("the 401 error again", "still unauthorized", "auth failed")):
+    centroid = base64.b64encode(np.ones(4, dtype=np.float32).tobytes()).decode("ascii")
+    return {"summary": "Auth keeps failing.", "quotes": list(quotes), "channel_name": "help",
+            "similarity": 0.93, "centroid": centroid, "cluster_size": 6,
+            "ticket": {"ticket_id": "t-1", "ticket_identifier": "DOC-1"}}
+
+
+def test_retried_append_counts_the_recurrence_once(table, comments):
+    posted, failures = comments
+    failures.append(RuntimeError("Linear is down"))
+
+    first = append_to_ticket.handler({"matched": [matched()]}, None)
+    ticket = table.get_item(Key={"ticket_id": "t-1"})["Item"]
+    assert first["failed"] == 1
+    assert (ticket["recurrences"], ticket["quote_count"]) == (0, 3)
+
+    for _ in range(2):
+        assert append_to_ticket.handler({"matched": [matched()]}, None)["appended"] == 1
+    ticket = table.get_item(Key={"ticket_id": "t-1"})["Item"]
+    assert (ticket["recurrences"], ticket["quote_count"], ticket["cluster_size"]) == (1, 6, 6)
+    assert ticket["status"] == "In Progress"
+    assert posted == ["t-1", "t-1"]
+
+
+def test_a_new_recurrence_is_counted_again(table, comments):
+    append_to_ticket.handler({"matched": [matched()]}, None)
+    append_to_ticket.handler({"matched": [matched(("login failed", "token invalid", "401 on every call"))]}, None)
+
+    ticket = table.get_item(Key={"ticket_id": "t-1"})["Item"]
+    assert (ticket["recurrences"], ticket["quote_count"]) == (2, 9)
+
+
+def test_missing_ticket_is_not_created(table, comments):
+    item = matched()
+    item["ticket"] = {"ticket_id": "t-gone", "ticket_identifier": "DOC-9"}
+
+    assert append_to_ticket.record_recurrence(table, item) is False
+    assert "Item" not in table.get_item(Key={"ticket_id": "t-gone"})
+
+
+def test_failed_recurrence_write_does_not_comment_again(table, comments, monkeypatch, tmp_path):
+    posted, _ = comments
+    monkeypatch.setenv("CHECKPOINT_DIR", str(tmp_path))
+    record = append_to_ticket.record_recurrence
+    failures = [RuntimeError("ProvisionedThroughputExceededException")]
+
+    def flaky(table, item):
+        if failures:
+            raise failures.pop(0)
+        return record(table, item)
+
+    monkeypatch.setattr(append_to_ticket, "record_recurrence", flaky)
+    event = {"matched": [matched()], "run_id": "run-1"}
+
+    assert append_to_ticket.handler(event, None)["failed"] == 1
+    assert append_to_ticket.handler(event, None)["appended"] == 1
+
+    assert posted == ["t-1"]
+    assert table.get_item(Key={"ticket_id": "t-1"})["Item"]["recurrences"] == 1
@@ -0,0 +1,59 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from handlers import cluster_insights
+
+
+class StubGateway:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.deadlines = []
+
+    def chat(self, messages, model, deadline=None, **kwargs):
+        self.deadlines.append(deadline)
+        if self.fail_on and self.fail_on in messages[0]["content"]:
+            raise TimeoutError("extraction timed out")
+        content = json.dumps({"identified_issues": [{"summary": "[General] Setup is unclear.",
+                                                     "conversation_indices": [0]}]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=SimpleNamespace(prompt_tokens=100, completion_tokens=10))
+
+
+def conversations(channel_id, channel_name, count=2):
+    return [{"channel_id": channel_id, "channel_name": channel_name, "main_message": f"{channel_name} question {i}",
+             "quotes": [f"{channel_name} question {i}"], "thread_messages": []} for i in range(count)]
+
+
+def test_failed_merged_batch_reports_all_its_channels():
+    by_channel = {"help": conversations("1", "help"), "billing": conversations("2", "billing"),
+                  "sdk": conversations("3", "sdk")}
+
+    issues, run_metrics = cluster_insights.extract_issues(StubGateway(fail_on="billing"), by_channel)
+
+    assert run_metrics["chunks"] == 1
+    assert issues == []
+    assert run_metrics["failed_chunks"] == 1
+    assert run_metrics["failed_channels"] == ["1", "2", "3"]
+
+
+def test_extraction_deadline_leaves_the_reserve(monkeypatch):
+    monkeypatch.setenv("EXTRACTION_RESERVE_SECONDS", "30")
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 100_000)
+
+    deadline = cluster_insights.extraction_deadline(context)
+
+    assert deadline - time.monotonic() == pytest.approx(70, abs=1)
+    assert cluster_insights.extraction_deadline(None) is None
+
+
+def test_deadline_reaches_every_extraction_call():
+    gateway = StubGateway()
+    deadline = time.monotonic() + 60
+
+    _, run_metrics = cluster_insights.extract_issues(gateway, {"help": conversations("1", "help")}, deadline=deadline)
+
+    assert gateway.deadlines == [deadline]
+    assert run_metrics["failed_channels"] == []
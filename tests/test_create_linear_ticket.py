@@ -0,0 +1,87 @@
+import pytest
+
+from fake_linear import FakeLinear
+from handlers import create_linear_ticket as linear
+
+CONFIG = ("key", "project", "team")
+
+
+def insight(i, fail=False):
+    return {"summary": f"{'[fail] ' if fail else ''}Users are confused about feature {i}.", "channel_name": "support",
+            "quotes": [f"'How do I configure feature {i}?' - (from user{i})"],
+            "documentation": {"url": f"https://docs.example.com/page-{i}"},
+            "suggestion": {"llm_suggestion": "Add a worked example."}}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with FakeLinear(create_complexity=100) as fake:
+        monkeypatch.setattr(linear, "LINEAR_API_URL", fake.url)
+        yield fake
+
+
+def test_bulk_failures_land_on_their_own_insight(server, monkeypatch):
+    monkeypatch.setenv("LINEAR_BULK_SIZE", "10")
+    events = [insight(i, fail=i % 7 == 3) for i in range(30)]
+
+    tickets = linear.create_tickets(events, *CONFIG)
+
+    for event, ticket in zip(events, tickets):
+        assert ("[fail]" in event["summary"]) == ("error" in ticket), event["summary"]
+        if "error" not in ticket:
+            assert server.issues[ticket["ticket_id"]]["title"] == f"Doc Improvement: {event['summary']}"
+    assert "title is not allowed" in tickets[3]["error"]
+    assert len(server.issues) == 30 - sum(1 for i in range(30) if i % 7 == 3)
+
+
+def test_too_complex_documents_are_split(server, monkeypatch):
+    monkeypatch.setenv("LINEAR_BULK_SIZE", "25")
+    server.create_complexity = 700
+    events = [insight(i) for i in range(25)]
+
+    tickets = linear.create_tickets(events, *CONFIG)
+
+    assert server.rejected >= 1
+    assert all("error" not in ticket for ticket in tickets)
+    assert len(server.issues) == 25
+
+
+def test_creating_the_same_insight_again_returns_the_existing_ticket(server):
+    first = linear.create_tickets([insight(1), insight(2)], *CONFIG)
+    again = linear.create_tickets([insight(2), insight(3)], *CONFIG)
+
+    assert again[0] == first[1]
+    assert len(server.issues) == 3
+    assert server.duplicates == 1
+    assert linear.create_ticket(insight(1), *CONFIG) == first[0]
+
+
+def test_failed_suggestion_creates_no_checkpointed_ticket(server, monkeypatch, tmp_path):
+    monkeypatch.setenv("CHECKPOINT_DIR", str(tmp_path))
+    failed = {**insight(1), "suggestion": {"llm_suggestion": None, "suggestion_error": "OpenAI is down"}}
+
+    tickets = linear.create_tickets([failed, insight(2)], *CONFIG)
+    with pytest.raises(Exception, match="without a suggestion"):
+        linear.create_ticket(failed, *CONFIG)
+
+    assert "Suggestion failed" in tickets[0]["error"]
+    assert len(server.issues) == 1
+    # The re-run has the suggestion, and it is what reaches Linear.
+    ticket = linear.create_ticket(insight(1), *CONFIG)
+    assert "Add a worked example." in server.issues[ticket["ticket_id"]]["description"]
+
+
+def test_existing_issues_are_found_among_missing_ones(server):
+    first = linear.create_tickets([insight(1), insight(2)], *CONFIG)
+    events = [insight(1), insight(4, fail=True), insight(2)]
+
+    again = linear.create_tickets(events, *CONFIG)
+
+    assert again[0] == first[0] and again[2] == first[1]
+    assert "error" in again[1]
+    missing = linear.issue_id_for(linear.insight_hash(events[1]))
+    assert linear.find_tickets([missing, first[0]["ticket_id"]], "key") == [None, first[0]]
+    # An aliased `issue(id:)` lookup loses every result to one missing issue.
+    _, body = server.execute('query { a: issue(id: $a) { id } b: issue(id: $b) { id } }',
+                                  {"a": missing, "b": first[0]["ticket_id"]})
+    assert body["data"] is None
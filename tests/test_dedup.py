@@ -0,0 +1,54 @@
+from itertools import combinations
+
+from dedup_corpus import build_corpus
+from shared.dedup import collapse_near_duplicates, near_duplicate_groups, normalize_for_dedup
+
+
+def format_conversation(conv):
+    return conv['main_message'] + "\n" + "\n".join(conv['thread_messages'])
+
+
+def pairs(groups):
+    return {pair for group in groups for pair in combinations(sorted(group), 2)}
+
+
+def test_precision_and_recall_on_fixed_corpus():
+    conversations, truth = build_corpus(num_originals=300, duplicate_rate=0.4, seed=3)
+    found = near_duplicate_groups([format_conversation(conv) for conv in conversations], threshold=0.8)
+
+    expected, predicted = pairs(truth), pairs(found)
+    true_positives = len(expected & predicted)
+    assert true_positives / len(predicted) >= 0.99
+    assert true_positives / len(expected) >= 0.9
+
+
+def test_lower_threshold_raises_recall():
+    conversations, truth = build_corpus(num_originals=300, duplicate_rate=0.4, seed=3)
+    texts = [format_conversation(conv) for conv in conversations]
+    expected = pairs(truth)
+    recall = {threshold: len(expected & pairs(near_duplicate_groups(texts, threshold))) / len(expected)
+              for threshold in (0.7, 0.8)}
+    assert recall[0.7] >= recall[0.8]
+    assert recall[0.7] >= 0.98
+
+
+def test_collapse_keeps_longest_and_merges_quotes():
+    base = "How do I set the timeout on the python sdk client? It keeps failing after 30 seconds with an error."
+    conversations = [
+        {"main_message": base, "thread_messages": [], "quotes": ["a"]},
+        {"main_message": "Unrelated question about billing invoices and tax ids for my team.",
+         "thread_messages": [], "quotes": ["b"]},
+        {"main_message": base + " bump", "thread_messages": ["any update?"], "quotes": ["c", "a"]},
+    ]
+    kept, report = collapse_near_duplicates(conversations, format_conversation, threshold=0.7)
+
+    assert report["removed"] == 1
+    assert [conv["quotes"] for conv in kept] == [["a", "c"], ["b"]]
+    assert kept[0]["duplicates"] == 1
+    assert kept[0]["main_message"].endswith("bump")
+    assert report["estimated_tokens_saved"] > 0
+
+
+def test_normalization_masks_volatile_parts():
+    assert normalize_for_dedup("Error 0xdeadbeef at https://x.io/a?b=1 on 2024-01-02") == \
+        normalize_for_dedup("error 0xCAFEBABE at https://y.io/z on 2025-12-31")
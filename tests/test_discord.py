@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import requests
+
+from shared.discord import DiscordIngestor, snowflake_at, snowflake_time
+from test_http_client import response
+
+T0 = datetime(2026, 10, 10, tzinfo=timezone.utc)
+CURSOR = snowflake_at(T0)
+WATERMARK = snowflake_at(T0 - timedelta(hours=1))
+PARENT = snowflake_at(T0 - timedelta(days=1))
+QUIET_PARENT = snowflake_at(T0 - timedelta(days=2))
+
+
+class RoutedClient:
+    """
+    Stands in for `RateLimitedClient`, answering each path from `routes`.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.session = requests.Session()
+        self.paths = []
+
+    def get(self, url, params=None):
+        path = urlparse(url).path.split("/api/v10", 1)[-1]
+        self.paths.append(path)
+        answer = self.routes.get(path)
+        if answer is None:
+            return response(404, {"message": "Unknown"})
+        return answer if isinstance(answer, requests.Response) else response(200, answer)
+
+
+def routes(**overrides):
+    table = {
+        "/channels/900": {"id": "900", "name": "help", "guild_id": "g1"},
+        "/channels/900/messages": [],
+        "/guilds/g1/threads/active": {"threads": [
+            {"id": PARENT, "parent_id": "900", "name": "Auth", "last_message_id": snowflake_at(T0 + timedelta(hours=1))},
+            {"id": QUIET_PARENT, "parent_id": "900", "name": "Old", "last_message_id": snowflake_at(T0 - timedelta(hours=3))},
+            {"id": PARENT, "parent_id": "901", "name": "Elsewhere", "last_message_id": snowflake_at(T0 + timedelta(hours=2))},
+        ]},
+        "/channels/900/threads/archived/public": {"threads": [], "has_more": False},
+        f"/channels/900/messages/{PARENT}": {"id": PARENT, "content": "How do I sign requests?",
+                                             "author": {"username": "ann"}},
+        f"/channels/{PARENT}/messages": [
+            {"id": snowflake_at(T0 + timedelta(hours=1)), "content": "Still getting a 401", "author": {"username": "bo"}},
+            {"id": snowflake_at(T0 - timedelta(hours=2)), "content": "Already read", "author": {"username": "cy"}},
+        ],
+    }
+    table.update(overrides)
+    return table
+
+
+def ingest(client):
+    ingestor = DiscordIngestor("token", client=client)
+    watermarks = {"900": {"message_id": WATERMARK, "timestamp": "2026-10-09T23:00:00Z", "thread_cursor": CURSOR}}
+    return ingestor, ingestor.ingest(["900"], T0 - timedelta(days=7), watermarks)
+
+
+def test_replies_in_threads_of_earlier_messages_are_fetched():
+    ingestor, conversations = ingest(RoutedClient(routes()))
+
+    assert len(conversations) == 1
+    conversation = conversations[0]
+    assert conversation["message_id"] == PARENT
+    assert conversation["main_message"] == "How do I sign requests?"
+    assert conversation["thread_messages"] == ["Still getting a 401"]
+    assert conversation["quotes"] == ["'Still getting a 401' - (from bo)"]
+    assert ingestor.stats["revisited_threads"] == 1
+
+    mark = ingestor.high_water["900"]
+    assert mark["message_id"] == WATERMARK
+    assert snowflake_time(mark["thread_cursor"]) > T0
+
+
+def test_thread_listing_failure_keeps_the_thread_cursor():
+    failing = routes(**{"/channels/900/threads/archived/public": response(403, {"message": "Missing Access"})})
+    ingestor, conversations = ingest(RoutedClient(failing))
+
+    assert conversations == []
+    assert ingestor.stats["thread_errors"] == 1
+    assert ingestor.high_water["900"] == {"message_id": WATERMARK, "timestamp": "2026-10-09T23:00:00Z",
+                                          "thread_cursor": CURSOR}
+
+
+def test_first_run_does_not_list_threads():
+    client = RoutedClient(routes())
+    ingestor = DiscordIngestor("token", client=client)
+
+    assert ingestor.ingest(["900"], T0 - timedelta(days=7)) == []
+    assert not any("threads" in path for path in client.paths)
+    assert "900" not in ingestor.high_water
+
+
+def test_failed_thread_of_a_new_message_holds_the_thread_cursor():
+    new = snowflake_at(T0 - timedelta(minutes=30))
+    message = {"id": new, "content": "Webhooks never fire", "author": {"username": "di"},
+               "timestamp": "2026-10-09T23:30:00Z", "thread": {"id": new}}
+    client = RoutedClient(routes(**{"/channels/900/messages": [message],
+                                    f"/channels/{new}/messages": response(500, {"message": "Oops"})}))
+    ingestor = DiscordIngestor("token", client=client)
+
+    conversations = ingestor.ingest(["900"], T0 - timedelta(days=7))
+
+    assert [c["message_id"] for c in conversations] == [new]
+    assert ingestor.stats["thread_errors"] == 1
+    # The next run revisits the thread: it started at or below the watermark, past the cursor.
+    mark = ingestor.high_water["900"]
+    assert int(mark["thread_cursor"]) < int(new) <= int(mark["message_id"])
@@ -0,0 +1,52 @@
+import logging
+
+import openai
+import pytest
+
+from fake_openai import FakeOpenAI
+from handlers import find_docs
+from shared.openai_client import OpenAIGateway
+from shared.vector_store import LocalVectorStore
+
+
+@pytest.fixture
+def fake_openai():
+    with FakeOpenAI() as fake:
+        yield fake
+
+
+def use_clients(monkeypatch, fake, store):
+    gateway = OpenAIGateway(openai.OpenAI(api_key="local", base_url=fake.url, max_retries=0))
+    monkeypatch.setattr(find_docs, "get_clients", lambda: (gateway, store))
+
+
+def test_empty_index_finds_nothing_instead_of_failing(monkeypatch, fake_openai, tmp_path, caplog):
+    store = LocalVectorStore(str(tmp_path / "index"))
+    use_clients(monkeypatch, fake_openai, store)
+
+    with caplog.at_level(logging.INFO):
+        documentation = find_docs.find_docs_many(["Users cannot set the timeout.", "Webhooks are not signed."])
+
+    assert documentation == [{}, {}]
+    assert "No relevant documentation found" in caplog.text
+
+
+def test_empty_index_still_times_each_query(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "index"))
+    timings = []
+    assert store.query_many([[1.0, 0.0], [0.0, 1.0]], top_k=3, timings=timings) == [[], []]
+    assert len(timings) == 2
+    assert store.query_many([], timings=timings) == []
+
+
+def test_local_index_returns_best_match(monkeypatch, fake_openai, tmp_path):
+    store = LocalVectorStore(str(tmp_path / "index"))
+    store.upsert([("a", [1.0, 0.0], {"url": "https://docs/a"}), ("b", [0.0, 1.0], {"url": "https://docs/b"})])
+
+    results = store.query_many([[0.9, 0.1]], top_k=2)
+    assert [match["id"] for match in results[0]] == ["a", "b"]
+
+
+def test_percentile_of_nothing_is_zero():
+    assert find_docs.percentile([], 95) == 0.0
+    assert find_docs.percentile([3, 1, 2], 50) == 2
@@ -0,0 +1,98 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from handlers import generate_suggestion
+from shared.llm_cache import DynamoDBResponseStore, MemoryResponseStore, ResponseCache
+
+
+class SlowGateway:
+    def __init__(self, delay=0.2, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def chat(self, messages, model, priority=None, channels=None):
+        with self._lock:
+            self.prompts.append(messages[0]["content"])
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("OpenAI is down")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Add an example."))])
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(generate_suggestion, "LEASE_POLL_SECONDS", 0.01)
+    return ResponseCache(MemoryResponseStore(), ttl_seconds=3600)
+
+
+def insight(quote):
+    return {"summary": "Users are confused about retries.", "quotes": [quote], "channel_name": "help",
+            "documentation": {"url": "https://docs/retries", "text": "Retries back off."}}
+
+
+def run_map(gateway, cache, insights, run_id):
+    """Runs one invocation per insight at once, like the Map state."""
+    results = [None] * len(insights)
+
+    def invoke(i):
+        results[i] = generate_suggestion.generate_suggestions(gateway, [insights[i]], cache, run_id=run_id)[0]
+
+    threads = [threading.Thread(target=invoke, args=(i,)) for i in range(len(insights))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_map_iterations_of_a_run_share_one_call(cache):
+    gateway = SlowGateway()
+
+    results = run_map(gateway, cache, [insight(f"retry question {i}") for i in range(4)], "run-1")
+
+    assert len(gateway.prompts) == 1
+    assert {r["llm_suggestion"] for r in results} == {"Add an example."}
+    assert sorted(r["deduplicated"] for r in results) == [False, True, True, True]
+
+
+def test_other_runs_do_not_share_the_call(cache):
+    gateway = SlowGateway(delay=0)
+
+    generate_suggestion.generate_suggestions(gateway, [insight("first")], cache, run_id="run-1")
+    generate_suggestion.generate_suggestions(gateway, [insight("second")], cache, run_id="run-2")
+    generate_suggestion.generate_suggestions(gateway, [insight("third")], cache)
+
+    assert len(gateway.prompts) == 3
+
+
+def test_failed_call_releases_the_lease(cache):
+    generate_suggestion.generate_suggestions(SlowGateway(delay=0, fail=True), [insight("first")], cache, run_id="run-1")
+    gateway = SlowGateway(delay=0)
+
+    result = generate_suggestion.generate_suggestions(gateway, [insight("second")], cache, run_id="run-1")[0]
+
+    assert len(gateway.prompts) == 1
+    assert result == {"llm_suggestion": "Add an example.", "cache_hit": False, "deduplicated": False}
+
+
+def test_dynamodb_lease_is_exclusive_until_released():
+    with mock_aws():
+        boto3.resource("dynamodb").create_table(
+            TableName="llm-cache", BillingMode="PAY_PER_REQUEST",
+            KeySchema=[{"AttributeName": "cache_key", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "cache_key", "AttributeType": "S"}])
+        store = DynamoDBResponseStore("llm-cache")
+
+        assert store.claim("k:lease", time.time() + 60)
+        assert not store.claim("k:lease", time.time() + 60)
+        store.delete("k:lease")
+        assert store.claim("k:lease", time.time() - 1)
+        # An expired lease can be taken over.
+        assert store.claim("k:lease", time.time() + 60)
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+import requests
+
+from shared import http_client
+from shared.http_client import RateLimitedClient
+
+
+def response(status, body=None, headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = json.dumps(body if body is not None else {}).encode()
+    resp.headers.update(headers or {})
+    return resp
+
+
+class ScriptedSession(requests.Session):
+    """
+    Answers each request with the next of `responses`.
+    """
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        item = self.responses.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Replaces the clock, so that sleeping advances it instantly, and records every sleep.
+    """
+    recorded = []
+    clock = [1000.0]
+
+    def sleep(seconds):
+        recorded.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(http_client.time, "sleep", sleep)
+    monkeypatch.setattr(http_client.time, "monotonic", lambda: clock[0])
+    return recorded
+
+
+def client(responses, **kwargs):
+    return RateLimitedClient(session=ScriptedSession(responses), **kwargs)
+
+
+def test_429_waits_retry_after_from_body(sleeps):
+    c = client([response(429, {"retry_after": 1.5}), response(200, {"ok": True})])
+    result = c.get("https://discord.test/api/channels/1/messages")
+
+    assert result.status_code == 200
+    assert c.stats["rate_limited"] == 1 and c.stats["retries"] == 1
+    assert len(sleeps) == 1 and 1.5 <= sleeps[0] <= 1.5 + 0.2
+
+
+def test_429_falls_back_to_retry_after_header(sleeps):
+    c = client([response(429, headers={"Retry-After": "3"}), response(200)])
+    assert c.get("https://linear.test/graphql").status_code == 200
+    assert 3.0 <= sleeps[0] <= 3.35
+
+
+def test_global_429_holds_requests_until_reset(sleeps):
+    c = client([response(429, {"retry_after": 2.0, "global": True}), response(200), response(200)])
+    c.get("https://discord.test/api/a")
+
+    # The retry waited on the client-wide hold, not on its route's bucket.
+    assert len(sleeps) == 1 and 2.0 <= sleeps[0] <= 2.3
+    assert c._global_reset_at > 0
+
+    c.get("https://discord.test/api/b")
+    assert len(sleeps) == 1
+
+
+def test_5xx_retries_with_capped_backoff_then_returns_last_response(sleeps):
+    c = client([response(503)] * 4, max_retries=3, backoff_base=0.5, backoff_cap=1.0)
+    result = c.get("https://linear.test/graphql")
+
+    assert result.status_code == 503
+    assert c.session.calls == 4 and c.stats["retries"] == 3
+    assert len(sleeps) <= 3 and all(0 <= seconds <= 1.0 for seconds in sleeps)
+
+
+def test_connection_errors_are_retried_then_raised(sleeps):
+    c = client([requests.exceptions.ConnectionError("reset")] * 3, max_retries=2)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        c.get("https://discord.test/api/x")
+    assert c.session.calls == 3
+
+
+def test_empty_bucket_waits_for_reset(sleeps):
+    c = client([response(200, headers={"X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "0",
+                                       "X-RateLimit-Reset-After": "0.5"}), response(200)])
+    c.get("https://discord.test/api/channels/1/messages")
+    c.get("https://discord.test/api/channels/1/messages")
+
+    assert sum(sleeps) == pytest.approx(0.5)
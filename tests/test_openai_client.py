@@ -0,0 +1,169 @@
+from types import SimpleNamespace
+
+import time
+
+import httpx
+import openai
+import pytest
+
+from shared.openai_client import EXTRACTION, SUGGESTION, OpenAIGateway, RateLimiter, parse_duration
+
+
+class RawResponse:
+    def __init__(self, prompt_tokens=10, completion_tokens=5, headers=None):
+        self.headers = headers or {}
+        self._parsed = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=prompt_tokens,
+                                                             completion_tokens=completion_tokens))
+
+    def parse(self):
+        return self._parsed
+
+
+def status_error(status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=httpx.Request("POST", "https://openai.test"))
+    return openai.APIStatusError("error", response=response, body=None) if status != 429 else \
+        openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class ScriptedClient:
+    """
+    Stands in for `openai.OpenAI`: each chat call takes the next outcome.
+    """
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create)))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        self.requests.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+MESSAGES = [{"role": "user", "content": "Summarize the feedback."}]
+
+
+def in_flight(limiter):
+    return limiter._in_flight_requests, limiter._in_flight_tokens
+
+
+def test_release_charges_only_usage_beyond_the_estimate():
+    limiter = RateLimiter(rpm=100, tpm=10_000)
+    limiter.acquire(1000, EXTRACTION)
+    assert in_flight(limiter) == (1, 1000)
+
+    limiter.release(1000, used=400)
+    assert in_flight(limiter) == (0, 0)
+    assert limiter.tokens.available == pytest.approx(9000, abs=5)
+
+    limiter.acquire(1000, EXTRACTION)
+    limiter.release(1000, used=1500)
+    assert limiter.tokens.available == pytest.approx(7500, abs=5)
+
+
+def test_headers_keep_in_flight_reservations_taken():
+    limiter = RateLimiter(rpm=100, tpm=10_000)
+    limiter.acquire(2000, EXTRACTION)
+    limiter.update({"x-ratelimit-limit-tokens": "10000", "x-ratelimit-remaining-tokens": "9000"})
+    assert limiter.tokens.available == pytest.approx(7000, abs=5)
+
+
+def test_low_priority_calls_leave_headroom():
+    limiter = RateLimiter(rpm=100, tpm=1000, low_priority_headroom=0.2)
+    limiter.tokens.take(700)
+    assert limiter.tokens.wait_time(200, 0.2, limiter.tokens.updated_at) > 0
+    assert limiter.tokens.wait_time(200, 0.0, limiter.tokens.updated_at) == 0
+
+
+def test_success_records_usage_and_settles_the_reservation():
+    client = ScriptedClient([RawResponse(prompt_tokens=30, completion_tokens=20)])
+    gateway = OpenAIGateway(client, rpm=100, tpm=100_000)
+
+    gateway.chat(MESSAGES, "gpt-4o", max_tokens=100)
+
+    assert in_flight(gateway.limiter("gpt-4o")) == (0, 0)
+    assert gateway.stats["used_tokens"] == 50
+
+
+@pytest.mark.parametrize("error", [ValueError("bad json"), openai.APITimeoutError(httpx.Request("POST", "https://x")),
+                                   KeyboardInterrupt()])
+def test_unexpected_errors_do_not_leak_the_reservation(error):
+    gateway = OpenAIGateway(ScriptedClient([error]), rpm=100, tpm=100_000, max_retries=0)
+
+    with pytest.raises(type(error)):
+        gateway.chat(MESSAGES, "gpt-4o", max_tokens=100)
+
+    assert in_flight(gateway.limiter("gpt-4o")) == (0, 0)
+
+
+def test_429_is_retried_after_retry_after():
+    client = ScriptedClient([status_error(429, {"retry-after-ms": "20"}), RawResponse()])
+    gateway = OpenAIGateway(client, max_retries=2)
+
+    gateway.chat(MESSAGES, "gpt-4o", priority=SUGGESTION)
+
+    assert client.calls == 2
+    assert gateway.stats["rate_limited"] == 1 and gateway.stats["retries"] == 1
+    assert gateway.limiter("gpt-4o")._paused_until > 0
+    assert in_flight(gateway.limiter("gpt-4o")) == (0, 0)
+
+
+def test_permanent_errors_are_not_retried():
+    client = ScriptedClient([status_error(400)])
+    gateway = OpenAIGateway(client, max_retries=5)
+
+    with pytest.raises(openai.APIStatusError):
+        gateway.chat(MESSAGES, "gpt-4o")
+    assert client.calls == 1 and gateway.stats["failed"] == 1
+
+
+def test_retries_stop_at_max_retries(monkeypatch):
+    monkeypatch.setattr("shared.openai_client.time.sleep", lambda seconds: None)
+    client = ScriptedClient([status_error(503)] * 3)
+    gateway = OpenAIGateway(client, max_retries=2)
+
+    with pytest.raises(openai.APIStatusError):
+        gateway.chat(MESSAGES, "gpt-4o")
+    assert client.calls == 3 and gateway.stats["retries"] == 2
+
+
+def test_deadline_cuts_the_attempt_timeout_and_stops_retries():
+    client = ScriptedClient([status_error(503, {"retry-after": "5"}), RawResponse()])
+    gateway = OpenAIGateway(client, max_retries=6)
+
+    with pytest.raises(openai.APIStatusError):
+        gateway.chat(MESSAGES, "gpt-4o", timeout=120, deadline=time.monotonic() + 3)
+    assert client.calls == 1 and gateway.stats["failed"] == 1
+    assert client.requests[0]["timeout"] <= 3
+    assert in_flight(gateway.limiter("gpt-4o")) == (0, 0)
+
+
+def test_passed_deadline_sends_nothing():
+    client = ScriptedClient([RawResponse()])
+    gateway = OpenAIGateway(client)
+
+    with pytest.raises(TimeoutError):
+        gateway.chat(MESSAGES, "gpt-4o", deadline=time.monotonic() - 1)
+    assert client.calls == 0
+    assert in_flight(gateway.limiter("gpt-4o")) == (0, 0)
+
+
+def test_retry_delay_prefers_retry_after_then_the_nearest_reset():
+    gateway = OpenAIGateway(None, backoff_base=1.0, backoff_cap=10.0)
+    assert gateway._retry_after({"retry-after-ms": "250"}, 0) == pytest.approx(0.25)
+    assert gateway._retry_after({"retry-after": "2"}, 0) == 2.0
+    assert gateway._retry_after({"x-ratelimit-reset-requests": "6m0s", "x-ratelimit-reset-tokens": "1.5s"}, 0) == 1.5
+    assert gateway._retry_after({"x-ratelimit-reset-requests": "6m0s"}, 0) == 10.0
+    assert 0 <= gateway._retry_after({}, 3) <= 8.0
+
+
+def test_parse_duration():
+    assert parse_duration("6m0s") == 360.0
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1.5") == 1.5
+    assert parse_duration(None) is None
@@ -0,0 +1,78 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from shared import payloads
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    with mock_aws():
+        monkeypatch.setattr(payloads, "_s3", None)
+        monkeypatch.setenv("PAYLOAD_BUCKET", "payloads")
+        monkeypatch.setenv("PAYLOAD_INLINE_LIMIT", "1000")
+        boto3.client("s3").create_bucket(Bucket="payloads")
+        yield "payloads"
+        monkeypatch.setattr(payloads, "_s3", None)
+
+
+def records(count, start=0):
+    return [{"id": i, "text": "x" * 80} for i in range(start, start + count)]
+
+
+def test_spilled_generator_is_encoded_once_and_streams_back(bucket, monkeypatch):
+    encodings = []
+    encode = payloads._encode
+    monkeypatch.setattr(payloads, "_encode", lambda record: encodings.append(record) or encode(record))
+
+    result = payloads.spill("clusters", (record for record in records(50)))
+
+    assert result["clusters_ref"]["count"] == 50
+    assert len(encodings) == 50
+    assert list(payloads.iter_records(result, "clusters")) == records(50)
+
+
+def test_spills_of_one_result_share_the_budget(bucket):
+    budget = payloads.InlineBudget()
+
+    first = payloads.spill("matched", records(6), budget=budget)
+    second = payloads.spill("clusters", records(6, start=6), budget=budget)
+
+    assert first["matched"] == records(6)
+    assert "clusters_ref" in second
+    # Each one alone would have stayed inline.
+    assert "clusters" in payloads.spill("clusters", records(6, start=6))
+
+
+def test_budget_leaves_room_for_the_rest_of_the_state(bucket):
+    state = {"conversations": records(2)}
+
+    assert payloads.InlineBudget(state=state).remaining == 1000
+    state = {"conversations": records(2600)}
+    budget = payloads.InlineBudget(state=state)
+
+    assert budget.remaining < 0
+    assert "clusters_ref" in payloads.spill("clusters", records(1), budget=budget)
+
+
+def test_spilled_items_keep_stubs_and_resolve(bucket):
+    items = [{**record, "summary": f"issue {record['id']}"} for record in records(20)]
+
+    result = payloads.spill_items("clusters", iter(items))
+
+    assert [stub["summary"] for stub in result["clusters"]] == [item["summary"] for item in items]
+    assert payloads.resolve_item({**result["clusters"][3], "documentation": "d"}) == {**items[3], "documentation": "d"}
+    assert list(payloads.iter_records(result, "clusters")) == items
+
+
+def test_detached_field_travels_as_a_ref_and_attaches_back(bucket, monkeypatch):
+    clusters = [{"summary": f"issue {i}", "centroid": "A" * 8000} for i in range(3)] + [{"summary": "no centroid"}]
+
+    detached = payloads.detach_field("clusters", clusters, "centroid")
+
+    assert all("centroid" not in cluster for cluster in detached)
+    assert len(payloads._encode(detached)) < 1000
+    assert payloads.attach_field(detached, "centroid") == clusters
+    assert payloads.attach_field(detached[1:2], "centroid") == clusters[1:2]
+    monkeypatch.delenv("PAYLOAD_BUCKET")
+    assert payloads.detach_field("clusters", clusters, "centroid") is clusters
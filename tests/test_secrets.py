@@ -0,0 +1,76 @@
+import pytest
+
+from shared import utils
+from shared.http_client import RateLimitedClient
+from shared.openai_client import OpenAIGateway
+from shared.utils import SecretsProvider
+from test_http_client import ScriptedSession, response
+from test_openai_client import MESSAGES, ScriptedClient, status_error
+
+
+class RotatingBackend:
+    name = "stub"
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.fetches = 0
+
+    def fetch(self, secret_id):
+        self.fetches += 1
+        return self.values[min(self.fetches, len(self.values)) - 1]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(utils.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_missing_key_is_refetched_at_most_once_per_interval(clock):
+    backend = RotatingBackend({"A": "1"}, {"A": "1", "B": "2"})
+    provider = SecretsProvider(secret_id="s", backend=backend, ttl=300)
+
+    assert provider.get("A") == "1"
+    assert provider.get("B") == "2"
+    assert provider.get("C") is None
+    assert backend.fetches == 2
+
+    clock[0] += utils.MISSING_KEY_REFETCH_SECONDS
+    provider.get("C")
+    assert backend.fetches == 3
+
+
+def test_invalidate_refetches_rotated_key_but_not_a_fresh_one(clock):
+    backend = RotatingBackend({"KEY": "old"}, {"KEY": "new"})
+    provider = SecretsProvider(secret_id="s", backend=backend, ttl=300)
+    assert provider.get("KEY") == "old"
+
+    # Just fetched: a rejected call does not trigger another fetch.
+    assert provider.invalidate() is False
+    assert provider.get("KEY") == "old"
+
+    clock[0] += utils.MISSING_KEY_REFETCH_SECONDS
+    assert provider.invalidate() is True
+    assert provider.get("KEY") == "new"
+    assert backend.fetches == 2
+
+
+def test_http_client_reports_401s(monkeypatch):
+    monkeypatch.setattr("shared.http_client.time.sleep", lambda seconds: None)
+    rejected = []
+    client = RateLimitedClient(session=ScriptedSession([response(401), response(200)]),
+                               on_unauthorized=lambda: rejected.append(True))
+
+    assert client.get("https://linear.test/graphql").status_code == 401
+    assert client.get("https://linear.test/graphql").status_code == 200
+    assert rejected == [True]
+
+
+def test_gateway_reports_a_rejected_key():
+    rejected = []
+    gateway = OpenAIGateway(ScriptedClient([status_error(401)]), on_unauthorized=lambda: rejected.append(True))
+
+    with pytest.raises(Exception):
+        gateway.chat(MESSAGES, "gpt-4o")
+    assert rejected == [True]
@@ -0,0 +1,76 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from handlers import store_in_dynamodb
+
+
+@pytest.fixture
+def table():
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb")
+        dynamodb.create_table(TableName="tickets", BillingMode="PAY_PER_REQUEST",
+                              KeySchema=[{"AttributeName": "ticket_id", "KeyType": "HASH"}],
+                              AttributeDefinitions=[{"AttributeName": "ticket_id", "AttributeType": "S"}])
+        yield dynamodb.Table("tickets")
+
+
+class CallCounter:
+    def __init__(self):
+        self.calls = {}
+
+    def __call__(self, model, **kwargs):
+        self.calls[model.name] = self.calls.get(model.name, 0) + 1
+
+
+def cluster(i, summary="Users are confused about retries."):
+    return {"summary": f"{summary} ({i})", "cluster_size": 3, "documentation": {"url": "https://docs/x", "score": 0.5},
+            "suggestion": {"llm_suggestion": "Add an example."},
+            "ticket": {"ticket_id": f"t-{i}", "ticket_identifier": f"DOC-{i}", "ticket_url": f"https://l/DOC-{i}"}}
+
+
+def test_new_tickets_are_written_with_one_update_each(table):
+    counter = CallCounter()
+    table.meta.client.meta.events.register("before-call", counter)
+    items = [store_in_dynamodb.build_item(cluster(i)) for i in range(60)]
+
+    created, updated = store_in_dynamodb.store_items(items, table)
+
+    assert (created, updated) == (60, 0)
+    assert table.scan(Select="COUNT")["Count"] == 60
+    assert counter.calls.get("UpdateItem", 0) == 60
+    assert counter.calls.get("PutItem", 0) == counter.calls.get("BatchWriteItem", 0) == 0
+    assert table.get_item(Key={"ticket_id": "t-7"})["Item"]["status"] == "Triage"
+
+
+def test_webhook_status_written_before_the_ticket_is_kept(table):
+    # The webhook can land between ticket creation and the store step, leaving a status-only item.
+    table.put_item(Item={"ticket_id": "t-0", "status": "In Progress", "status_updated_at": "2026-01-01T00:00:00"})
+
+    created, updated = store_in_dynamodb.store_items([store_in_dynamodb.build_item(cluster(0))], table)
+
+    assert (created, updated) == (1, 0)
+    item = table.get_item(Key={"ticket_id": "t-0"})["Item"]
+    assert item["status"] == "In Progress"
+    assert item["ticket_identifier"] == "DOC-0"
+
+
+def test_restore_keeps_status_and_refreshes_fields(table):
+    store_in_dynamodb.store_items([store_in_dynamodb.build_item(cluster(i)) for i in range(3)], table)
+    # The webhook moved a ticket on before the step was retried.
+    table.update_item(Key={"ticket_id": "t-1"}, UpdateExpression="SET #s = :s",
+                      ExpressionAttributeNames={"#s": "status"}, ExpressionAttributeValues={":s": "In Progress"})
+
+    retried = [store_in_dynamodb.build_item(cluster(i, "Users still ask about retries.")) for i in range(4)]
+    created, updated = store_in_dynamodb.store_items(retried, table)
+
+    assert (created, updated) == (1, 3)
+    item = table.get_item(Key={"ticket_id": "t-1"})["Item"]
+    assert item["status"] == "In Progress"
+    assert item["insight_summary"] == "Users still ask about retries. (1)"
+    assert table.get_item(Key={"ticket_id": "t-3"})["Item"]["status"] == "Triage"
+
+
+def test_floats_become_decimals_and_none_is_dropped():
+    item = store_in_dynamodb.to_dynamodb({"a": 0.25, "b": None, "c": [{"d": 1.5, "e": None}]})
+    assert str(item["a"]) == "0.25" and "b" not in item and item["c"] == [{"d": store_in_dynamodb.Decimal("1.5")}]
@@ -0,0 +1,78 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from shared.watermarks import DynamoDBWatermarkStore, FileWatermarkStore
+
+
+@pytest.fixture(params=["dynamodb", "file"])
+def store(request, tmp_path):
+    if request.param == "file":
+        yield FileWatermarkStore(str(tmp_path / "state.json"))
+        return
+    with mock_aws():
+        boto3.resource("dynamodb").create_table(
+            TableName="ingestion-state", BillingMode="PAY_PER_REQUEST",
+            KeySchema=[{"AttributeName": "channel_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "channel_id", "AttributeType": "S"}])
+        yield DynamoDBWatermarkStore("ingestion-state")
+
+
+def mark(message_id, thread_cursor):
+    return {"message_id": message_id, "timestamp": "2026-10-01T00:00:00Z", "thread_cursor": thread_cursor}
+
+
+def test_staged_watermark_is_invisible_until_promoted(store):
+    store.stage("900", "run-1", mark("105", "5000"))
+    assert store.get("900") is None
+
+    assert store.promote("900", "run-1") is True
+    assert store.get("900") == mark("105", "5000")
+    # Promoting again finds nothing staged.
+    assert store.promote("900", "run-1") is False
+
+
+def test_withdrawn_channel_keeps_its_previous_watermark(store):
+    store.put("900", "100", "2026-09-24T00:00:00Z", "4000")
+    store.stage("900", "run-1", mark("105", "5000"))
+
+    store.withdraw("900", "run-1")
+
+    assert store.promote("900", "run-1") is False
+    assert store.get("900")["message_id"] == "100"
+
+
+def test_only_the_run_that_staged_can_promote(store):
+    store.stage("900", "run-1", mark("105", "5000"))
+    store.stage("900", "run-2", mark("107", "6000"))
+
+    assert store.promote("900", "run-1") is False
+    assert store.promote("900", "run-2") is True
+    assert store.get("900")["message_id"] == "107"
+
+
+def test_older_run_never_moves_the_watermark_back(store):
+    store.put("900", "107", "2026-10-01T00:00:00Z", "6000")
+    store.stage("900", "run-1", mark("105", "5000"))
+
+    assert store.promote("900", "run-1") is False
+    assert store.get("900") == mark("107", "6000")
+
+
+def test_thread_cursor_moves_without_new_messages(store):
+    store.put("900", "105", "2026-10-01T00:00:00Z", "5000")
+    store.stage("900", "run-2", mark("105", "6000"))
+
+    assert store.promote("900", "run-2") is True
+    assert store.get("900")["thread_cursor"] == "6000"
+
+
+def test_put_reports_whether_it_wrote(store):
+    assert store.put("900", "105", "2026-10-01T00:00:00Z", "5000") is True
+    assert store.put("900", "104", "2026-10-01T00:00:00Z", "6000") is False
+
+    store.stage("900", "run-1", mark("107", "6000"))
+    assert store.put("900", "107", "2026-10-01T00:00:00Z", "6000", stage="run-2") is False
+    assert store.put("900", "107", "2026-10-01T00:00:00Z", "6000", stage="run-1") is True
+    assert store.get("900") == mark("107", "6000")
+    assert store.promote("900", "run-1") is False